@@ -6,7 +6,10 @@ from flask import (
     jsonify,
     abort,
     current_app,
-    send_from_directory,
+    has_app_context,
+    send_file,
+    session,
+    Response,
 )
 import sqlite3
 from flask_login import (
@@ -15,13 +18,102 @@ from flask_login import (
     login_required,
     login_user,
     logout_user,
+    current_user,
 )
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import cProfile
+import gzip
+import hmac
+import json
+import logging
+import math
+import mimetypes
+import re
+import unicodedata
+import zlib
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import click
+from flask.cli import AppGroup
+from db_pool import ConnectionPool, GroupCommitWriter, PoolTimeout, WriterBusy
+from recipe_cache import FileGeneration, LocalGeneration, LRUCache, RecipeCache
+from password_hasher import HasherBusy, PasswordHasher
+from photo_store import PhotoStore, PhotoTooLarge, SavedPhoto, UnsupportedPhoto
+from metrics import InstrumentedConnection, QueryObserver, Registry
+from rate_limit import MemoryStore, RateLimiter, SQLiteStore
+from recipe_revisions import apply_delta, decode_revision, encode_revision, make_delta
+from static_assets import StaticAssets
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timezone, timedelta
 
+try:
+    import brotli
+except ImportError:  # brotli は任意依存。未インストール時は gzip のみで応答する
+    brotli = None
+
 DATABASE = "recipe_memo.db"
+RECIPE_FIELDS = ("id", "title", "ingredients", "steps", "notes", "tags", "photo")
+# タグは recipe_tag から名前順のJSON配列として読み出す（RETURNING 句でも使える相関サブクエリ）
+RECIPE_TAGS_SQL = """(
+    select json_group_array(name) from (
+        select t.name from recipe_tag rt join tag t on t.id = rt.tag_id
+        where rt.recipe_id = recipe.id order by t.name
+    )
+) as tags"""
+RECIPE_COLUMNS = (
+    "id, title, ingredients, steps, notes, version, updated_at, owner, household, photo,"
+    f" {RECIPE_TAGS_SQL}"
+)
+# 書き込みの最後に _bump_recipe_changes で採番される値。同じトランザクション内の変更行にはこの値を付ける
+PENDING_CHANGE_SEQ = "(select seq + 1 from table_change where name = 'recipe')"
+RECIPE_PAGE_DEFAULT = 50
+RECIPE_PAGE_MAX = 200
+RECIPE_STREAM_FETCH_SIZE = 200
+INGREDIENT_SEPARATORS = re.compile(r"[/／,，、・;；\n]+")
+INGREDIENT_PAREN = re.compile(r"[（(][^）)]*[）)]")
+# 分量の書き始め(数字・大さじ等)以降を取り除く
+INGREDIENT_QUANTITY = re.compile(r"\s*(?:大さじ|小さじ|カップ|少々|適量|適宜|ひとつまみ|少量|お好みで|\d).*$")
+INGREDIENT_QUERY_MAX = 20
+TAG_MAX_LENGTH = 40
+TAGS_PER_RECIPE_MAX = 20
+TAG_FILTER_MAX = 10
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CONTENT_ENCODING_SUFFIX = {"br": "br", "gzip": "gz"}
+BULK_CHUNK_SIZE = 500
+# 一括取り込みの本文の上限。行ごとに読み進めるためメモリには載らない
+BULK_MAX_BYTES = 1024 * 1024 * 1024
+BULK_ERROR_REPORT_LIMIT = 100
+REVISION_FIELDS = ("title", "ingredients", "steps", "notes", "tags")
+# 差分を何版まで続けたら全文スナップショットを挟むか（復元時に適用する差分数の上限）
+REVISION_SNAPSHOT_INTERVAL = 10
+BATCH_OPERATIONS = ("create", "update", "delete", "get")
+BATCH_MAX_OPERATIONS = 100
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 100
+SEARCH_SNIPPET_TOKENS = 16
+# trigram トークナイザは3文字未満の語をMATCHできないため、短い語は recipe_gram（タイトル・材料の1・2文字の転置インデックス）で引く
+FTS_MIN_TERM_LENGTH = 3
 CLIENT_BUILD_DIR = os.path.join(os.path.dirname(__file__), "client", "dist")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_MAX_AGE = 24 * 60 * 60
+PHOTO_DIR = os.path.join(os.path.dirname(__file__), "media")
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+# multipart の写真付き作成・更新で、写真以外（recipe フィールドのJSON・境界行）に許す分
+PHOTO_FORM_HEADROOM = 1024 * 1024
+PHOTO_URL_PREFIX = "/media/photos/"
+THUMBNAIL_URL_PREFIX = "/media/thumbs/"
+
+# セッションに載せる認証情報の形式。形式を変えたら上げ、旧形式のセッションはDBから読み直させる
+SESSION_AUTH_VERSION = 1
+AUTH_EPOCH_TTL = 30.0
+# 世帯導入前のユーザ・レシピはすべてこの世帯に属する（招待で世帯を指定しない新規ユーザは userid を世帯とする）
+DEFAULT_HOUSEHOLD = "default"
 
 JST = timezone(timedelta(hours=9))
 
@@ -35,21 +127,219 @@ app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(32)
 app.config.update(
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE="Lax",
+    # 本文の上限。超える要求は multipart を一時ファイルへ書き出す前に 413 で断る（一括取り込みは BULK_MAX_BYTES）
+    MAX_CONTENT_LENGTH=PHOTO_MAX_BYTES + PHOTO_FORM_HEADROOM,
 )
 
 if os.environ.get("FLASK_ENV") == "production":
     app.config.update(SESSION_COOKIE_SECURE=True)
+# リバースプロキシ（PythonAnywhere・Render等）の段数。0以外なら X-Forwarded-For/Proto を右からその段数まで信頼し、
+# request.remote_addr（ログイン制限のキー）を実クライアントのIPにする。直接公開している場合に設定すると偽装できてしまう
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
 login_manager = LoginManager()
 login_manager.init_app(app)
 
 class User(UserMixin):
-    def __init__(self, userid):
+    def __init__(self, userid, role="member", household=DEFAULT_HOUSEHOLD):
         self.id = userid
+        self.role = role
+        self.household = household
         
+def _require_admin():
+    if current_user.role != "admin":
+        abort(403, description="admin role required")
+
+### 計測
+metrics_registry = Registry()
+REQUEST_LATENCY = metrics_registry.histogram(
+    "http_request_duration_seconds", "Request latency by route, method and status."
+)
+REQUEST_QUERIES = metrics_registry.histogram(
+    "http_request_sql_queries", "SQL statements executed per request.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+PASSWORD_HASH_LATENCY = metrics_registry.histogram(
+    "password_hash_duration_seconds", "Time spent hashing or verifying passwords."
+)
+PASSWORD_HASH_REJECTED = metrics_registry.counter(
+    "password_hash_rejected_total", "Hash requests rejected because the pool was saturated."
+)
+LOGIN_RATE_LIMITED = metrics_registry.counter(
+    "login_rate_limited_total", "Login attempts rejected by the rate limiter before any lookup."
+)
+SCHEMA_MIGRATION_SECONDS = metrics_registry.gauge(
+    "schema_migration_seconds", "Time spent checking/applying schema migrations at first use."
+)
+WRITE_BATCH_SIZE = metrics_registry.histogram(
+    "sqlite_write_batch_size", "Writes committed together by the writer thread.",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+WRITE_COMMIT_LATENCY = metrics_registry.histogram(
+    "sqlite_write_batch_duration_seconds", "Time from BEGIN to COMMIT of one group commit."
+)
+
+
+def _count_request_query(seconds: float) -> None:
+    if has_app_context():
+        g.sql_queries = g.get("sql_queries", 0) + 1
+        g.sql_seconds = g.get("sql_seconds", 0.0) + seconds
+
+
+InstrumentedConnection.observer = QueryObserver(
+    metrics_registry, logger=app.logger, on_query=_count_request_query
+)
+
+
+def _collect_cache_metrics() -> None:
+    gauges = {
+        name: metrics_registry.gauge(f"recipe_cache_{name}", f"Recipe cache {name} (per process).")
+        for name in ("size", "hits", "misses", "evictions")
+    }
+    for db_path, cache in list(_recipe_caches.items()):
+        for cache_name, stats in cache.stats().items():
+            for name, gauge in gauges.items():
+                gauge.set(stats[name], cache=cache_name, db=os.path.basename(db_path))
+
+
+metrics_registry.add_collector(_collect_cache_metrics)
+
+
+def _profiling_requested() -> bool:
+    # 明示的に有効にした環境で、管理者がヘッダを付けたリクエストだけを計測する（ファイルを書くため）
+    if not current_app.config.get("PROFILE_REQUESTS", False) or request.headers.get("X-Profile") != "1":
+        return False
+    return current_user.is_authenticated and current_user.role == "admin"
+
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    if _profiling_requested():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        # サーバ上のパスは返さず、ファイル名だけをログに残す
+        current_app.logger.info("profile saved: %s", _dump_profile(profiler))
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    queries = g.get("sql_queries", 0)
+    REQUEST_LATENCY.observe(
+        elapsed, route=route, method=request.method, status=str(response.status_code)
+    )
+    REQUEST_QUERIES.observe(queries, route=route)
+    response.headers["Server-Timing"] = (
+        f'db;dur={g.get("sql_seconds", 0.0) * 1000:.2f};desc="{queries} queries", '
+        f"total;dur={elapsed * 1000:.2f}"
+    )
+    return response
+
+
+def _dump_profile(profiler) -> str:
+    profile_dir = current_app.config.get(
+        "PROFILE_DIR", os.path.join(current_app.instance_path, "profiles")
+    )
+    os.makedirs(profile_dir, exist_ok=True)
+    route = (request.url_rule.rule if request.url_rule is not None else request.path)
+    slug = "".join(ch if ch.isalnum() else "_" for ch in route).strip("_") or "root"
+    filename = f"{datetime.now(JST):%Y%m%d-%H%M%S}-{request.method}-{slug}-{uuid.uuid4().hex[:8]}.prof"
+    profiler.dump_stats(os.path.join(profile_dir, filename))
+    # 古いものから消し、PROFILE_MAX_FILES 件を超えて溜めない（ファイル名は日時で始まる）
+    saved = sorted(name for name in os.listdir(profile_dir) if name.endswith(".prof"))
+    for old in saved[:-current_app.config.get("PROFILE_MAX_FILES", 50)]:
+        try:
+            os.remove(os.path.join(profile_dir, old))
+        except FileNotFoundError:
+            pass
+    return filename
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # 管理者のセッション、または METRICS_TOKEN を設定した場合は Bearer トークン（スクレイパ用）で参照できる
+    token = current_app.config.get("METRICS_TOKEN")
+    authorization = request.headers.get("Authorization", "")
+    if not (token and hmac.compare_digest(authorization, f"Bearer {token}")):
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        _require_admin()
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 ### ログイン
+_auth_epochs: dict[str, LRUCache] = {}
+
+
+def _get_auth_epochs() -> LRUCache:
+    db_path = current_app.config.get("DATABASE", DATABASE)
+    cache = _auth_epochs.get(db_path)
+    if cache is None:
+        with _pools_lock:
+            cache = _auth_epochs.setdefault(
+                db_path, LRUCache(current_app.config.get("AUTH_EPOCH_CACHE_SIZE", 10000))
+            )
+    return cache
+
+
+def _current_auth_epoch(userid: str) -> int | None:
+    # TTLの間はプロセス内の値で判定し、リクエストごとに user テーブルを引かない。
+    # 削除済みのユーザは None（どのセッションとも一致しない）
+    cache = _get_auth_epochs()
+    now = time.monotonic()
+    entry = cache.get(userid)
+    if entry is not None and now - entry[1] < current_app.config.get("AUTH_EPOCH_TTL", AUTH_EPOCH_TTL):
+        return entry[0]
+    row = get_db().execute("select auth_epoch from user where userid = ?", [userid]).fetchone()
+    epoch = None if row is None else row["auth_epoch"]
+    cache.set(userid, (epoch, now))
+    return epoch
+
+
+def _store_session_auth(userid: str, row) -> User:
+    # 署名付きセッションCookieにロール・世帯・認証エポックを載せる
+    session["auth"] = {
+        "v": SESSION_AUTH_VERSION,
+        "userid": userid,
+        "role": row["role"],
+        "household": row["household"],
+        "epoch": row["auth_epoch"],
+    }
+    _get_auth_epochs().set(userid, (row["auth_epoch"], time.monotonic()))
+    return User(userid, row["role"], row["household"])
+
+
 @login_manager.user_loader
 def load_user(userid):
-    return User(userid)
+    auth = session.get("auth")
+    if not isinstance(auth, dict) or auth.get("v") != SESSION_AUTH_VERSION or auth.get("userid") != userid:
+        # 旧形式のセッションだけはDBから読み直して載せ替える
+        row = get_db().execute(
+            "select role, household, auth_epoch from user where userid = ?", [userid]
+        ).fetchone()
+        if row is None:
+            session.clear()
+            return None
+        return _store_session_auth(userid, row)
+    if auth["epoch"] != _current_auth_epoch(userid):
+        # ロール変更等でエポックが進んだセッションは破棄し、再ログインさせる
+        session.clear()
+        return None
+    return User(userid, auth["role"], auth["household"])
+
+
+def _logout() -> None:
+    logout_user()
+    session.pop("auth", None)
 
 @login_manager.unauthorized_handler
 def unauthorized():
@@ -59,17 +349,51 @@ def unauthorized():
 
 @app.route("/logout", methods = ['GET'])
 def logout():
-    logout_user()
+    _logout()
     return redirect('/login')
 
+def _get_static_assets() -> StaticAssets:
+    root = current_app.config.get("CLIENT_BUILD_DIR", CLIENT_BUILD_DIR)
+    assets = current_app.extensions.get("static_assets")
+    if assets is None or assets.root != root:
+        assets = StaticAssets(root, current_app.config.get("STATIC_RESCAN_INTERVAL", 2.0))
+        current_app.extensions["static_assets"] = assets
+    return assets
+
+
+def _send_asset(asset, max_age: int, immutable: bool = False):
+    path, etag, encoding = asset.path, asset.etag, None
+    accepted = request.accept_encodings
+    for candidate in asset.variants:
+        if accepted[candidate]:
+            encoding = candidate
+            path, etag = asset.variants[candidate]
+            break
+    response = send_file(path, mimetype=asset.mimetype, etag=etag, max_age=max_age, conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if asset.variants:
+        response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
 def _serve_react_index():
-    build_index = os.path.join(CLIENT_BUILD_DIR, "index.html")
-    if os.path.exists(build_index):
-        return send_from_directory(CLIENT_BUILD_DIR, "index.html")
-    return (
-        "React build not found. Run `npm run build` in the client directory.",
-        503,
-    )
+    # SPAの各ルートで返すため、ディスクを読まずメモリ上の index.html を返す
+    index = _get_static_assets().index()
+    if index is None:
+        return (
+            "React build not found. Run `npm run build` in the client directory.",
+            503,
+        )
+    body, etag = index
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    # 新しいビルドを確実に反映させるため index.html は毎回再検証させる
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 
 @app.route("/")
@@ -89,127 +413,1528 @@ def signup_page():
 
 @app.route("/assets/<path:filename>")
 def client_assets(filename):
-    assets_dir = os.path.join(CLIENT_BUILD_DIR, "assets")
-    file_path = os.path.join(assets_dir, filename)
-    if os.path.exists(file_path):
-        return send_from_directory(assets_dir, filename)
-    abort(404)
+    asset = _get_static_assets().get(f"assets/{filename}")
+    if asset is None:
+        abort(404)
+    # assets/ 配下はViteがファイル名に内容のハッシュを付けるため、再検証なしで長期キャッシュさせる
+    return _send_asset(asset, IMMUTABLE_MAX_AGE, immutable=True)
 
 
 @app.route("/favicon.ico")
 def favicon():
-    favicon_path = os.path.join(CLIENT_BUILD_DIR, "favicon.ico")
-    if os.path.exists(favicon_path):
-        return send_from_directory(CLIENT_BUILD_DIR, "favicon.ico")
-    abort(404)
-
-
-def _row_to_recipe(row):
-    return {
-        "id": row["id"],
-        "title": row["title"],
-        "ingredients": row["ingredients"],
-        "steps": row["steps"],
-        "notes": row["notes"],
-    }
+    asset = _get_static_assets().get("favicon.ico")
+    if asset is None:
+        abort(404)
+    return _send_asset(asset, current_app.config.get("STATIC_MAX_AGE", STATIC_MAX_AGE))
+
+
+def _get_photo_store() -> PhotoStore:
+    config = current_app.config
+    settings = (
+        config.get("PHOTO_DIR", PHOTO_DIR),
+        config.get("PHOTO_MAX_BYTES", PHOTO_MAX_BYTES),
+        config.get("PHOTO_THUMBNAIL_WORKERS", 2),
+    )
+    store, store_settings = current_app.extensions.get("photo_store", (None, None))
+    if store is None or store_settings != settings:
+        if store is not None:
+            store.shutdown()
+        store = PhotoStore(*settings)
+        current_app.extensions["photo_store"] = (store, settings)
+    return store
+
+
+def _save_photo(stream) -> SavedPhoto:
+    try:
+        return _get_photo_store().put(stream)
+    except PhotoTooLarge as exc:
+        abort(413, description=str(exc))
+    except UnsupportedPhoto as exc:
+        abort(415, description=str(exc))
+
+
+def _photo_from_request() -> SavedPhoto | None:
+    # multipart の photo フィールド。本文の検証後、DBの書き込みトランザクションを開く前に保存を済ませる
+    if request.mimetype != "multipart/form-data":
+        return None
+    upload = request.files.get("photo")
+    if upload is None or not upload.filename:
+        return None
+    return _save_photo(upload.stream)
+
+
+def _run_photo_write(fn, photo: SavedPhoto | None):
+    """run_write と同じ。登録できなかった（失敗・対象なし）ときは、この要求で新たに置いた写真を消す。"""
+    try:
+        result = run_write(fn)
+    except BaseException:
+        if photo is not None:
+            _get_photo_store().discard(photo)
+        raise
+    if result is None and photo is not None:
+        _get_photo_store().discard(photo)
+    return result
+
+
+def _send_photo(path: str, name: str, mimetype: str):
+    # 保存名が内容のハッシュなので、同じURLの中身は変わらない。世帯の確認は初回の取得時に通し、
+    # 以後は一覧を開くたびの再検証をさせないよう、ブラウザ（private）にだけ長期キャッシュさせる。
+    # Range 要求には send_file が 206 で応じる
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        etag=name.split(".", 1)[0],
+        max_age=IMMUTABLE_MAX_AGE,
+        conditional=True,
+    )
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+def _require_photo_access(name: str) -> None:
+    # 画像は内容で共有されるため、呼び出し元の世帯のレシピが参照している名前だけを返す
+    row = get_db().execute(
+        "select 1 from recipe where household = ? and photo = ? limit 1",
+        [current_user.household, name],
+    ).fetchone()
+    if row is None:
+        abort(404)
+
+
+@app.route("/media/photos/<name>")
+@login_required
+def recipe_photo(name):
+    _require_photo_access(name)
+    path = _get_photo_store().original_path(name)
+    if path is None:
+        abort(404)
+    return _send_photo(path, name, mimetypes.guess_type(path)[0] or "application/octet-stream")
+
+
+@app.route("/media/thumbs/<name>")
+@login_required
+def recipe_thumbnail(name):
+    _require_photo_access(name)
+    store = _get_photo_store()
+    path = store.thumbnail_path(name)
+    if path is not None:
+        return _send_photo(path, name, "image/jpeg")
+    if store.original_path(name) is None:
+        abort(404)
+    # 生成前（または Pillow 未導入）は原寸へ回す。生成後に同じURLでサムネイルを返せるようキャッシュさせない
+    store.schedule_thumbnail(name)
+    response = redirect(PHOTO_URL_PREFIX + name)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _row_to_recipe(row, fields=RECIPE_FIELDS):
+    recipe = {field: row[field] for field in fields}
+    if isinstance(recipe.get("tags"), str):
+        recipe["tags"] = json.loads(recipe["tags"])
+    if isinstance(recipe.get("photo"), str):
+        # 一覧のカードはサムネイルを使う。URLは保存名から決まるため、ファイルの有無は確認しない
+        recipe["photo"] = {
+            "url": PHOTO_URL_PREFIX + recipe["photo"],
+            "thumbnail_url": THUMBNAIL_URL_PREFIX + recipe["photo"],
+        }
+    return recipe
+
+
+def _select_columns(fields) -> str:
+    return ", ".join(RECIPE_TAGS_SQL if field == "tags" else field for field in fields)
+
+
+def _get_fields_arg() -> tuple[str, ...]:
+    # fields=title,ingredients のように指定すると一覧カード用に列を絞り込む（id は常に含める）
+    raw = request.args.get("fields")
+    if not raw:
+        return RECIPE_FIELDS
+    requested = {field.strip() for field in raw.split(",") if field.strip()}
+    unknown = requested - set(RECIPE_FIELDS)
+    if unknown:
+        abort(400, description=f"unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(field for field in RECIPE_FIELDS if field in requested)
+
+
+def _get_int_arg(name: str, default: int, minimum: int = 0, maximum: int | None = None) -> int:
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        abort(400, description=f"{name} must be an integer")
+    if value < minimum:
+        abort(400, description=f"{name} must be >= {minimum}")
+    if maximum is not None and value > maximum:
+        abort(400, description=f"{name} must be <= {maximum}")
+    return value
+
+
+def _iter_recipe_rows(conn, after: int = 0, fields=RECIPE_FIELDS, tags=(), household=None):
+    # fetchmany で少しずつ読み出し、全件をメモリに載せない。household が None なら全世帯（CLIの書き出し用）
+    if household is None:
+        scope, scope_params = "", []
+        tag_condition, tag_params = "", []
+    else:
+        scope, scope_params = "household = ? and ", [household]
+        tag_condition, tag_params = _tag_condition(tags, household)
+    cursor = conn.execute(
+        f"select {_select_columns(fields)} from recipe where {scope}id > ?{tag_condition} order by id",
+        [*scope_params, after, *tag_params],
+    )
+    while True:
+        rows = cursor.fetchmany(RECIPE_STREAM_FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def _stream_with_connection(render, mimetype: str):
+    # ビューで借りた接続があればそれを引き取り（teardownで返却させない）、1リクエストで2本目を借りない。
+    # 返却は出力し終えたとき、またはレスポンスの close（生成が始まる前に切断された場合）のどちらか早い方
+    if "sqlite_db" in g:
+        pool, conn = g.pop("sqlite_pool"), g.pop("sqlite_db")
+    else:
+        pool, conn = connect_db()
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            pool.release(conn)
+
+    def generate():
+        try:
+            yield from render(conn)
+        finally:
+            release()
+
+    response = Response(generate(), mimetype=mimetype)
+    response.call_on_close(release)
+    return response
+
+
+def _stream_recipes(after: int, fields, tags, household: str):
+    dumps = current_app.json.dumps
+
+    def render(conn):
+        yield "["
+        for idx, row in enumerate(_iter_recipe_rows(conn, after, fields, tags, household)):
+            chunk = dumps(_row_to_recipe(row, fields))
+            yield chunk if idx == 0 else "," + chunk
+        yield "]"
+
+    return _stream_with_connection(render, "application/json")
+
+
+def export_recipes(conn, household: str | None = None):
+    for row in _iter_recipe_rows(conn, household=household):
+        yield json.dumps(_row_to_recipe(row), ensure_ascii=False) + "\n"
+
+
+def _recipe_changes(db):
+    row = db.execute(
+        "select seq, changed_at from table_change where name = 'recipe'"
+    ).fetchone()
+    if row is None:
+        return 0, None
+    return row["seq"], row["changed_at"]
+
+
+def _bump_recipe_changes(db) -> int:
+    # レシピの作成・更新・削除のたびに呼び、一覧のETagを切り替える
+    return db.execute(
+        """
+        update table_change set seq = seq + 1, changed_at = ?
+        where name = 'recipe'
+        returning seq
+        """,
+        [now_jst()],
+    ).fetchone()[0]
+
+
+def _scoped_query_key() -> int:
+    # 一覧系のETag・キャッシュキー用。同じURLでも世帯が違えば別の表現として扱う
+    return zlib.crc32(current_user.household.encode("utf-8") + b"?" + request.query_string)
+
+
+def _parse_jst(value):
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=JST)
+
+
+def _not_modified(etag: str, last_modified):
+    # 行を読み出す前にバリデータだけで304を判定する
+    if request.if_none_match:
+        matched = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    return _set_validators(Response(status=304), etag, last_modified)
+
+
+def _set_validators(response, etag: str, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 
 @app.route("/api/recipes", methods=["GET"])
 @login_required
 def api_list_recipes():
-    recipes = get_db().execute(
-        "select id, title, ingredients, steps, notes from recipe"
+    seq, changed_at = _recipe_changes(get_db())
+    streaming = request.args.get("stream") in ("1", "true")
+    encoding = None if streaming else _preferred_encoding()
+    query_key = _scoped_query_key()
+    etag = f"recipes-{seq}-{query_key:08x}"
+    if encoding:
+        # 強いETagは表現ごとに異なる必要があるため、圧縮形式を含める
+        etag += f"-{CONTENT_ENCODING_SUFFIX[encoding]}"
+    last_modified = _parse_jst(changed_at)
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    if streaming:
+        return _set_validators(_list_recipes_response(), etag, last_modified)
+    # 変更カウンタをキーに含めるため、他ワーカーでの更新後も古い一覧は返さない。
+    # 圧縮後のバイト列も形式ごとに保持し、同じ一覧の再エンコード・再圧縮を避ける
+    cache = _get_recipe_cache()
+    cache_key = (seq, current_user.household, request.query_string, encoding)
+    body = cache.get_list(cache_key)
+    if body is None:
+        epoch = cache.epoch()
+        raw_key = (seq, current_user.household, request.query_string, None)
+        raw = cache.get_list(raw_key) if encoding else None
+        if raw is None:
+            raw = _list_recipes_response().get_data()
+            cache.put_list(raw_key, raw, epoch)
+        body = _compress(raw, encoding) if encoding else raw
+        if encoding:
+            cache.put_list(cache_key, body, epoch)
+    response = Response(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return _set_validators(response, etag, last_modified)
+
+
+def _preferred_encoding():
+    if not current_app.config.get("COMPRESS_RESPONSES", True):
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _list_recipes_response():
+    after = _get_int_arg("after", default=0)
+    fields = _get_fields_arg()
+    tags = _get_tag_args()
+    household = current_user.household
+    columns = _select_columns(fields)
+    tag_condition, tag_params = _tag_condition(tags, household)
+    if request.args.get("stream") in ("1", "true"):
+        return _stream_recipes(after, fields, tags, household)
+
+    # (household, id) インデックスで自世帯の範囲だけを走査する
+    if "limit" not in request.args and "after" not in request.args:
+        # 従来どおり全件を配列で返す（既存クライアント互換）
+        recipes = get_db().execute(
+            f"select {columns} from recipe where household = ? and id > 0{tag_condition} order by id",
+            [household, *tag_params],
+        ).fetchall()
+        return jsonify([_row_to_recipe(row, fields) for row in recipes])
+
+    max_limit = current_app.config.get("RECIPE_PAGE_MAX", RECIPE_PAGE_MAX)
+    limit = _get_int_arg(
+        "limit", default=min(RECIPE_PAGE_DEFAULT, max_limit), minimum=1, maximum=max_limit
+    )
+    # id をキーにしたキーセット方式。1件多く読んで次ページの有無を判定する
+    rows = get_db().execute(
+        f"select {columns} from recipe where household = ? and id > ?{tag_condition} order by id limit ?",
+        [household, after, *tag_params, limit + 1],
     ).fetchall()
-    return jsonify([_row_to_recipe(row) for row in recipes])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = rows[-1]["id"] if has_more else None
+    return jsonify({
+        "recipes": [_row_to_recipe(row, fields) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+def parse_ingredients(text: str) -> list[str]:
+    # "豚肉 200g / キャベツ 1/4玉" のような自由記述から材料名だけを取り出して正規化する
+    names = []
+    for piece in INGREDIENT_SEPARATORS.split(unicodedata.normalize("NFKC", text or "")):
+        piece = INGREDIENT_PAREN.sub("", piece).strip().lstrip("-*・●○◎ ").strip()
+        name = INGREDIENT_QUANTITY.sub("", piece).strip().lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _ingredient_rows(recipes):
+    return [
+        (recipe_id, name, position)
+        for recipe_id, text in recipes
+        for position, name in enumerate(parse_ingredients(text))
+    ]
+
+
+def _insert_recipe_ingredients(conn, household: str, recipes) -> None:
+    # recipes は (recipe_id, ingredients) の列
+    conn.executemany(
+        "insert or ignore into recipe_ingredient (household, recipe_id, name, position) values (?, ?, ?, ?)",
+        [(household, *row) for row in _ingredient_rows(recipes)],
+    )
 
 
-@app.route("/api/recipes", methods=["POST"])
+def recipe_grams(title: str | None, ingredients: str | None) -> set[str]:
+    # タイトル・材料の1文字・2文字の部分文字列（空白を含むものは除く）。検索語は空白で区切るため空白をまたぐ語は来ない。
+    # 作り方・メモまで含めると行数が本文の文字数に比例して膨らむため、短い語の検索対象はこの2項目に絞る
+    grams = set()
+    for text in (title, ingredients):
+        text = (text or "").lower()
+        for pos, char in enumerate(text):
+            if char.isspace():
+                continue
+            grams.add(char)
+            if pos + 1 < len(text) and not text[pos + 1].isspace():
+                grams.add(text[pos:pos + 2])
+    return grams
+
+
+def _insert_recipe_grams(conn, household: str, recipes) -> None:
+    # recipes は (recipe_id, title, ingredients) の列
+    conn.executemany(
+        "insert or ignore into recipe_gram (household, gram, recipe_id) values (?, ?, ?)",
+        [
+            (household, gram, recipe_id)
+            for recipe_id, title, ingredients in recipes
+            for gram in recipe_grams(title, ingredients)
+        ],
+    )
+
+
+def _replace_recipe_grams(conn, household: str, recipe_id: int, before, after) -> None:
+    # before・after は (title, ingredients)。増減した分だけ書き換える（削除時は after を (None, None) にする）
+    old, new = recipe_grams(*before), recipe_grams(*after)
+    conn.executemany(
+        "delete from recipe_gram where household = ? and gram = ? and recipe_id = ?",
+        [(household, gram, recipe_id) for gram in old - new],
+    )
+    conn.executemany(
+        "insert or ignore into recipe_gram (household, gram, recipe_id) values (?, ?, ?)",
+        [(household, gram, recipe_id) for gram in new - old],
+    )
+
+
+def _get_have_arg() -> list[str]:
+    names = []
+    for raw in request.args.getlist("have"):
+        for name in parse_ingredients(raw.replace(" ", ",")):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+@app.route("/api/recipes/changes", methods=["GET"])
 @login_required
-def api_create_recipe():
-    payload = request.get_json(silent=True) or {}
+def api_recipe_changes():
+    since = _get_int_arg("since", default=0)
+    fields = _get_fields_arg()
+    limit = _get_int_arg("limit", default=RECIPE_PAGE_MAX, minimum=1, maximum=RECIPE_PAGE_MAX * 5)
+    household = current_user.household
+    db = get_db()
+    seq, changed_at = _recipe_changes(db)
+    if since > seq:
+        abort(400, description="since is ahead of the server; resync from since=0")
+    etag = f"recipe-changes-{seq}-{_scoped_query_key():08x}"
+    last_modified = _parse_jst(changed_at)
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    # 同じ採番値を持つ行（一括取り込みの1チャンク等）はページをまたがせず、採番値の範囲で区切る
+    upper = db.execute(
+        """
+        select change_seq from (
+            select change_seq from recipe where household = ? and change_seq > ?
+            union all
+            select change_seq from recipe_tombstone where household = ? and change_seq > ?
+        )
+        order by change_seq
+        limit 1 offset ?
+        """,
+        [household, since, household, since, limit],
+    ).fetchone()
+    has_more = upper is not None
+    until = upper[0] - 1 if has_more else seq
+    if has_more and until <= since:
+        # 1つの採番値だけで limit を超える場合はその採番値をまとめて返す
+        until = upper[0]
+        has_more = until < seq
+    rows = db.execute(
+        f"""
+        select {_select_columns(fields)} from recipe
+        where household = ? and change_seq > ? and change_seq <= ?
+        order by change_seq, id
+        """,
+        [household, since, until],
+    ).fetchall()
+    deleted = db.execute(
+        """
+        select recipe_id from recipe_tombstone
+        where household = ? and change_seq > ? and change_seq <= ?
+        order by change_seq, recipe_id
+        """,
+        [household, since, until],
+    ).fetchall()
+    response = jsonify({
+        "since": since,
+        "next_since": until,
+        "has_more": has_more,
+        "recipes": [_row_to_recipe(row, fields) for row in rows],
+        "deleted": [row["recipe_id"] for row in deleted],
+    })
+    return _set_validators(response, etag, last_modified)
+
+
+@app.route("/api/recipes/by-ingredients", methods=["GET"])
+@login_required
+def api_recipes_by_ingredients():
+    have = _get_have_arg()
+    if not have:
+        abort(400, description="have is required")
+    if len(have) > INGREDIENT_QUERY_MAX:
+        abort(400, description=f"have accepts at most {INGREDIENT_QUERY_MAX} ingredients")
+    match = request.args.get("match", "all")
+    if match not in ("all", "any", "ranked"):
+        abort(400, description="match must be one of all, any, ranked")
+    limit = _get_int_arg("limit", default=SEARCH_LIMIT_DEFAULT, minimum=1, maximum=SEARCH_LIMIT_MAX)
+
+    # (household, name, recipe_id) インデックスで自世帯の手持ち材料ごとの posting list を引き、recipe_id で集計する
+    placeholders = ", ".join("?" for _ in have)
+    having = "having count(*) = ?" if match == "all" else ""
+    having_params = [len(have)] if match == "all" else []
+    order = (
+        "order by hits * 1.0 / total desc, hits desc, ri.recipe_id"
+        if match == "ranked"
+        else "order by hits desc, ri.recipe_id"
+    )
+    rows = get_db().execute(
+        f"""
+        select ri.recipe_id as id, r.title, r.ingredients, count(*) as hits,
+               (select count(*) from recipe_ingredient t where t.recipe_id = ri.recipe_id) as total
+        from recipe_ingredient ri
+        join recipe r on r.id = ri.recipe_id
+        where ri.household = ? and ri.name in ({placeholders})
+        group by ri.recipe_id
+        {having}
+        {order}
+        limit ?
+        """,
+        [current_user.household, *have, *having_params, limit],
+    ).fetchall()
+
+    missing: dict[int, list[str]] = {row["id"]: [] for row in rows}
+    if rows and match != "all":
+        id_placeholders = ", ".join("?" for _ in rows)
+        for item in get_db().execute(
+            f"""
+            select recipe_id, name from recipe_ingredient
+            where recipe_id in ({id_placeholders}) and name not in ({placeholders})
+            order by recipe_id, position
+            """,
+            [*missing, *have],
+        ):
+            missing[item["recipe_id"]].append(item["name"])
+
+    return jsonify({
+        "have": have,
+        "match": match,
+        "results": [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "ingredients": row["ingredients"],
+                "matched": row["hits"],
+                "total": row["total"],
+                "coverage": round(row["hits"] / row["total"], 3) if row["total"] else 0,
+                "missing": missing[row["id"]],
+            }
+            for row in rows
+        ],
+    })
+
+
+def normalize_tag(raw: str) -> str:
+    # "#和食" "ＷＡＳＨＯＫＵ" などの表記揺れを吸収する
+    return unicodedata.normalize("NFKC", raw).strip().lstrip("#").strip().lower()
+
+
+def clean_tags(payload) -> list[str] | None:
+    # 未指定なら None（更新時は既存のタグを維持する）
+    value = payload.get("tags")
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+        raise ValueError("tags must be an array of strings")
+    tags = []
+    for raw in value:
+        tag = normalize_tag(raw)
+        if not tag or tag in tags:
+            continue
+        if len(tag) > TAG_MAX_LENGTH:
+            raise ValueError(f"tags must be at most {TAG_MAX_LENGTH} characters")
+        tags.append(tag)
+    if len(tags) > TAGS_PER_RECIPE_MAX:
+        raise ValueError(f"a recipe can have at most {TAGS_PER_RECIPE_MAX} tags")
+    return tags
+
+
+def _get_tag_args() -> list[str]:
+    tags = []
+    for raw in request.args.getlist("tag"):
+        tag = normalize_tag(raw)
+        if tag and tag not in tags:
+            tags.append(tag)
+    if len(tags) > TAG_FILTER_MAX:
+        abort(400, description=f"tag accepts at most {TAG_FILTER_MAX} values")
+    return tags
+
+
+def _tag_condition(tags, household: str) -> tuple[str, list[str]]:
+    # タグごとに (tag_id, recipe_id) インデックスを引いて積集合を取る。未知のタグは NULL となり0件になる
+    if not tags:
+        return "", []
+    postings = " intersect ".join(
+        "select recipe_id from recipe_tag"
+        " where tag_id = (select id from tag where household = ? and name = ?)"
+        for _ in tags
+    )
+    return f" and id in ({postings})", [param for tag in tags for param in (household, tag)]
+
+
+def _write_recipe_tags(conn, household: str, recipes, replace: bool = False) -> None:
+    # recipes は (recipe_id, タグ一覧) の反復。件数は recipe_tag のトリガで tag.recipe_count に反映される
+    recipes = [(recipe_id, tags) for recipe_id, tags in recipes if tags is not None]
+    names = sorted({tag for _, tags in recipes for tag in tags})
+    conn.executemany(
+        "insert or ignore into tag (household, name) values (?, ?)",
+        [(household, name) for name in names],
+    )
+    if replace:
+        for recipe_id, tags in recipes:
+            placeholders = ", ".join("?" for _ in tags)
+            conn.execute(
+                f"""
+                delete from recipe_tag
+                where recipe_id = ? and tag_id not in (
+                    select id from tag where household = ? and name in ({placeholders})
+                )
+                """,
+                [recipe_id, household, *tags],
+            )
+    conn.executemany(
+        """
+        insert or ignore into recipe_tag (recipe_id, tag_id)
+        select ?, id from tag where household = ? and name = ?
+        """,
+        [(recipe_id, household, tag) for recipe_id, tags in recipes for tag in tags],
+    )
+
+
+@app.route("/api/tags", methods=["GET"])
+@login_required
+def api_list_tags():
+    # タグはレシピの書き込みと同じトランザクションで変わるため、レシピの変更カウンタをそのまま使う
+    seq, changed_at = _recipe_changes(get_db())
+    etag = f"tags-{seq}-{_scoped_query_key():08x}"
+    last_modified = _parse_jst(changed_at)
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    # タグは世帯ごとに持つため、件数もその世帯のレシピだけを数えた値になる
+    rows = get_db().execute(
+        """
+        select name, recipe_count from tag
+        where household = ? and recipe_count > 0
+        order by recipe_count desc, name
+        """,
+        [current_user.household],
+    ).fetchall()
+    return _set_validators(
+        jsonify({"tags": [{"name": row["name"], "count": row["recipe_count"]} for row in rows]}),
+        etag,
+        last_modified,
+    )
+
+
+def clean_recipe(payload) -> tuple[str, str, str, str]:
+    if not isinstance(payload, dict):
+        raise ValueError("recipe must be an object")
 
     def _get_str(field: str, required: bool = False) -> str:
         value = payload.get(field)
         if value is None:
             if required:
-                abort(400, description=f"{field} is required")
+                raise ValueError(f"{field} is required")
             return ""
         if not isinstance(value, str):
-            abort(400, description=f"{field} must be a string")
+            raise ValueError(f"{field} must be a string")
         return value.strip()
 
-    title = _get_str("title", required=True)
-    ingredients = _get_str("ingredients")
-    steps = _get_str("steps")
-    notes = _get_str("notes")
-    db = get_db()
-    cursor = db.execute(
-        "insert into recipe (title, ingredients, steps, notes) values(?, ?, ?, ?)",
-        [title, ingredients, steps, notes]
-    )
-    db.commit()
-    new_id = cursor.lastrowid
-    recipe = db.execute(
-        "select id, title, ingredients, steps, notes from recipe where id = ?",
-        [new_id]
+    return (
+        _get_str("title", required=True),
+        _get_str("ingredients"),
+        _get_str("steps"),
+        _get_str("notes"),
+    )
+
+
+def _limit_photo_request() -> None:
+    # 本文を読む前に呼ぶ。PHOTO_MAX_BYTES を変えた環境でも写真の上限に合わせて早めに 413 にする
+    # （request.max_content_length への代入は Flask 3.1 以降。requirements.txt で 3.1 以上を要求している）
+    request.max_content_length = _get_photo_store().max_bytes + PHOTO_FORM_HEADROOM
+
+
+def _recipe_from_request() -> tuple[tuple[str, str, str, str], list[str] | None]:
+    if request.mimetype == "multipart/form-data":
+        # 写真付きの作成・更新。レシピ本体は recipe フィールドにJSONで渡す
+        _limit_photo_request()
+        try:
+            payload = json.loads(request.form.get("recipe") or "{}")
+        except json.JSONDecodeError:
+            abort(400, description="recipe must be a JSON object")
+    else:
+        payload = request.get_json(silent=True) or {}
+    try:
+        return clean_recipe(payload), clean_tags(payload)
+    except ValueError as exc:
+        abort(400, description=str(exc))
+
+
+def _insert_recipe_chunk(conn, batch, owner: str | None, household: str) -> int:
+    # batch は (clean_recipe の結果, タグ一覧) の列。コミットは呼び出し側で行う
+    changed_at = now_jst()
+    conn.executemany(
+        f"""
+        insert into recipe (
+            title, ingredients, steps, notes, version, updated_at, owner, household, change_seq
+        )
+        values(?, ?, ?, ?, 1, ?, ?, ?, {PENDING_CHANGE_SEQ})
+        """,
+        [(*fields, changed_at, owner, household) for fields, _ in batch],
+    )
+    # 書き込みトランザクション中は AUTOINCREMENT の id が連番になるため、末尾の id から逆算する
+    last_id = conn.execute("select last_insert_rowid()").fetchone()[0]
+    first_id = last_id - len(batch) + 1
+    _insert_recipe_ingredients(
+        conn,
+        household,
+        [(first_id + offset, fields[1]) for offset, (fields, _) in enumerate(batch)],
+    )
+    _insert_recipe_grams(
+        conn,
+        household,
+        [(first_id + offset, fields[0], fields[1]) for offset, (fields, _) in enumerate(batch)],
+    )
+    _write_recipe_tags(
+        conn,
+        household,
+        [(first_id + offset, tags) for offset, (_, tags) in enumerate(batch)],
+    )
+    conn.executemany(
+        """
+        insert into recipe_revision (recipe_id, version, kind, data, created_at)
+        values (?, 1, 'snapshot', ?, ?)
+        """,
+        [
+            (first_id + offset, encode_revision(_revision_content(fields, tags)), changed_at)
+            for offset, (fields, tags) in enumerate(batch)
+        ],
+    )
+    _bump_recipe_changes(conn)
+    return len(batch)
+
+
+def _import_chunks(records, chunk_size: int, failures: dict):
+    # records は (行番号, dict または JSON文字列) の反復。検証済みの行を chunk_size 件ずつ返す。
+    # 不正な行は failures["failed"] に数え、内容は先頭の BULK_ERROR_REPORT_LIMIT 件だけ failures["errors"] に残す
+    batch = []
+    for line_no, record in records:
+        try:
+            if isinstance(record, (str, bytes)):
+                if not record.strip():
+                    continue
+                try:
+                    record = json.loads(record)
+                except json.JSONDecodeError:
+                    raise ValueError("invalid JSON") from None
+            batch.append((clean_recipe(record), clean_tags(record)))
+        except ValueError as exc:
+            failures["failed"] += 1
+            if len(failures["errors"]) < BULK_ERROR_REPORT_LIMIT:
+                failures["errors"].append({"line": line_no, "error": str(exc)})
+            continue
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _import_summary(imported: int, failures: dict) -> dict:
+    return {"imported": imported, **failures}
+
+
+def import_recipes(
+    conn,
+    records,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    owner: str | None = None,
+    household: str = DEFAULT_HOUSEHOLD,
+) -> dict:
+    # CLI・ベンチマーク用。chunk_size 件ごとに executemany + コミット
+    imported = 0
+    failures = {"failed": 0, "errors": []}
+    for batch in _import_chunks(records, chunk_size, failures):
+        imported += _insert_recipe_chunk(conn, batch, owner, household)
+        conn.commit()
+    return _import_summary(imported, failures)
+
+
+BULK_IMPORT_PATH = "/api/recipes/bulk"
+
+
+def request_body_limit(path: str) -> int | None:
+    """path への要求で受け付ける本文の上限（バイト、None は無制限）。
+
+    ビューが要求ごとに設定する上限のうち最大のもの。ASGI 側で本文を受け取る前に断るために使う。
+    """
+    config = app.config
+    if path == BULK_IMPORT_PATH:
+        return config.get("BULK_MAX_BYTES", BULK_MAX_BYTES)
+    limit = config.get("MAX_CONTENT_LENGTH")
+    if limit is None:
+        return None
+    return max(limit, config.get("PHOTO_MAX_BYTES", PHOTO_MAX_BYTES) + PHOTO_FORM_HEADROOM)
+
+
+@app.route(BULK_IMPORT_PATH, methods=["POST"])
+@login_required
+def api_bulk_import_recipes():
+    # 一括取り込みは写真向けの上限（MAX_CONTENT_LENGTH）ではなく BULK_MAX_BYTES で制限する
+    request.max_content_length = current_app.config.get("BULK_MAX_BYTES", BULK_MAX_BYTES)
+    if request.mimetype in NDJSON_MIMETYPES:
+        # 1行ずつ読み進め、ボディ全体をメモリに載せない
+        records = enumerate(request.stream, start=1)
+    else:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, list):
+            abort(400, description="expected a JSON array or NDJSON body")
+        records = enumerate(payload, start=1)
+    chunk_size = current_app.config.get("BULK_CHUNK_SIZE", BULK_CHUNK_SIZE)
+    owner, household = current_user.id, current_user.household
+    imported = 0
+    failures = {"failed": 0, "errors": []}
+    # 本文の読み取りと検証はこのスレッドで行い、書き込み役にはチャンク単位の挿入だけを渡す
+    for batch in _import_chunks(records, chunk_size, failures):
+        imported += run_write(
+            lambda conn, batch=batch: _insert_recipe_chunk(conn, batch, owner, household)
+        )
+    summary = _import_summary(imported, failures)
+    if summary["imported"]:
+        _get_recipe_cache().invalidate()
+    return jsonify(summary)
+
+
+@app.route("/api/recipes/export", methods=["GET"])
+@login_required
+def api_export_recipes():
+    household = current_user.household
+    return _stream_with_connection(
+        lambda conn: export_recipes(conn, household), "application/x-ndjson"
+    )
+
+
+def _revision_content(fields, tags) -> dict:
+    return dict(zip(REVISION_FIELDS, (*fields, sorted(tags or []))))
+
+
+def _record_revision(conn, recipe, previous: dict | None = None) -> None:
+    # 直前の版が記録済みで、最後のスナップショットから間隔内なら差分で保存する
+    content = {field: recipe[field] for field in REVISION_FIELDS}
+    if previous is not None and all(previous[field] == content[field] for field in REVISION_FIELDS):
+        # 写真だけの変更など、履歴に残す項目が変わらない版は記録しない（写真は履歴から戻さない）
+        return
+    kind, data = "snapshot", encode_revision(content)
+    if previous is not None:
+        latest, latest_snapshot = conn.execute(
+            """
+            select max(version), max(case when kind = 'snapshot' then version end)
+            from recipe_revision where recipe_id = ?
+            """,
+            [recipe["id"]],
+        ).fetchone()
+        if (
+            latest == recipe["version"] - 1
+            and latest_snapshot is not None
+            and recipe["version"] - latest_snapshot < REVISION_SNAPSHOT_INTERVAL
+        ):
+            delta = encode_revision(make_delta(previous, content))
+            # 大半を書き換えた場合は差分の方が大きくなるので全文で持つ
+            if len(delta) < len(data):
+                kind, data = "delta", delta
+    conn.execute(
+        """
+        insert or replace into recipe_revision (recipe_id, version, kind, data, created_at)
+        values (?, ?, ?, ?, ?)
+        """,
+        [recipe["id"], recipe["version"], kind, data, recipe["updated_at"]],
+    )
+
+
+def load_revision(conn, recipe_id: int, version: int) -> dict | None:
+    # 指定版以前で最も新しいスナップショットから差分を順に当てる（最大 REVISION_SNAPSHOT_INTERVAL 件）
+    rows = conn.execute(
+        """
+        select version, kind, data, created_at from recipe_revision
+        where recipe_id = ? and version <= ? and version >= (
+            select max(version) from recipe_revision
+            where recipe_id = ? and version <= ? and kind = 'snapshot'
+        )
+        order by version
+        """,
+        [recipe_id, version, recipe_id, version],
+    ).fetchall()
+    if not rows or rows[-1]["version"] != version:
+        return None
+    content = None
+    for row in rows:
+        value = decode_revision(row["data"])
+        content = value if row["kind"] == "snapshot" else apply_delta(content, value)
+    return {"id": recipe_id, "version": version, "created_at": rows[-1]["created_at"], **content}
+
+
+def insert_recipe(conn, fields, tags, owner: str | None, household: str, photo: str | None = None) -> dict:
+    # コミットは呼び出し側で行う（単体APIと /api/batch で共有）
+    title, ingredients, steps, notes = fields
+    row = conn.execute(
+        f"""
+        insert into recipe (
+            title, ingredients, steps, notes, version, updated_at, owner, household, photo, change_seq
+        )
+        values(?, ?, ?, ?, 1, ?, ?, ?, ?, {PENDING_CHANGE_SEQ})
+        returning {RECIPE_COLUMNS}
+        """,
+        [title, ingredients, steps, notes, now_jst(), owner, household, photo]
     ).fetchone()
-    return jsonify(_row_to_recipe(recipe)), 201
+    _insert_recipe_ingredients(conn, household, [(row["id"], ingredients)])
+    _insert_recipe_grams(conn, household, [(row["id"], title, ingredients)])
+    _write_recipe_tags(conn, household, [(row["id"], tags)])
+    recipe = _row_to_recipe(row, row.keys())
+    recipe["tags"] = sorted(tags or [])
+    _record_revision(conn, recipe)
+    return recipe
+
+
+def update_recipe(
+    conn, recipe_id: int, fields, tags, household: str, photo: str | None = None
+) -> dict | None:
+    # 他の世帯のレシピは存在しないものとして None を返す。tags・photo は None なら現在の値を維持する
+    title, ingredients, steps, notes = fields
+    if not conn.in_transaction:
+        # 差分の基準となる旧版を読んでから書き換えるまでの間に、他のワーカーの更新を挟ませない
+        conn.execute("BEGIN IMMEDIATE")
+    previous = read_recipe(conn, recipe_id, household)
+    if previous is None:
+        return None
+    # 更新後の値は RETURNING で受け取り、再読込のSELECTを省く
+    row = conn.execute(
+        f"""
+        update recipe
+        set title = ?, ingredients = ?, steps = ?, notes = ?, photo = coalesce(?, photo),
+            version = version + 1, updated_at = ?, change_seq = {PENDING_CHANGE_SEQ}
+        where id = ? and household = ?
+        returning {RECIPE_COLUMNS}
+        """,
+        [title, ingredients, steps, notes, photo, now_jst(), recipe_id, household]
+    ).fetchone()
+    if row is None:
+        return None
+    conn.execute("delete from recipe_ingredient where recipe_id = ?", [recipe_id])
+    _insert_recipe_ingredients(conn, household, [(recipe_id, ingredients)])
+    _replace_recipe_grams(
+        conn, household, recipe_id, (previous["title"], previous["ingredients"]), (title, ingredients)
+    )
+    _write_recipe_tags(conn, household, [(recipe_id, tags)], replace=True)
+    updated = _row_to_recipe(row, row.keys())
+    if tags is not None:
+        updated["tags"] = sorted(tags)
+    _record_revision(conn, updated, previous)
+    return updated
+
+
+def set_recipe_photo(conn, recipe_id: int, household: str, photo: str | None) -> dict | None:
+    # 写真だけの差し替え・削除。本文は変わらないが版を進め、詳細のETagと変更フィードに反映させる。
+    # 履歴の項目は変わらないため、この版の履歴は作られない
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    previous = read_recipe(conn, recipe_id, household)
+    if previous is None:
+        return None
+    row = conn.execute(
+        f"""
+        update recipe
+        set photo = ?, version = version + 1, updated_at = ?, change_seq = {PENDING_CHANGE_SEQ}
+        where id = ? and household = ?
+        returning {RECIPE_COLUMNS}
+        """,
+        [photo, now_jst(), recipe_id, household]
+    ).fetchone()
+    updated = _row_to_recipe(row, row.keys())
+    _record_revision(conn, updated, previous)
+    return updated
 
-def _fetch_recipe_or_404(recipe_id):
-    row = get_db().execute(
-        "select id, title, ingredients, steps, notes from recipe where id = ?",
-        (recipe_id, )
+
+def delete_recipe(conn, recipe_id: int, household: str) -> bool:
+    row = conn.execute(
+        "delete from recipe where id = ? and household = ? returning title, ingredients",
+        (recipe_id, household),
     ).fetchone()
     if row is None:
+        return False
+    # recipe_gram は主キーで消せるよう、削除前の本文から消す語を求める（recipe_id の索引は持たない）
+    _replace_recipe_grams(conn, household, recipe_id, (row[0], row[1]), (None, None))
+    return True
+
+
+def read_recipe(conn, recipe_id: int, household: str) -> dict | None:
+    row = conn.execute(
+        f"select {RECIPE_COLUMNS} from recipe where id = ? and household = ?",
+        (recipe_id, household)
+    ).fetchone()
+    return None if row is None else _row_to_recipe(row, row.keys())
+
+
+def _invalidate_recipe_cache(recipe_ids) -> None:
+    # コミット後に呼ぶ。書き込んだ値はキャッシュへ入れない（同じレシピへの並行した書き込みの結果が
+    # 前後して届くと古い版を書き戻してしまうため）。次の参照でDBから読み、epoch 付きで入れ直す
+    cache = _get_recipe_cache()
+    recipe_ids = list(recipe_ids)
+    if len(recipe_ids) == 1:
+        cache.invalidate(recipe_ids[0])
+    else:
+        cache.invalidate()
+
+
+@app.route("/api/recipes", methods=["POST"])
+@login_required
+def api_create_recipe():
+    fields, tags = _recipe_from_request()
+    photo = _photo_from_request()
+    owner, household = current_user.id, current_user.household
+
+    def write(conn):
+        recipe = insert_recipe(conn, fields, tags, owner, household, photo and photo.name)
+        _bump_recipe_changes(conn)
+        return recipe
+
+    recipe = _run_photo_write(write, photo)
+    _invalidate_recipe_cache([recipe["id"]])
+    return jsonify(_row_to_recipe(recipe)), 201
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _fallback_snippet(row, terms: list[str]) -> str:
+    # MATCHを使わない短い語だけの検索では snippet() が使えないため、最初の一致箇所を切り出す
+    width = SEARCH_SNIPPET_TOKENS
+    for column in ("title", "ingredients", "steps", "notes"):
+        text = row[column] or ""
+        for term in terms:
+            # recipe_gram と同じく大文字・小文字を区別しない
+            pos = text.lower().find(term.lower())
+            if pos < 0:
+                continue
+            stop = pos + len(term)
+            start = max(pos - width, 0)
+            end = min(stop + width, len(text))
+            return (
+                ("…" if start > 0 else "")
+                + text[start:pos] + "【" + text[pos:stop] + "】" + text[stop:end]
+                + ("…" if end < len(text) else "")
+            )
+    return ""
+
+
+@app.route("/api/recipes/search", methods=["GET"])
+@login_required
+def api_search_recipes():
+    query = request.args.get("q", "").strip()
+    if not query:
+        abort(400, description="q is required")
+    limit = _get_int_arg("limit", default=SEARCH_LIMIT_DEFAULT, minimum=1, maximum=SEARCH_LIMIT_MAX)
+
+    terms = query.split()
+    match_terms = [t for t in terms if len(t) >= FTS_MIN_TERM_LENGTH]
+    short_terms = [t for t in terms if len(t) < FTS_MIN_TERM_LENGTH]
+
+    where = []
+    params: list = []
+    if match_terms:
+        where.append("recipe_fts match ?")
+        params.append(" ".join(_fts_phrase(t) for t in match_terms))
+    household = current_user.household
+    for term in short_terms:
+        # 1・2文字の語はそのまま recipe_gram のキーになるため、一致の確認は要らない（タイトル・材料のみが対象）
+        where.append(
+            "recipe.id in (select recipe_id from recipe_gram where household = ? and gram = ?)"
+        )
+        params.extend([household, term.lower()])
+    where.append("recipe.household = ?")
+    params.append(household)
+
+    if match_terms:
+        select = (
+            "select recipe.id, recipe.title, recipe.ingredients, recipe.steps, recipe.notes,"
+            f" snippet(recipe_fts, -1, '【', '】', '…', {SEARCH_SNIPPET_TOKENS}) as snippet,"
+            " recipe_fts.rank as score"
+        )
+        source = "recipe_fts join recipe on recipe.id = recipe_fts.rowid"
+        order = "order by recipe_fts.rank"
+    else:
+        # 短い語だけなら全文検索の索引を使わない（FTS5非対応の環境でも検索できる）
+        select = (
+            "select recipe.id, recipe.title, recipe.ingredients, recipe.steps, recipe.notes,"
+            " null as snippet, null as score"
+        )
+        source = "recipe"
+        order = "order by recipe.id desc"
+
+    try:
+        rows = get_db().execute(
+            f"""
+            {select}
+            from {source}
+            where {" and ".join(where)}
+            {order}
+            limit ?
+            """,
+            [*params, limit],
+        ).fetchall()
+    except sqlite3.OperationalError as exc:
+        if "no such table" in str(exc):
+            abort(503, description="full-text search is not available")
+        raise
+
+    results = []
+    for row in rows:
+        results.append({
+            "id": row["id"],
+            "title": row["title"],
+            "ingredients": row["ingredients"],
+            "snippet": row["snippet"] if row["snippet"] is not None else _fallback_snippet(row, short_terms),
+            "score": row["score"],
+        })
+    return jsonify({"query": query, "results": results})
+
+
+def _load_recipe_or_404(recipe_id):
+    cache = _get_recipe_cache()
+    epoch = cache.epoch()
+    record = read_recipe(get_db(), recipe_id, current_user.household)
+    if record is None:
+        abort(404, description="recipe not found")
+    cache.put_recipe(recipe_id, record, epoch)
+    return record
+
+
+def _cached_recipe(recipe_id):
+    # キャッシュはIDのみをキーに全世帯で共有する。他の世帯のレシピは存在しないものとして扱う
+    record = _get_recipe_cache().get_recipe(recipe_id)
+    if record is not None and record["household"] != current_user.household:
         abort(404, description="recipe not found")
-    return row
+    return record
+
+
+def _fetch_recipe_or_404(recipe_id):
+    record = _cached_recipe(recipe_id)
+    if record is not None:
+        return record
+    return _load_recipe_or_404(recipe_id)
+
+
+def _recipe_etag(row) -> str:
+    return f"recipe-{row['id']}-v{row['version']}"
 
 
 @app.route("/api/recipes/<int:recipe_id>", methods=["GET"])
 @login_required
 def api_get_recipe(recipe_id):
-    record = _fetch_recipe_or_404(recipe_id)
-    return jsonify(_row_to_recipe(record))
+    record = _cached_recipe(recipe_id)
+    if record is None:
+        if request.if_none_match or request.if_modified_since:
+            validators = get_db().execute(
+                "select id, version, updated_at from recipe where id = ? and household = ?",
+                (recipe_id, current_user.household)
+            ).fetchone()
+            if validators is not None:
+                cached = _not_modified(
+                    _recipe_etag(validators), _parse_jst(validators["updated_at"])
+                )
+                if cached is not None:
+                    return cached
+        record = _load_recipe_or_404(recipe_id)
+    etag = _recipe_etag(record)
+    last_modified = _parse_jst(record["updated_at"])
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    return _set_validators(jsonify(_row_to_recipe(record)), etag, last_modified)
 
 
 @app.route("/api/recipes/<int:recipe_id>", methods=["PUT"])
 @login_required
 def api_update_recipe(recipe_id):
-    payload = request.get_json(silent=True) or {}
+    fields, tags = _recipe_from_request()
+    photo = _photo_from_request()
+    household = current_user.household
+
+    def write(conn):
+        updated = update_recipe(conn, recipe_id, fields, tags, household, photo and photo.name)
+        if updated is not None:
+            _bump_recipe_changes(conn)
+        return updated
+
+    updated = _run_photo_write(write, photo)
+    if updated is None:
+        abort(404, description="recipe not found")
+    _invalidate_recipe_cache([recipe_id])
+    return jsonify(_row_to_recipe(updated))
 
-    def _get_str(field: str, required: bool = False) -> str:
-        value = payload.get(field)
-        if value is None:
-            if required:
-                abort(400, description=f"{field} is required")
-            return ""
-        if not isinstance(value, str):
-            abort(400, description=f"{field} must be a string")
-        return value.strip()
 
-    title = _get_str("title", required=True)
-    ingredients = _get_str("ingredients")
-    steps = _get_str("steps")
-    notes = _get_str("notes")
+@app.route("/api/recipes/<int:recipe_id>", methods=["DELETE"])
+@login_required
+def api_delete_recipe(recipe_id):
+    household = current_user.household
+
+    def write(conn):
+        deleted = delete_recipe(conn, recipe_id, household)
+        if deleted:
+            _bump_recipe_changes(conn)
+        return deleted
+
+    if not run_write(write):
+        abort(404, description="recipe not found")
+    _invalidate_recipe_cache([recipe_id])
+    return jsonify({"status": "deleted", "id": recipe_id})
+
+
+def _photo_writer(recipe_id: int, household: str, photo: str | None):
+    def write(conn):
+        updated = set_recipe_photo(conn, recipe_id, household, photo)
+        if updated is not None:
+            _bump_recipe_changes(conn)
+        return updated
+
+    return write
+
+
+@app.route("/api/recipes/<int:recipe_id>/photo", methods=["PUT"])
+@login_required
+def api_put_recipe_photo(recipe_id):
+    # 本文は画像そのもの（Content-Type は問わず先頭のバイト列で判定する）
+    if request.content_length and request.content_length > _get_photo_store().max_bytes:
+        abort(413, description=f"photo must be at most {_get_photo_store().max_bytes} bytes")
+    _limit_photo_request()
     _fetch_recipe_or_404(recipe_id)
-    db = get_db()
-    db.execute(
-        "update recipe set title = ?, ingredients = ?, steps = ?, notes = ? where id = ?",
-        [title, ingredients, steps, notes, recipe_id]
-    )
-    db.commit()
-    updated = _fetch_recipe_or_404(recipe_id)
+    photo = _save_photo(request.stream)
+    updated = _run_photo_write(_photo_writer(recipe_id, current_user.household, photo.name), photo)
+    if updated is None:
+        abort(404, description="recipe not found")
+    _invalidate_recipe_cache([recipe_id])
     return jsonify(_row_to_recipe(updated))
 
 
-@app.route("/api/recipes/<int:recipe_id>", methods=["DELETE"])
+@app.route("/api/recipes/<int:recipe_id>/photo", methods=["DELETE"])
 @login_required
-def api_delete_recipe(recipe_id):
+def api_delete_recipe_photo(recipe_id):
+    # ファイルは他のレシピと共有している場合があるため、ここでは消さず sweep-photos に任せる
+    updated = run_write(_photo_writer(recipe_id, current_user.household, None))
+    if updated is None:
+        abort(404, description="recipe not found")
+    _invalidate_recipe_cache([recipe_id])
+    return jsonify(_row_to_recipe(updated))
+
+
+@app.route("/api/recipes/<int:recipe_id>/revisions", methods=["GET"])
+@login_required
+def api_list_recipe_revisions(recipe_id):
+    limit = _get_int_arg("limit", default=RECIPE_PAGE_DEFAULT, minimum=1, maximum=RECIPE_PAGE_MAX)
+    before = _get_int_arg("before", default=0)
     _fetch_recipe_or_404(recipe_id)
-    db = get_db()
-    db.execute("delete from recipe where id = ?", (recipe_id, ))
-    db.commit()
-    return jsonify({"status": "deleted", "id": recipe_id})
+    rows = get_db().execute(
+        """
+        select version, kind, length(data) as size, created_at from recipe_revision
+        where recipe_id = ? and (? = 0 or version < ?)
+        order by version desc
+        limit ?
+        """,
+        [recipe_id, before, before, limit],
+    ).fetchall()
+    return jsonify({
+        "id": recipe_id,
+        "revisions": [dict(row) for row in rows],
+    })
+
+
+@app.route("/api/recipes/<int:recipe_id>/revisions/<int:version>", methods=["GET"])
+@login_required
+def api_get_recipe_revision(recipe_id, version):
+    _fetch_recipe_or_404(recipe_id)
+    revision = load_revision(get_db(), recipe_id, version)
+    if revision is None:
+        abort(404, description="revision not found")
+    return jsonify(revision)
+
+
+@app.route("/api/recipes/<int:recipe_id>/revisions/<int:version>/restore", methods=["POST"])
+@login_required
+def api_restore_recipe_revision(recipe_id, version):
+    _fetch_recipe_or_404(recipe_id)
+    revision = load_revision(get_db(), recipe_id, version)
+    if revision is None:
+        abort(404, description="revision not found")
+    household = current_user.household
+
+    def write(conn):
+        # 過去の版の内容で更新し、新しい版として記録する（履歴は書き換えない）
+        restored = update_recipe(
+            conn,
+            recipe_id,
+            tuple(revision[field] for field in ("title", "ingredients", "steps", "notes")),
+            revision["tags"],
+            household,
+        )
+        if restored is not None:
+            _bump_recipe_changes(conn)
+        return restored
+
+    restored = run_write(write)
+    if restored is None:
+        abort(404, description="recipe not found")
+    _invalidate_recipe_cache([recipe_id])
+    return jsonify(_row_to_recipe(restored))
+
+
+class _BatchRolledBack(Exception):
+    def __init__(self, results: list) -> None:
+        super().__init__("atomic batch rolled back")
+        self.results = results
+
+
+def _run_batch_operation(db, operation, written: dict, user) -> tuple[int, dict]:
+    if not isinstance(operation, dict):
+        raise ValueError("operation must be an object")
+    op = operation.get("op")
+    if op not in BATCH_OPERATIONS:
+        raise ValueError(f"op must be one of {', '.join(BATCH_OPERATIONS)}")
+    if op == "create":
+        payload = operation.get("recipe")
+        fields, tags = clean_recipe(payload), clean_tags(payload)
+        recipe = insert_recipe(db, fields, tags, user.id, user.household)
+        written[recipe["id"]] = recipe
+        return 201, {"recipe": _row_to_recipe(recipe)}
+
+    recipe_id = operation.get("id")
+    if not isinstance(recipe_id, int) or isinstance(recipe_id, bool):
+        raise ValueError("id must be an integer")
+    if op == "get":
+        # 同じバッチ内の書き込みを反映させるため、キャッシュではなくトランザクション内で読む
+        recipe = read_recipe(db, recipe_id, user.household)
+        if recipe is None:
+            return 404, {"error": "recipe not found"}
+        return 200, {"recipe": _row_to_recipe(recipe)}
+    if op == "update":
+        payload = operation.get("recipe")
+        fields, tags = clean_recipe(payload), clean_tags(payload)
+        recipe = update_recipe(db, recipe_id, fields, tags, user.household)
+        if recipe is None:
+            return 404, {"error": "recipe not found"}
+        written[recipe_id] = recipe
+        return 200, {"recipe": _row_to_recipe(recipe)}
+    if not delete_recipe(db, recipe_id, user.household):
+        return 404, {"error": "recipe not found"}
+    written[recipe_id] = None
+    return 200, {"id": recipe_id}
+
+
+@app.route("/api/batch", methods=["POST"])
+@login_required
+def api_batch():
+    payload = request.get_json(silent=True)
+    operations = payload.get("operations") if isinstance(payload, dict) else payload
+    if not isinstance(operations, list):
+        abort(400, description="expected a JSON array of operations")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        abort(400, description=f"a batch can contain at most {BATCH_MAX_OPERATIONS} operations")
+
+    # 既定では失敗した操作（4xx）だけを飛ばし、成功した操作はコミットする（部分コミット）。
+    # atomic: true なら1つでも失敗したときに全操作を取り消し、成功していた操作は 424 として返す
+    atomic = isinstance(payload, dict) and payload.get("atomic") is True
+    user = User(current_user.id, current_user.role, current_user.household)
+    written: dict = {}
+
+    def write(conn):
+        results = []
+        for operation in operations:
+            try:
+                status, body = _run_batch_operation(conn, operation, written, user)
+            except ValueError as exc:
+                status, body = 400, {"error": str(exc)}
+            results.append({"status": status, **body})
+        if atomic and any(result["status"] >= 400 for result in results):
+            # 書き込みスレッドは例外を送出したジョブのセーブポイントを巻き戻す
+            raise _BatchRolledBack(results)
+        if written:
+            _bump_recipe_changes(conn)
+        return results
+
+    try:
+        results = run_write(write)
+    except _BatchRolledBack as exc:
+        results = [
+            result if result["status"] >= 400
+            else {"status": 424, "error": "rolled back because another operation failed"}
+            for result in exc.results
+        ]
+        return jsonify({"results": results, "committed": False}), 409
+    if written:
+        _invalidate_recipe_cache(written)
+    return jsonify({"results": results, "committed": True})
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+@login_required
+def api_cache_stats():
+    _require_admin()
+    return jsonify(_get_recipe_cache().stats())
+
+
+def _get_password_hasher() -> PasswordHasher:
+    config = current_app.config
+    settings = (
+        config.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256"),
+        config.get("PASSWORD_HASH_WORKERS", 2),
+        config.get("PASSWORD_HASH_MAX_PENDING", 16),
+        config.get("PASSWORD_HASH_TIMEOUT", 10.0),
+    )
+    hasher, hasher_settings = current_app.extensions.get("password_hasher", (None, None))
+    if hasher is not None and hasher_settings == settings:
+        return hasher
+    # 最初のリクエストが並行しても1つだけ作る（作られなかった方のワーカープロセスが残らないように）
+    with _pools_lock:
+        hasher, hasher_settings = current_app.extensions.get("password_hasher", (None, None))
+        if hasher is None or hasher_settings != settings:
+            if hasher is not None:
+                hasher.shutdown()
+            hasher = PasswordHasher(*settings)
+            current_app.extensions["password_hasher"] = (hasher, settings)
+    return hasher
+
+
+def _run_hasher(fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    except HasherBusy as exc:
+        PASSWORD_HASH_REJECTED.inc()
+        raise ServiceUnavailable(description=str(exc), retry_after=1) from None
+    finally:
+        PASSWORD_HASH_LATENCY.observe(time.perf_counter() - started, op=fn.__name__)
+
+
+_login_limiters: dict[str, tuple[RateLimiter, RateLimiter]] = {}
+
+
+def _get_login_limiters() -> tuple[RateLimiter, RateLimiter] | None:
+    config = current_app.config
+    if not config.get("LOGIN_RATE_LIMIT_ENABLED", True):
+        return None
+    db_path = config.get("DATABASE", DATABASE)
+    limiters = _login_limiters.get(db_path)
+    if limiters is not None:
+        return limiters
+    shared_path = config.get("LOGIN_RATE_LIMIT_SHARED_PATH")
+    with _pools_lock:
+        limiters = _login_limiters.get(db_path)
+        if limiters is None:
+            store = (
+                SQLiteStore(shared_path)
+                if shared_path
+                else MemoryStore(config.get("LOGIN_RATE_LIMIT_MAX_KEYS", 10000))
+            )
+            lockout = {
+                "lockout_after": config.get("LOGIN_LOCKOUT_AFTER", 5),
+                "lockout_max": config.get("LOGIN_LOCKOUT_MAX", 900.0),
+                "failure_ttl": config.get("LOGIN_FAILURE_TTL"),
+                "store": store,
+            }
+            limiters = (
+                RateLimiter(
+                    config.get("LOGIN_IP_BURST", 20),
+                    config.get("LOGIN_IP_PER_MINUTE", 10) / 60,
+                    prefix="ip:",
+                    **lockout,
+                ),
+                RateLimiter(
+                    config.get("LOGIN_USER_BURST", 5),
+                    config.get("LOGIN_USER_PER_MINUTE", 5) / 60,
+                    prefix="user:",
+                    **lockout,
+                ),
+            )
+            _login_limiters[db_path] = limiters
+    return limiters
+
+
+def _throttle_login(limiters, ip: str, userid: str) -> None:
+    # user テーブルやハッシュ計算に触れる前に判定する
+    ip_limiter, user_limiter = limiters
+    for scope, limiter, key in (("ip", ip_limiter, ip), ("user", user_limiter, userid)):
+        wait = limiter.acquire(key)
+        if wait > 0:
+            LOGIN_RATE_LIMITED.inc(scope=scope)
+            raise TooManyRequests(
+                description="too many login attempts", retry_after=max(1, math.ceil(wait))
+            )
 
 
 @app.route("/api/login", methods=["POST"])
@@ -219,19 +1944,38 @@ def api_login():
     password = payload.get("password", "")
     if not userid or not password:
         abort(400, description="userid and password are required")
+    limiters = _get_login_limiters()
+    ip = request.remote_addr or "unknown"
+    if limiters is not None:
+        _throttle_login(limiters, ip, userid)
     user_data = get_db().execute(
-        "select password from user where userid = ?", [userid, ]
+        "select password, role, household, auth_epoch from user where userid = ?", [userid, ]
     ).fetchone()
-    if user_data is not None and check_password_hash(user_data[0], password):
-        login_user(User(userid))
+    hasher = _get_password_hasher()
+    if user_data is not None and _run_hasher(hasher.verify, user_data[0], password):
+        if hasher.needs_rehash(user_data[0]):
+            # 現在のアルゴリズム/反復回数で保存し直す（並行ログインで上書き合戦にならないよう旧値を条件にする）
+            params = [_run_hasher(hasher.hash, password), userid, user_data[0]]
+            run_write(lambda conn: conn.execute(
+                "update user set password = ? where userid = ? and password = ?", params
+            ).rowcount)
+        if limiters is not None:
+            # 同じIP（家庭のNAT等）の家族の打ち間違いが積み重ならないよう、IP側も失敗回数を戻す。
+            # 成功できるのはロック中でないときだけで、トークンバケットの残量は戻さない
+            limiters[0].success(ip)
+            limiters[1].success(userid)
+        login_user(_store_session_auth(userid, user_data))
         return jsonify({"status": "ok", "userid": userid})
+    if limiters is not None:
+        limiters[0].failure(ip)
+        limiters[1].failure(userid)
     abort(401, description="invalid credentials")
 
 
 @app.route("/api/logout", methods=["POST"])
 @login_required
 def api_logout():
-    logout_user()
+    _logout()
     return jsonify({"status": "ok"})
 
 
@@ -243,7 +1987,6 @@ def api_signup():
     if not userid or not password:
         abort(400, description="userid and password are required")
 
-    pass_hash = generate_password_hash(password, method='pbkdf2:sha256')
     db = get_db()
     user_check = db.execute(
         "select userid from user where userid = ?", [userid, ]
@@ -253,7 +1996,7 @@ def api_signup():
 
     invite = db.execute(
         """
-        select role, is_active, used_at from allowed_users
+        select role, household, is_active, used_at from allowed_users
         where userid = ?
         """,
         [userid],
@@ -264,52 +2007,222 @@ def api_signup():
         abort(409, description="invitation already used")
 
     role = invite["role"] if invite["role"] else "member"
-    db.execute(
-        "insert into user (userid, password, role) values(?, ?, ?)",
-        [userid, pass_hash, role]
-    )
-    db.execute(
-        "update allowed_users set used_at = ? where userid = ?",
-        [now_jst(), userid],
-    )
-    db.commit()
-    return jsonify({"status": "ok", "userid": userid, "role": role}), 201
+    # 招待で世帯を指定しなければ、本人だけの世帯を作る
+    household = invite["household"] or userid
+    # 招待の確認が済んでからハッシュ化し、拒否されるリクエストで計算資源を使わない
+    pass_hash = _run_hasher(_get_password_hasher().hash, password)
+
+    def write(conn):
+        # ハッシュ計算の間に同じ招待で登録されていないかを、書き込みと同じトランザクションで確かめ直す
+        claimed = conn.execute(
+            """
+            update allowed_users set used_at = ?
+            where userid = ? and is_active = 1 and used_at is null
+            """,
+            [now_jst(), userid],
+        ).rowcount
+        if not claimed:
+            return False
+        conn.execute(
+            "insert into user (userid, password, role, household) values(?, ?, ?, ?)",
+            [userid, pass_hash, role, household]
+        )
+        return True
+
+    try:
+        created = run_write(write)
+    except sqlite3.IntegrityError:
+        abort(409, description="userid already exists")
+    if not created:
+        abort(409, description="invitation already used")
+    return jsonify({"status": "ok", "userid": userid, "role": role, "household": household}), 201
 
 
 @app.errorhandler(404)
 def spa_fallback(error):
     request_path = request.path
-    if request_path.startswith("/api"):
+    if request_path.startswith(("/api", "/assets/", "/media/")):
+        # 存在しないアセット・画像にHTMLを返すとブラウザがJS/CSS・画像として解釈しようとするため、素の404にする
         return error
 
     return _serve_react_index()
 
 
-if __name__ == "__main__":
-    app.run()
-    
 # database
-def connect_db():
+_migrated_databases: set[str] = set()
+_migration_lock = threading.Lock()
+
+
+def _prepare_database(db_path: str) -> None:
+    # スキーマ確認はプロセスごと・DBごとに一度だけ。以降のリクエストでは集合の参照のみ
+    if db_path in _migrated_databases:
+        return
+    with _migration_lock:
+        if db_path in _migrated_databases:
+            return
+        if current_app.config.get("SCHEMA_AUTO_MIGRATE", True):
+            started = time.perf_counter()
+            with closing(sqlite3.connect(db_path)) as conn:
+                conn.row_factory = sqlite3.Row
+                ensure_schema(conn)
+            SCHEMA_MIGRATION_SECONDS.set(
+                time.perf_counter() - started, db=os.path.basename(db_path)
+            )
+        _migrated_databases.add(db_path)
+
+
+_pools: dict[str, ConnectionPool] = {}
+_writers: dict[str, GroupCommitWriter] = {}
+_pools_lock = threading.Lock()
+
+
+def _record_write_batch(size: int, seconds: float) -> None:
+    WRITE_BATCH_SIZE.observe(size)
+    WRITE_COMMIT_LATENCY.observe(seconds)
+
+
+def _get_writer() -> GroupCommitWriter:
+    db_path = current_app.config.get("DATABASE", DATABASE)
+    writer = _writers.get(db_path)
+    if writer is not None:
+        return writer
+    _prepare_database(db_path)
+    config = current_app.config
+    pragmas = {
+        "journal_mode": config.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": config.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": config.get("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "cache_size": config.get("SQLITE_CACHE_SIZE", -16000),
+    }
+    with _pools_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            # gunicorn のfork後、ワーカーごとに最初の利用時に生成する（スレッドはfork後に作る必要がある）
+            writer = GroupCommitWriter(
+                db_path,
+                pragmas=pragmas,
+                factory=InstrumentedConnection,
+                max_batch=config.get("SQLITE_WRITE_BATCH_MAX", 64),
+                max_pending=config.get("SQLITE_WRITE_QUEUE_SIZE", 1024),
+                on_commit=_record_write_batch,
+            )
+            _writers[db_path] = writer
+    return writer
+
+
+def run_write(fn):
+    """fn(conn) を書き込みスレッドで実行し、同時に届いた書き込みとまとめてコミットした後に結果を返す。
+
+    fn はアプリ・リクエストのコンテキスト外で動くため、current_user などは呼び出し前に値として取り出しておく。
+    """
+    writer = _get_writer()
+    try:
+        return writer.run(fn, timeout=current_app.config.get("SQLITE_WRITE_TIMEOUT", 10.0))
+    except WriterBusy:
+        abort(503, description="database is busy")
+
+
+def close_writers() -> None:
+    with _pools_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def _get_pool() -> ConnectionPool:
+    # 読み取り専用（mode=ro）の接続プール。書き込みはすべて run_write を通す
     db_path = current_app.config.get("DATABASE", DATABASE) # 使用するDBを切り替え可能に
-    rv = sqlite3.connect(db_path)
-    rv.row_factory = sqlite3.Row
-    ensure_schema(rv)
-    return rv
+    pool = _pools.get(db_path)
+    if pool is not None:
+        return pool
+    # 先に書き込み役を作り、スキーマの更新とWALへの切り替えを済ませておく
+    _get_writer()
+    config = current_app.config
+    pragmas = {
+        "busy_timeout": config.get("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "mmap_size": config.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        "cache_size": config.get("SQLITE_CACHE_SIZE", -16000),
+    }
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(
+                db_path,
+                size=config.get("SQLITE_POOL_SIZE", 8),
+                timeout=config.get("SQLITE_POOL_TIMEOUT", 10.0),
+                pragmas=pragmas,
+                factory=InstrumentedConnection,
+                read_only=True,
+            )
+            _pools[db_path] = pool
+    InstrumentedConnection.observer.slow_threshold = config.get("SLOW_QUERY_MS", 100) / 1000
+    return pool
+
+
+_recipe_caches: dict[str, RecipeCache] = {}
+
+
+def recipe_cache_generation_path(db_path: str) -> str:
+    # 既定の世代ファイル。同じDBを使うgunicornワーカー・CLIはこのファイルを介してキャッシュの無効化を共有する
+    return f"{db_path}-cache-generation"
+
+
+def bump_recipe_cache_generation(db_path: str) -> None:
+    """アプリの外（CLIの取り込み・復元など）でレシピを書き換えた後に呼び、稼働中のワーカーのキャッシュを捨てさせる。"""
+    FileGeneration(recipe_cache_generation_path(db_path)).bump()
+
+
+def _get_recipe_cache() -> RecipeCache:
+    db_path = current_app.config.get("DATABASE", DATABASE)
+    cache = _recipe_caches.get(db_path)
+    if cache is not None:
+        return cache
+    config = current_app.config
+    # 空文字を設定した場合のみプロセス内の世代にする（単一プロセスで動かす場合）
+    shared_path = config.get("RECIPE_CACHE_SHARED_PATH", recipe_cache_generation_path(db_path))
+    generation = FileGeneration(shared_path) if shared_path else LocalGeneration()
+    enabled = config.get("RECIPE_CACHE_ENABLED", True)
+    with _pools_lock:
+        cache = _recipe_caches.get(db_path)
+        if cache is None:
+            cache = RecipeCache(
+                maxsize=config.get("RECIPE_CACHE_SIZE", 1024) if enabled else 0,
+                list_maxsize=config.get("RECIPE_LIST_CACHE_SIZE", 32) if enabled else 0,
+                generation=generation,
+            )
+            _recipe_caches[db_path] = cache
+    return cache
+
+
+def connect_db():
+    pool = _get_pool()
+    try:
+        return pool, pool.acquire()
+    except PoolTimeout:
+        abort(503, description="database is busy")
+
 
 def get_db():
+    # 読み取り専用の接続。書き込むと sqlite3.OperationalError になる
     if not hasattr(g, 'sqlite_db'):
-        g.sqlite_db = connect_db()
+        g.sqlite_pool, g.sqlite_db = connect_db()
     return g.sqlite_db
 
 
 @app.teardown_appcontext
 def close_db(error=None):
-    sqlite_db = getattr(g, "sqlite_db", None)
+    sqlite_db = g.pop("sqlite_db", None)
     if sqlite_db is not None:
-        sqlite_db.close()
+        # 接続は閉じずにプールへ返却し、次のリクエストで再利用する
+        g.pop("sqlite_pool").release(sqlite_db)
 
 
-def ensure_schema(conn):
+def _table_columns(conn, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info('{table}')")}
+
+
+def _migration_base_tables(conn):
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS user (
@@ -320,9 +2233,7 @@ def ensure_schema(conn):
         )
         """
     )
-
-    user_columns = [row["name"] for row in conn.execute("PRAGMA table_info('user')")]  # type: ignore[index]
-    if "role" not in user_columns:
+    if "role" not in _table_columns(conn, "user"):
         conn.execute("ALTER TABLE user ADD COLUMN role TEXT NOT NULL DEFAULT 'member'")
 
     conn.execute(
@@ -351,55 +2262,454 @@ CREATE TABLE IF NOT EXISTS recipe (
         """
     )
 
-    recipe_columns = {row["name"] for row in conn.execute("PRAGMA table_info('recipe')")}  # type: ignore[index]
-    required_columns = {"id", "title", "ingredients", "steps", "notes"}
-    needs_migration = False
-    if not required_columns.issubset(recipe_columns):
-        needs_migration = True
-    if "body" in recipe_columns:
-        needs_migration = True
 
-    if needs_migration:
+def _migration_recipe_sections(conn):
+    # 旧スキーマ(body列のみ)のレシピを ingredients/steps/notes 構成へ移行する
+    columns = _table_columns(conn, "recipe")
+    for column in ("ingredients", "steps", "notes"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE recipe ADD COLUMN {column} text")
+    if "body" in columns:
         conn.execute(
             """
-CREATE TABLE IF NOT EXISTS recipe__new (
+            UPDATE recipe
+            SET ingredients = COALESCE(NULLIF(ingredients,''), NULLIF(body,''), '')
+            """
+        )
+        conn.execute("ALTER TABLE recipe DROP COLUMN body")
+    for column in ("steps", "notes"):
+        if column not in columns:
+            conn.execute(f"UPDATE recipe SET {column} = '' WHERE {column} IS NULL")
+
+
+RECIPE_FTS_TRIGGERS = (
+    """
+CREATE TRIGGER IF NOT EXISTS recipe_fts_ai AFTER INSERT ON recipe BEGIN
+    INSERT INTO recipe_fts(rowid, title, ingredients, steps, notes)
+    VALUES (new.id, new.title, new.ingredients, new.steps, new.notes);
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS recipe_fts_ad AFTER DELETE ON recipe BEGIN
+    INSERT INTO recipe_fts(recipe_fts, rowid, title, ingredients, steps, notes)
+    VALUES ('delete', old.id, old.title, old.ingredients, old.steps, old.notes);
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS recipe_fts_au AFTER UPDATE ON recipe BEGIN
+    INSERT INTO recipe_fts(recipe_fts, rowid, title, ingredients, steps, notes)
+    VALUES ('delete', old.id, old.title, old.ingredients, old.steps, old.notes);
+    INSERT INTO recipe_fts(rowid, title, ingredients, steps, notes)
+    VALUES (new.id, new.title, new.ingredients, new.steps, new.notes);
+END
+    """,
+)
+
+
+def _migration_recipe_fts(conn):
+    rebuild = False
+    exists = conn.execute(
+        "select 1 from sqlite_master where type = 'table' and name = 'recipe_fts'"
+    ).fetchone()
+    if exists is None:
+        try:
+            conn.execute(
+                """
+CREATE VIRTUAL TABLE recipe_fts USING fts5(
+    title, ingredients, steps, notes,
+    content='recipe', content_rowid='id', tokenize='trigram'
+)
+                """
+            )
+        except sqlite3.OperationalError as exc:
+            # FTS5/trigram 非対応のSQLiteでは検索APIだけを無効にして起動を継続する
+            logging.getLogger(__name__).warning("recipe_fts is disabled: %s", exc)
+            return
+        rebuild = True
+
+    for statement in RECIPE_FTS_TRIGGERS:
+        conn.execute(statement)
+    if rebuild:
+        conn.execute("INSERT INTO recipe_fts(recipe_fts) VALUES ('rebuild')")
+
+
+def _migration_change_tracking(conn):
+    # レシピ単位の version/updated_at と、テーブル全体の変更カウンタ(ETag用)
+    columns = _table_columns(conn, "recipe")
+    if "version" not in columns:
+        conn.execute("ALTER TABLE recipe ADD COLUMN version integer not null default 1")
+    if "updated_at" not in columns:
+        conn.execute("ALTER TABLE recipe ADD COLUMN updated_at text")
+    conn.execute("UPDATE recipe SET updated_at = ? WHERE updated_at IS NULL", [now_jst()])
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS table_change (
+    name text primary key,
+    seq integer not null default 0,
+    changed_at text not null
+)
+        """
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO table_change (name, seq, changed_at) VALUES ('recipe', 0, ?)",
+        [now_jst()],
+    )
+
+
+def _migration_recipe_ingredients(conn):
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS recipe_ingredient (
+    recipe_id integer not null,
+    name text not null,
+    position integer not null default 0,
+    primary key (recipe_id, name)
+) WITHOUT ROWID
+        """
+    )
+    # 材料名 -> レシピ の転置インデックス
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_ingredient_name ON recipe_ingredient (name, recipe_id)"
+    )
+    conn.execute(
+        """
+CREATE TRIGGER IF NOT EXISTS recipe_ingredient_ad AFTER DELETE ON recipe BEGIN
+    DELETE FROM recipe_ingredient WHERE recipe_id = old.id;
+END
+        """
+    )
+    conn.execute("DELETE FROM recipe_ingredient")
+    cursor = conn.execute("SELECT id, ingredients FROM recipe")
+    while True:
+        rows = cursor.fetchmany(RECIPE_STREAM_FETCH_SIZE)
+        if not rows:
+            break
+        # この時点の recipe_ingredient には household 列が無い（マイグレーション15で追加）
+        conn.executemany(
+            "insert or ignore into recipe_ingredient (recipe_id, name, position) values (?, ?, ?)",
+            _ingredient_rows([(row[0], row[1]) for row in rows]),
+        )
+
+
+RECIPE_TAG_TRIGGERS = (
+    """
+CREATE TRIGGER IF NOT EXISTS recipe_tag_ai AFTER INSERT ON recipe_tag BEGIN
+    UPDATE tag SET recipe_count = recipe_count + 1 WHERE id = new.tag_id;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS recipe_tag_ad AFTER DELETE ON recipe_tag BEGIN
+    UPDATE tag SET recipe_count = recipe_count - 1 WHERE id = old.tag_id;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS recipe_tag_recipe_ad AFTER DELETE ON recipe BEGIN
+    DELETE FROM recipe_tag WHERE recipe_id = old.id;
+END
+    """,
+)
+
+
+def _migration_recipe_tags(conn):
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS tag (
     id integer primary key autoincrement,
-    title text not null,
-    ingredients text,
-    steps text,
-    notes text
+    name text not null unique,
+    recipe_count integer not null default 0
+)
+        """
+    )
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS recipe_tag (
+    recipe_id integer not null,
+    tag_id integer not null,
+    primary key (recipe_id, tag_id)
+) WITHOUT ROWID
+        """
+    )
+    # タグ -> レシピ の逆引き（?tag= の絞り込み用）
+    conn.execute("CREATE INDEX IF NOT EXISTS recipe_tag_tag ON recipe_tag (tag_id, recipe_id)")
+    # 使用件数は付け外しのたびに増減させ、/api/tags で COUNT(*) しない
+    for statement in RECIPE_TAG_TRIGGERS:
+        conn.execute(statement)
+
+
+def _migration_recipe_revisions(conn):
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS recipe_revision (
+    recipe_id integer not null,
+    version integer not null,
+    kind text not null check (kind in ('snapshot', 'delta')),
+    data blob not null,
+    created_at text not null,
+    primary key (recipe_id, version)
+) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+CREATE TRIGGER IF NOT EXISTS recipe_revision_ad AFTER DELETE ON recipe BEGIN
+    DELETE FROM recipe_revision WHERE recipe_id = old.id;
+END
+        """
+    )
+    # 既存レシピは現在の版を起点のスナップショットとして記録する（owner 等の後続の列はまだ無い）
+    cursor = conn.execute(
+        f"SELECT id, title, ingredients, steps, notes, version, updated_at, {RECIPE_TAGS_SQL} FROM recipe"
+    )
+    # CLIからは row_factory 無しの接続で呼ばれるため、列名は description から取る
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(RECIPE_STREAM_FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            _record_revision(conn, _row_to_recipe(dict(zip(columns, row)), columns))
+
+
+def _migration_recipe_change_feed(conn):
+    if "change_seq" not in _table_columns(conn, "recipe"):
+        # 既存行は既定値1（= 全件取得の since=0 で返る）とし、UPDATE でFTSを再構築させない
+        conn.execute("ALTER TABLE recipe ADD COLUMN change_seq integer not null default 1")
+    conn.execute("UPDATE table_change SET seq = seq + 1 WHERE name = 'recipe'")
+    conn.execute("CREATE INDEX IF NOT EXISTS recipe_change_seq ON recipe (change_seq)")
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS recipe_tombstone (
+    recipe_id integer primary key,
+    change_seq integer not null,
+    deleted_at text not null
+)
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_tombstone_change_seq ON recipe_tombstone (change_seq)"
+    )
+    conn.execute(
+        f"""
+CREATE TRIGGER IF NOT EXISTS recipe_tombstone_ad AFTER DELETE ON recipe BEGIN
+    INSERT OR REPLACE INTO recipe_tombstone (recipe_id, change_seq, deleted_at)
+    VALUES (old.id, {PENDING_CHANGE_SEQ}, strftime('%Y-%m-%d %H:%M:%S', 'now', '+9 hours'));
+END
+        """
+    )
+
+
+def _migration_household_scope(conn):
+    # 既存のユーザ・レシピはすべて既定の世帯に入れ、移行前と同じく互いに見えるようにする
+    if "household" not in _table_columns(conn, "user"):
+        conn.execute(
+            f"ALTER TABLE user ADD COLUMN household text not null default '{DEFAULT_HOUSEHOLD}'"
+        )
+    if "household" not in _table_columns(conn, "allowed_users"):
+        conn.execute("ALTER TABLE allowed_users ADD COLUMN household text")
+    columns = _table_columns(conn, "recipe")
+    if "owner" not in columns:
+        conn.execute("ALTER TABLE recipe ADD COLUMN owner text")
+    if "household" not in columns:
+        conn.execute(
+            f"ALTER TABLE recipe ADD COLUMN household text not null default '{DEFAULT_HOUSEHOLD}'"
+        )
+    # 一覧(キーセット)と変更フィードは世帯を先頭にした複合インデックスで自世帯の範囲だけを読む
+    conn.execute("CREATE INDEX IF NOT EXISTS recipe_household_id ON recipe (household, id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_household_change_seq ON recipe (household, change_seq)"
+    )
+    conn.execute("DROP INDEX IF EXISTS recipe_change_seq")
+
+    if "household" not in _table_columns(conn, "recipe_tombstone"):
+        conn.execute(
+            "ALTER TABLE recipe_tombstone ADD COLUMN household text not null"
+            f" default '{DEFAULT_HOUSEHOLD}'"
+        )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_tombstone_household"
+        " ON recipe_tombstone (household, change_seq)"
+    )
+    conn.execute("DROP INDEX IF EXISTS recipe_tombstone_change_seq")
+    conn.execute("DROP TRIGGER IF EXISTS recipe_tombstone_ad")
+    conn.execute(
+        f"""
+CREATE TRIGGER recipe_tombstone_ad AFTER DELETE ON recipe BEGIN
+    INSERT OR REPLACE INTO recipe_tombstone (recipe_id, change_seq, deleted_at, household)
+    VALUES (
+        old.id, {PENDING_CHANGE_SEQ},
+        strftime('%Y-%m-%d %H:%M:%S', 'now', '+9 hours'), old.household
+    );
+END
+        """
+    )
+
+    # タグは世帯ごとの名前空間にし、/api/tags の件数に他の世帯のレシピを含めない。
+    # 一意制約を変えるため作り直す（件数トリガは tag を参照するので張り直す）
+    if "household" not in _table_columns(conn, "tag"):
+        conn.execute("DROP TRIGGER IF EXISTS recipe_tag_ai")
+        conn.execute("DROP TRIGGER IF EXISTS recipe_tag_ad")
+        conn.execute(
+            """
+CREATE TABLE tag_scoped (
+    id integer primary key autoincrement,
+    household text not null,
+    name text not null,
+    recipe_count integer not null default 0,
+    unique (household, name)
 )
             """
         )
+        conn.execute(
+            "INSERT INTO tag_scoped (id, household, name, recipe_count)"
+            " SELECT id, ?, name, recipe_count FROM tag",
+            [DEFAULT_HOUSEHOLD],
+        )
+        conn.execute("DROP TABLE tag")
+        conn.execute("ALTER TABLE tag_scoped RENAME TO tag")
+        for statement in RECIPE_TAG_TRIGGERS:
+            conn.execute(statement)
+    conn.execute("UPDATE table_change SET seq = seq + 1 WHERE name = 'recipe'")
+
+
+def _migration_auth_epoch(conn):
+    # ロール・世帯・パスワードを変えたら +1 し、それ以前に発行したセッションを無効にする
+    if "auth_epoch" not in _table_columns(conn, "user"):
+        conn.execute("ALTER TABLE user ADD COLUMN auth_epoch integer not null default 0")
+
+
+def _migration_recipe_photo(conn):
+    # 写真の保存名（<sha256>.<拡張子>）。ファイル本体は PHOTO_DIR 以下に置く
+    if "photo" not in _table_columns(conn, "recipe"):
+        conn.execute("ALTER TABLE recipe ADD COLUMN photo text")
+
+
+def _migration_recipe_photo_index(conn):
+    # 写真の配信時に「自分の世帯のレシピが参照しているか」を引く
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_household_photo ON recipe (household, photo)"
+        " WHERE photo IS NOT NULL"
+    )
+
+
+def _rebuild_recipe_grams(conn):
+    conn.execute("DELETE FROM recipe_gram")
+    cursor = conn.execute("SELECT household, id, title, ingredients FROM recipe")
+    while True:
+        rows = cursor.fetchmany(RECIPE_STREAM_FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            _insert_recipe_grams(conn, row[0], [tuple(row[1:])])
+
+
+def _migration_recipe_grams(conn):
+    # 1・2文字の部分文字列 -> レシピ の転置インデックス。trigram の全文検索で引けない短い語の検索に使う
+    conn.execute(
+        """
+CREATE TABLE IF NOT EXISTS recipe_gram (
+    household text not null,
+    gram text not null,
+    recipe_id integer not null,
+    primary key (household, gram, recipe_id)
+) WITHOUT ROWID
+        """
+    )
+    _rebuild_recipe_grams(conn)
+
+
+def _migration_recipe_gram_bounds(conn):
+    # 初期の recipe_gram は作り方・メモも含め、recipe_id の索引と削除トリガを持っていた。
+    # 対象をタイトル・材料に絞って作り直す（削除は delete_recipe が主キーで行う）
+    legacy = conn.execute(
+        "select 1 from sqlite_master where type = 'index' and name = 'recipe_gram_recipe'"
+    ).fetchone()
+    conn.execute("DROP TRIGGER IF EXISTS recipe_gram_ad")
+    conn.execute("DROP INDEX IF EXISTS recipe_gram_recipe")
+    if legacy is not None:
+        _rebuild_recipe_grams(conn)
+
+
+def _migration_recipe_ingredient_household(conn):
+    # 材料の逆引きを世帯ごとの posting list にする（他の世帯の分を読んでから捨てないように）
+    if "household" not in _table_columns(conn, "recipe_ingredient"):
+        conn.execute(
+            "ALTER TABLE recipe_ingredient ADD COLUMN household text not null"
+            f" default '{DEFAULT_HOUSEHOLD}'"
+        )
+        conn.execute(
+            "UPDATE recipe_ingredient SET household ="
+            " (SELECT household FROM recipe WHERE recipe.id = recipe_ingredient.recipe_id)"
+        )
+    conn.execute("DROP INDEX IF EXISTS recipe_ingredient_name")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_ingredient_household_name"
+        " ON recipe_ingredient (household, name, recipe_id)"
+    )
+
+
+# (バージョン, 内容) の順に追記していく。適用済みバージョンは PRAGMA user_version に記録する
+MIGRATIONS = (
+    (1, _migration_base_tables),
+    (2, _migration_recipe_sections),
+    (3, _migration_recipe_fts),
+    (4, _migration_change_tracking),
+    (5, _migration_recipe_ingredients),
+    (6, _migration_recipe_tags),
+    (7, _migration_recipe_revisions),
+    (8, _migration_recipe_change_feed),
+    (9, _migration_household_scope),
+    (10, _migration_auth_epoch),
+    (11, _migration_recipe_photo),
+    (12, _migration_recipe_photo_index),
+    (13, _migration_recipe_grams),
+    (14, _migration_recipe_gram_bounds),
+    (15, _migration_recipe_ingredient_household),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
 
-        colset = recipe_columns
-
-        def has(column: str) -> bool:
-            return column in colset
-
-        if has("ingredients") and has("body"):
-            ingredients_expr = "COALESCE(NULLIF(ingredients,''), NULLIF(body,''), '')"
-        elif has("ingredients"):
-            ingredients_expr = "COALESCE(NULLIF(ingredients,''), '')"
-        elif has("body"):
-            ingredients_expr = "COALESCE(NULLIF(body,''), '')"
-        else:
-            ingredients_expr = "''"
-
-        steps_expr = "steps" if has("steps") else "''"
-        notes_expr = "notes" if has("notes") else "''"
-
-        select_query = f"""
-            INSERT INTO recipe__new (id, title, ingredients, steps, notes)
-            SELECT id,
-                   title,
-                   {ingredients_expr} AS ingredients,
-                   {steps_expr} AS steps,
-                   {notes_expr} AS notes
-            FROM recipe
-        """
-        conn.execute(select_query)
-        conn.execute("DROP TABLE recipe")
-        conn.execute("ALTER TABLE recipe__new RENAME TO recipe")
-
-    conn.commit()
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def ensure_schema(conn) -> int:
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+    if conn.in_transaction:
+        conn.commit()
+    # 複数プロセスが同時に起動しても二重適用しないよう、書き込みロックを取ってから再確認する
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = schema_version(conn)
+        for version, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            current = version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return current
+
+
+db_cli = AppGroup("db", help="Manage the SQLite schema.")
+
+
+@db_cli.command("upgrade")
+def db_upgrade_command():
+    db_path = current_app.config.get("DATABASE", DATABASE)
+    with closing(sqlite3.connect(db_path)) as conn:
+        before = schema_version(conn)
+        after = ensure_schema(conn)
+    _migrated_databases.add(db_path)
+    click.echo(f"{db_path}: schema version {before} -> {after}")
+
+
+app.cli.add_command(db_cli)
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,234 @@
+"""
+実行例: uvicorn asgi:app --workers 2 （または gunicorn -k uvicorn.workers.UvicornWorker asgi:app）
+概要: レシピAPIのASGIエントリポイント。本文の受信・送信はイベントループ上で非同期に行い、Flaskのビュー（SQLite・ハッシュ計算の待ち）は上限付きスレッドプールで実行する。
+      本文がアプリの上限（app.request_body_limit）を超える要求は、受け取り終える前に 413 で断る。
+"""
+
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from app import app as flask_app, close_writers, request_body_limit
+
+# これを超えるリクエスト本文（一括取り込み等）はメモリではなく一時ファイルに溜める
+SPOOL_MAX_MEMORY = 1024 * 1024
+# スレッドとイベントループの往復を減らすため、レスポンス本文はこの大きさまでまとめて送る
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+def _read_chunks(iterator, limit: int = RESPONSE_CHUNK_SIZE) -> tuple[bytes, bool]:
+    chunks = []
+    size = 0
+    for chunk in iterator:
+        if chunk:
+            chunks.append(chunk)
+            size += len(chunk)
+        if size >= limit:
+            return b"".join(chunks), False
+    return b"".join(chunks), True
+
+
+async def _send_too_large(send, limit: int) -> None:
+    body = f"request body must be at most {limit} bytes".encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AsgiBridge:
+    """WSGIアプリをASGIサーバから呼び出す。遅いクライアントとの送受信ではスレッドを占有しない。"""
+
+    def __init__(
+        self,
+        wsgi_app,
+        threads: int | Callable[[], int] = 16,
+        on_shutdown: list[Callable[[], None]] | None = None,
+        chunk_size: int = RESPONSE_CHUNK_SIZE,
+        body_limit: Callable[[str], int | None] | None = None,
+    ) -> None:
+        self.wsgi_app = wsgi_app
+        # パスごとの本文の上限（バイト）。超える要求は受け取り終える前に 413 で断る
+        self.body_limit = body_limit
+        self.threads = threads
+        self.chunk_size = chunk_size
+        self.on_shutdown = on_shutdown or []
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # ワーカープロセスで最初のリクエストを受けたときに生成する（設定を読み込んだ後にするため）
+        if self._executor is None:
+            threads = self.threads() if callable(self.threads) else self.threads
+            self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi")
+        return self._executor
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for callback in self.on_shutdown:
+                    callback()
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _limit(self, scope) -> int | None:
+        if self.body_limit is None:
+            return None
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        return self.body_limit(path)
+
+    async def _http(self, scope, receive, send) -> None:
+        limit = self._limit(scope)
+        if limit is not None:
+            declared = next((value for name, value in scope.get("headers", []) if name == b"content-length"), None)
+            if declared is not None and declared.isdigit() and int(declared) > limit:
+                await _send_too_large(send, limit)
+                return
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        try:
+            # 本文を受け取り終えるまでスレッドは使わない。Content-Length の無い（chunked）要求も受信量で打ち切る
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body.write(message.get("body", b""))
+                if limit is not None and body.tell() > limit:
+                    await _send_too_large(send, limit)
+                    return
+                if not message.get("more_body", False):
+                    break
+            length = body.tell()
+            body.seek(0)
+            environ = self._environ(scope, body, length)
+
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            status, headers, iterable, iterator, chunk, done = await loop.run_in_executor(
+                executor, self._call_app, environ
+            )
+            try:
+                await send({
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": headers,
+                })
+                while True:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": not done})
+                    if done:
+                        break
+                    # ストリーミング応答は続きをスレッドで生成し、送信の待ちはイベントループで行う
+                    chunk, done = await loop.run_in_executor(executor, _read_chunks, iterator, self.chunk_size)
+            finally:
+                close = getattr(iterable, "close", None)
+                if close is not None:
+                    # ストリーミング中に切断された場合も、ここでプール接続などを解放させる
+                    await loop.run_in_executor(executor, close)
+        finally:
+            body.close()
+
+    def _call_app(self, environ):
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start["status"] = int(status.split(" ", 1)[0])
+            response_start["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+            ]
+            return lambda data: None
+
+        iterable = self.wsgi_app(environ, start_response)
+        iterator = iter(iterable)
+        try:
+            chunk, done = _read_chunks(iterator, self.chunk_size)
+        except BaseException:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+            raise
+        return response_start["status"], response_start["headers"], iterable, iterator, chunk, done
+
+    @staticmethod
+    def _environ(scope, body, length: int) -> dict:
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "CONTENT_LENGTH": str(length),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for raw_name, raw_value in scope.get("headers", []):
+            name = raw_name.decode("latin-1").upper().replace("-", "_")
+            value = raw_value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+                continue
+            if name == "CONTENT_LENGTH":
+                continue
+            key = f"HTTP_{name}"
+            if key in environ:
+                separator = "; " if key == "HTTP_COOKIE" else ","
+                value = f"{environ[key]}{separator}{value}"
+            environ[key] = value
+        return environ
+
+
+def _shutdown_password_hasher() -> None:
+    hasher, _ = flask_app.extensions.get("password_hasher", (None, None))
+    if hasher is not None:
+        hasher.shutdown()
+
+
+def _shutdown_photo_store() -> None:
+    store, _ = flask_app.extensions.get("photo_store", (None, None))
+    if store is not None:
+        store.shutdown()
+
+
+app = AsgiBridge(
+    flask_app,
+    threads=lambda: flask_app.config.get("ASGI_THREADS", 16),
+    on_shutdown=[_shutdown_password_hasher, _shutdown_photo_store, close_writers],
+    body_limit=request_body_limit,
+)
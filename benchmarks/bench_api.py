@@ -0,0 +1,452 @@
+"""
+実行例: python benchmarks/bench_api.py --users 5 --recipes 20000 --requests 200 --concurrency 4 --mode all --output bench_output.json
+概要: 日本語レシピを投入したSQLiteを用意し、Flaskテストクライアント・ローカルgunicorn(同期)・ASGI(uvicornワーカー)でAPIの負荷・レイテンシを計測してJSONで出力する。
+
+- 計測対象: login / list / list_summary(fields指定) / detail / create / update / delete
+- 出力: エンドポイントごとの p50/p95/p99/平均レイテンシ(ms)、スループット(req/s)、エラー数、ピークRSS(KiB)
+- ピークRSSは各フェーズ終了時点の最大常駐メモリ(VmHWM/ru_maxrss)で、プロセス起動からの累積値。
+- `--db` を指定すると投入済みのDBを再利用する（無ければ作成）。未指定時は一時ディレクトリに作成して破棄する。
+- `asgi` モードは uvicorn が必要（未インストール時はスキップ）。gunicorn と両方計測した場合は `comparison` に比率を出す。
+- コミット間で比較する場合は同じ `--seed` と件数で実行し、出力JSONを並べて差分を見る。
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import app as flask_app  # noqa: E402
+
+BENCH_PASSWORD = "bench-password"
+PHASES = ("login", "list", "list_summary", "detail", "create", "update", "delete")
+
+DISHES = [
+    "肉じゃが", "親子丼", "豚の生姜焼き", "鯖の味噌煮", "筑前煮", "麻婆豆腐", "ハンバーグ",
+    "カレーライス", "かぼちゃの煮物", "ほうれん草のおひたし", "茶碗蒸し", "鶏の唐揚げ",
+    "豚汁", "だし巻き卵", "きんぴらごぼう", "回鍋肉", "ぶり大根", "筑前炊き", "炊き込みご飯",
+    "ポテトサラダ", "オムライス", "焼きうどん", "冷しゃぶサラダ", "鮭のちゃんちゃん焼き",
+]
+DISH_PREFIXES = ["", "基本の", "簡単", "作り置き", "時短", "具だくさん", "ご飯がすすむ", "おばあちゃんの"]
+INGREDIENTS = [
+    "豚肉 200g", "鶏もも肉 1枚", "牛こま切れ肉 150g", "玉ねぎ 1個", "人参 1本", "じゃがいも 3個",
+    "キャベツ 1/4玉", "大根 1/3本", "ごぼう 1本", "長ねぎ 1本", "豆腐 1丁", "卵 2個", "しいたけ 4枚",
+    "醤油 大さじ2", "みりん 大さじ2", "酒 大さじ1", "砂糖 小さじ1", "味噌 大さじ1.5",
+    "だし汁 400ml", "生姜 1かけ", "にんにく 1片", "ごま油 小さじ1", "塩 少々", "こしょう 少々",
+    "片栗粉 大さじ1", "サラダ油 適量",
+]
+STEP_TEMPLATES = [
+    "{a}は食べやすい大きさに切り、{b}は薄切りにする。",
+    "鍋に{c}を熱し、{a}を中火で炒める。",
+    "{a}の色が変わったら{b}を加え、全体に油が回るまでさらに炒める。",
+    "{d}と{e}を加えて煮立たせ、アクを丁寧に取り除く。",
+    "落とし蓋をして弱火で{n}分ほど煮込む。途中で一度上下を返す。",
+    "火を止めてそのまま{n}分置き、味をしっかり含ませる。",
+    "フライパンに{c}を入れて強火で熱し、{a}を焼き色が付くまで焼く。",
+    "合わせ調味料（{d}・{e}）を回し入れ、汁気を飛ばしながら絡める。",
+    "器に盛り付け、お好みで刻んだ{b}を散らして完成。",
+    "粗熱が取れたら保存容器に移し、冷蔵庫で{n}日ほど保存できる。",
+]
+NOTES = [
+    "前日に作っておくと味がなじんでさらに美味しい。",
+    "子ども向けには砂糖を少し増やすと食べやすい。",
+    "圧力鍋を使う場合は加圧時間を半分にする。",
+    "冷凍保存する場合は小分けにしてラップで包む。",
+    "薄味なので、物足りなければ最後に醤油を少し足す。",
+]
+
+
+def _make_recipe(rng: random.Random, idx: int) -> dict:
+    ingredients = rng.sample(INGREDIENTS, rng.randint(5, 10))
+    names = [item.split()[0] for item in ingredients]
+    steps = []
+    for number in range(1, rng.randint(8, 20) + 1):
+        template = rng.choice(STEP_TEMPLATES)
+        steps.append(f"{number}. " + template.format(
+            a=rng.choice(names), b=rng.choice(names), c=rng.choice(["ごま油", "サラダ油", "バター"]),
+            d=rng.choice(names), e=rng.choice(names), n=rng.randint(2, 30),
+        ))
+    return {
+        "title": f"{rng.choice(DISH_PREFIXES)}{rng.choice(DISHES)} その{idx}",
+        "ingredients": " / ".join(ingredients),
+        "steps": "\n".join(steps),
+        "notes": " ".join(rng.sample(NOTES, rng.randint(0, 3))),
+    }
+
+
+def seed_database(db_path: str, users: int, recipes: int, seed: int, hash_method: str | None) -> None:
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.row_factory = sqlite3.Row
+        flask_app.ensure_schema(conn)
+        if conn.execute("select count(*) from recipe").fetchone()[0] >= recipes:
+            return
+        # 全ユーザ同じパスワードなのでハッシュは1回だけ計算する
+        pwhash = generate_password_hash(BENCH_PASSWORD, hash_method or "pbkdf2:sha256")
+        conn.executemany(
+            "insert or ignore into user (userid, password, role) values (?, ?, 'member')",
+            [(f"bench{idx}", pwhash) for idx in range(users)],
+        )
+        conn.commit()
+        records = ((idx, _make_recipe(rng, idx)) for idx in range(1, recipes + 1))
+        flask_app.import_recipes(conn, records, chunk_size=1000)
+
+
+def create_bench_app(db_path: str, hash_method: str | None = None):
+    # gunicorn から `bench_api:create_bench_app("...")` の形で呼び出す
+    # 同一IPから大量にログインするため、ログイン試行の制限は外す
+    flask_app.app.config.update(DATABASE=db_path, LOGIN_RATE_LIMIT_ENABLED=False)
+    if hash_method:
+        flask_app.app.config.update(PASSWORD_HASH_METHOD=hash_method)
+    return flask_app.app
+
+
+def create_bench_asgi_app(db_path: str, hash_method: str | None = None, threads: int = 16):
+    # gunicorn の uvicorn ワーカーから `bench_api:create_bench_asgi_app("...")` の形で呼び出す
+    create_bench_app(db_path, hash_method)
+    flask_app.app.config.update(ASGI_THREADS=threads)
+    import asgi
+
+    return asgi.app
+
+
+class FlaskClientDriver:
+    def __init__(self, app) -> None:
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, payload=None) -> tuple[int, bytes]:
+        resp = self.client.open(path, method=method, json=payload)
+        return resp.status_code, resp.get_data()
+
+    def close(self) -> None:
+        pass
+
+
+class HttpDriver:
+    def __init__(self, host: str, port: int) -> None:
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookie: str | None = None
+
+    def request(self, method: str, path: str, payload=None) -> tuple[int, bytes]:
+        headers = {}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        data = resp.read()
+        set_cookie = resp.getheader("Set-Cookie")
+        if set_cookie:
+            self.cookie = set_cookie.split(";", 1)[0]
+        return resp.status, data
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float, peak_rss_kib: int | None) -> dict:
+    values = sorted(ms * 1000 for ms in latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "mean_ms": sum(values) / len(values) if values else None,
+        "throughput_rps": len(values) / elapsed if elapsed > 0 else None,
+        "peak_rss_kib": peak_rss_kib,
+    }
+
+
+def _self_peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _proc_peak_rss(pids: list[int]) -> int | None:
+    peaks = []
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status", encoding="ascii") as fp:
+                for line in fp:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]))
+        except OSError:
+            continue
+    return max(peaks) if peaks else None
+
+
+def _child_pids(parent: int) -> list[int]:
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="ascii") as fp:
+                stat = fp.read()
+        except OSError:
+            continue
+        # 2列目のコマンド名に空白が入り得るため ')' 以降を分割する
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == parent:
+            children.append(int(entry))
+    return children
+
+
+def run_phases(make_driver, requests: int, concurrency: int, users: int, recipe_count: int,
+               peak_rss, seed: int) -> dict:
+    drivers = [make_driver() for _ in range(concurrency)]
+    for idx, driver in enumerate(drivers):
+        status, _ = driver.request(
+            "POST", "/api/login", {"userid": f"bench{idx % users}", "password": BENCH_PASSWORD}
+        )
+        if status != 200:
+            raise RuntimeError(f"login failed for bench{idx % users}: {status}")
+
+    created: list[int] = []
+    created_lock = threading.Lock()
+    results = {}
+
+    def build_ops(phase: str, rng: random.Random, count: int):
+        if phase == "login":
+            return [("POST", "/api/login", {"userid": f"bench{rng.randrange(users)}", "password": BENCH_PASSWORD})
+                    for _ in range(count)]
+        if phase == "list":
+            return [("GET", "/api/recipes?limit=50", None) for _ in range(count)]
+        if phase == "list_summary":
+            return [("GET", "/api/recipes?limit=50&fields=title,ingredients", None) for _ in range(count)]
+        if phase == "detail":
+            return [("GET", f"/api/recipes/{rng.randint(1, recipe_count)}", None) for _ in range(count)]
+        if phase == "create":
+            return [("POST", "/api/recipes", _make_recipe(rng, rng.randint(1, 10**6))) for _ in range(count)]
+        if phase == "update":
+            return [("PUT", f"/api/recipes/{rng.choice(created)}", _make_recipe(rng, rng.randint(1, 10**6)))
+                    for _ in range(count)] if created else []
+        if phase == "delete":
+            return [("DELETE", f"/api/recipes/{recipe_id}", None) for recipe_id in created[:count]]
+        raise ValueError(phase)
+
+    for phase in PHASES:
+        rng = random.Random(f"{seed}-{phase}")
+        # ログインはPBKDF2が重いため件数を抑える
+        count = max(requests // 10, concurrency) if phase == "login" else requests
+        ops = build_ops(phase, rng, count)
+        shards = [ops[idx::concurrency] for idx in range(concurrency)]
+        latencies: list[float] = []
+        errors = 0
+        lock = threading.Lock()
+
+        def worker(driver, shard):
+            nonlocal errors
+            local_latencies = []
+            local_errors = 0
+            for method, path, payload in shard:
+                started = time.perf_counter()
+                status, body = driver.request(method, path, payload)
+                local_latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    local_errors += 1
+                elif phase == "create":
+                    with created_lock:
+                        created.append(json.loads(body)["id"])
+            with lock:
+                latencies.extend(local_latencies)
+                errors += local_errors
+
+        threads = [threading.Thread(target=worker, args=(driver, shard)) for driver, shard in zip(drivers, shards)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        results[phase] = summarize(latencies, errors, elapsed, peak_rss())
+
+    for driver in drivers:
+        driver.close()
+    return results
+
+
+def _free_port() -> int:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def bench_flask_client(args, db_path: str) -> dict:
+    create_bench_app(db_path, args.password_hash_method)
+    return run_phases(
+        lambda: FlaskClientDriver(flask_app.app), args.requests, args.concurrency,
+        args.users, args.recipes, _self_peak_rss, args.seed,
+    )
+
+
+def bench_gunicorn(args, db_path: str) -> dict:
+    factory = f"bench_api:create_bench_app({db_path!r}, {args.password_hash_method!r})"
+    return _bench_server(args, factory, ["--threads", str(args.threads)])
+
+
+def bench_asgi(args, db_path: str) -> dict:
+    if importlib.util.find_spec("uvicorn") is None:
+        return {"skipped": "uvicorn is not installed"}
+    factory = (
+        f"bench_api:create_bench_asgi_app({db_path!r}, {args.password_hash_method!r}, {args.threads!r})"
+    )
+    # 同期版と同じワーカー数で比較する。ワーカーあたりの並列度はスレッドプール(ASGI_THREADS)で揃える
+    return _bench_server(args, factory, ["--worker-class", "uvicorn.workers.UvicornWorker"])
+
+
+def _bench_server(args, factory: str, worker_args: list[str]) -> dict:
+    port = _free_port()
+    cmd = [
+        sys.executable, "-m", "gunicorn",
+        "--workers", str(args.workers), *worker_args,
+        "--bind", f"127.0.0.1:{port}",
+        "--pythonpath", f"{ROOT_DIR},{ROOT_DIR / 'benchmarks'}",
+        "--log-level", "warning",
+        factory,
+    ]
+    proc = subprocess.Popen(cmd, cwd=ROOT_DIR)
+    try:
+        _wait_for_port(port, proc)
+        return run_phases(
+            lambda: HttpDriver("127.0.0.1", port), args.requests, args.concurrency,
+            args.users, args.recipes, lambda: _proc_peak_rss(_child_pids(proc.pid)), args.seed,
+        )
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+MODES = {
+    "flask_client": bench_flask_client,
+    "gunicorn": bench_gunicorn,
+    "asgi": bench_asgi,
+}
+
+
+def compare_modes(results: dict, baseline: str = "gunicorn", candidate: str = "asgi") -> dict | None:
+    # 1未満の p95_ratio / 1超の throughput_ratio が候補側の改善
+    base, other = results.get(baseline), results.get(candidate)
+    if not base or not other or "skipped" in base or "skipped" in other:
+        return None
+    comparison = {}
+    for phase in PHASES:
+        a, b = base.get(phase), other.get(phase)
+        if not a or not b:
+            continue
+        comparison[phase] = {
+            "p95_ratio": b["p95_ms"] / a["p95_ms"] if a["p95_ms"] else None,
+            "throughput_ratio": (
+                b["throughput_rps"] / a["throughput_rps"] if a["throughput_rps"] else None
+            ),
+        }
+    return {f"{candidate}_vs_{baseline}": comparison}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="レシピAPIの負荷・レイテンシ計測ツール。")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200, help="フェーズごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=[*MODES, "all"], default="all")
+    parser.add_argument("--workers", type=int, default=2, help="gunicornのワーカー数")
+    parser.add_argument("--threads", type=int, default=4, help="gunicornのワーカーあたりスレッド数（asgiではスレッドプールの大きさ）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=None, help="投入済みDBのパス（無ければ作成）")
+    parser.add_argument(
+        "--password-hash-method",
+        default=None,
+        help="計測用ユーザのハッシュ方式（既定はアプリの設定）",
+    )
+    parser.add_argument("--output", default=None, help="結果JSONの出力先（既定は標準出力）")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = build_parser().parse_args(argv)
+    modes = list(MODES) if args.mode == "all" else [args.mode]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = args.db or os.path.join(tmp_dir, "bench.db")
+        seed_database(db_path, args.users, args.recipes, args.seed, args.password_hash_method)
+        report = {
+            "meta": {
+                "revision": _git_revision(),
+                "timestamp": datetime.now(flask_app.JST).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "params": {k: v for k, v in vars(args).items() if k not in ("output",)},
+            },
+            "results": {},
+        }
+        for mode in modes:
+            # 計測モードごとに別コピーのDBを使い、前のモードの書き込みの影響を受けないようにする
+            mode_db = os.path.join(tmp_dir, f"{mode}.db")
+            with closing(sqlite3.connect(db_path)) as src, closing(sqlite3.connect(mode_db)) as dst:
+                src.backup(dst)
+            report["results"][mode] = MODES[mode](args, mode_db)
+        comparison = compare_modes(report["results"])
+        if comparison is not None:
+            report["comparison"] = comparison
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -75,12 +75,24 @@ const HomePage = () => {
               {recipes.map((recipe) => (
                 <li key={recipe.id} className="rounded border border-slate-200 bg-white shadow-sm">
                   <div className="flex items-center justify-between px-4 py-3">
-                    <Link
-                      to={`/recipes/${recipe.id}`}
-                      className="text-base font-medium text-slate-900 underline-offset-2 hover:underline"
-                    >
-                      {recipe.title}
-                    </Link>
+                    <div className="flex items-center gap-3">
+                      {recipe.photo && (
+                        <img
+                          src={recipe.photo.thumbnail_url}
+                          alt=""
+                          loading="lazy"
+                          width={80}
+                          height={60}
+                          className="h-[3.75rem] w-20 rounded object-cover"
+                        />
+                      )}
+                      <Link
+                        to={`/recipes/${recipe.id}`}
+                        className="text-base font-medium text-slate-900 underline-offset-2 hover:underline"
+                      >
+                        {recipe.title}
+                      </Link>
+                    </div>
                     <div className="flex items-center gap-2 text-sm font-medium">
                       <Link
                         to={`/recipes/${recipe.id}/edit`}
@@ -3,10 +3,17 @@
 概要: フロントエンドで共有する型定義をまとめるユーティリティモジュール。
 */
 
+export type RecipePhoto = {
+  url: string;
+  thumbnail_url: string;
+};
+
 export type Recipe = {
   id: number;
   title: string;
   ingredients: string;
   steps: string;
   notes: string;
+  tags: string[];
+  photo?: RecipePhoto | null;
 };
@@ -0,0 +1,242 @@
+"""
+実行例: from db_pool import ConnectionPool, GroupCommitWriter; pool = ConnectionPool("recipe_memo.db", read_only=True)
+概要: リクエスト間で再利用するSQLite接続プールと、書き込みを1スレッドに集めてまとめてコミットする書き込み役。接続ごとのPRAGMA設定(WAL等)は生成時に一度だけ行う。
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Mapping
+
+DEFAULT_PRAGMAS: dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # 負数はKiB単位(約16MB)
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class WriterBusy(Exception):
+    pass
+
+
+def _open_connection(
+    path: str,
+    pragmas: Mapping[str, Any],
+    factory: type[sqlite3.Connection],
+    read_only: bool = False,
+    **kwargs,
+) -> sqlite3.Connection:
+    if read_only:
+        # mode=ro の接続は書き込みロックを取らないため、書き込み役のトランザクションと競合しない
+        conn = sqlite3.connect(
+            f"{Path(path).absolute().as_uri()}?mode=ro",
+            uri=True, check_same_thread=False, factory=factory, **kwargs,
+        )
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, factory=factory, **kwargs)
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        if value is None:
+            continue
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    """上限付きの接続プール。貸し出し中の接続数は `size` を超えない。"""
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 8,
+        timeout: float = 10.0,
+        pragmas: Mapping[str, Any] | None = None,
+        factory: type[sqlite3.Connection] = sqlite3.Connection,
+        read_only: bool = False,
+    ) -> None:
+        self.path = path
+        self.factory = factory
+        self.read_only = read_only
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        # 直近に返却された接続から再利用してページキャッシュを温かく保つ
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        return _open_connection(self.path, self.pragmas, self.factory, self.read_only)
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise PoolTimeout(f"pool for {self.path} is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no connection available for {self.path}")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                # コミットされずに返却された変更は次の利用者へ持ち越さない
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class GroupCommitWriter:
+    """プロセス内の書き込みを1本のスレッド・1本の接続で直列に実行する。
+
+    submit された fn(conn) は、待ち行列にたまっている他の書き込みと同じトランザクションで
+    それぞれ SAVEPOINT 内で実行し、まとめて1回コミットする（fsync も1回で済む）。
+    fn が例外を投げた場合はその fn の変更だけを取り消し、例外は呼び出し側の Future に返す。
+    fn の中でコミット・ロールバックしてはいけない。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        pragmas: Mapping[str, Any] | None = None,
+        factory: type[sqlite3.Connection] = sqlite3.Connection,
+        max_batch: int = 64,
+        max_pending: int = 1024,
+        on_commit: Callable[[int, float], None] | None = None,
+    ) -> None:
+        self.path = path
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self.logger = logging.getLogger(__name__)
+        # 読み取り用の接続より先に開き、journal_mode=WAL をファイルに設定しておく
+        self._conn = _open_connection(
+            path, DEFAULT_PRAGMAS if pragmas is None else pragmas, factory, isolation_level=None
+        )
+        self._jobs: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        if self._closed:
+            raise WriterBusy(f"writer for {self.path} is closed")
+        future: Future = Future()
+        try:
+            self._jobs.put_nowait((future, fn))
+        except queue.Full:
+            raise WriterBusy(f"too many pending writes for {self.path}") from None
+        return future
+
+    def run(self, fn: Callable[[sqlite3.Connection], Any], timeout: float | None = None) -> Any:
+        """fn をコミットまで終えて結果を返す。時間内に始まらなければ取り消して WriterBusy を投げる。"""
+        future = self.submit(fn)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise WriterBusy(f"write to {self.path} timed out") from None
+        # 実行が始まっていれば、コミットされたかどうかを返すまで待つ
+        return future.result()
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        # 受付済みの書き込みは実行してから止める
+        if self._closed:
+            return
+        self._closed = True
+        self._jobs.put((None, None))
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._conn.close()
+
+    def _run(self) -> None:
+        while True:
+            jobs = [self._jobs.get()]
+            # 先頭の書き込みを待つ間・前回のコミット中に届いた分をまとめる
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(future is None for future, _ in jobs)
+            jobs = [
+                (future, fn) for future, fn in jobs
+                if future is not None and future.set_running_or_notify_cancel()
+            ]
+            if jobs:
+                self._commit_batch(jobs)
+            if stop:
+                return
+
+    def _commit_batch(self, jobs) -> None:
+        conn = self._conn
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, fn in jobs:
+                conn.execute("SAVEPOINT write_job")
+                try:
+                    result = fn(conn)
+                except Exception as exc:
+                    if not conn.in_transaction:
+                        # ディスク満杯などでSQLiteがトランザクションごと破棄した。まとめた全件を失敗にする
+                        raise
+                    conn.execute("ROLLBACK TO write_job")
+                    conn.execute("RELEASE write_job")
+                    outcomes.append((future, None, exc))
+                    continue
+                conn.execute("RELEASE write_job")
+                outcomes.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as exc:
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                # 書き込みスレッドは止めない。次のまとまりは新しいトランザクションで始める
+                pass
+            self.logger.warning("group commit of %d writes failed: %s", len(jobs), exc)
+            for future, _ in jobs:
+                future.set_exception(exc)
+            return
+        if self.on_commit is not None:
+            try:
+                self.on_commit(len(jobs), time.perf_counter() - started)
+            except Exception:
+                self.logger.exception("on_commit callback failed")
+        # 結果はコミットの後に返し、呼び出し側が読み取り用の接続で書き込みを確認できるようにする
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
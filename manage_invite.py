@@ -13,10 +13,14 @@
 2. 招待ユーザ投入
    - 例: `python manage_invite.py add --userid alice --email alice@example.com --role member`
    - 管理者用招待: `python manage_invite.py add --userid admin --email admin@example.com --role admin`
+   - 一括招待: `python manage_invite.py bulk-add --file invites.csv --dry-run` で差分を確認してから `--dry-run` を外して実行
+     （CSVは `userid,email,role,household` のヘッダ付き、またはNDJSON。全件を1トランザクションで登録し、既存の userid は
+     `--reactivate` 指定時のみ上書き。結果は件数のまとめで表示される）
    - `python manage_invite.py list-invites` で状態確認。
    - （ python manage_invite.py delete --userid alice で削除 ）
 
 3. サーバ起動
+   - スキーマ更新: `flask db upgrade`（未実行でも初回アクセス時に自動適用される）
    - Flask: `flask run`
    - （開発時は別ターミナルで）React: `npm run dev`
    - ブラウザで `http://127.0.0.1:5000/` または `5173` にアクセス。
@@ -30,6 +34,10 @@
    - `ログイン`画面でサインアップした `userid` とパスワードを入力。
    - 成功後、ホームに自動リダイレクト。ナビゲーションにログアウトボタンがある場合は動作も確認。
    - `python manage_invite.py set-user-role --userid alice --role admin` でロール変更後、再ログインして変化を検証（将来の管理UI開発時のベース動作）。
+   - レシピは世帯単位で共有される。家族を同じ世帯に招待: `python manage_invite.py add --userid bob --household tanaka`
+     （`--household` 省略時は userid と同名の世帯。既存ユーザ・既存レシピは移行時に `default` 世帯に入る）
+   - 登録済みユーザの世帯変更: `python manage_invite.py set-user-household --userid bob --household tanaka`
+   - ロール・世帯を変更すると `user.auth_epoch` が進み、変更前に発行したセッションは各ワーカーで最大 `AUTH_EPOCH_TTL`（既定30秒）以内に無効になる（再ログインが必要）。
 
 6. レシピ CRUD
    - 「レシピを登録」→ 料理名/材料を入力 → 保存。
@@ -47,9 +55,23 @@
    - `python manage_invite.py deactivate --userid admin` → その `userid` でサインアップしようとすると 403 になることを確認。
    - `python manage_invite.py list-invites` / `list-users` で最終状態を取得し、ログとして保存。
 
-9. 後片付け
+9. バックアップ / 復元
+   - 稼働中でも取得可: `python manage_invite.py backup --dir backups --compress --keep 14`
+     （`sqlite3.Connection.backup` で `--pages` ページずつコピーし、間に `--sleep` 秒休んで書き込みを止めない）
+   - 検証のみ: `python manage_invite.py restore --file backups/recipe_memo-20260101-030000-000000.db.gz --verify-only`
+   - 復元: `python manage_invite.py restore --file ... --force`（`PRAGMA integrity_check` が ok の場合のみ書き戻す）
+     - 古いスキーマのスナップショットは現行スキーマに更新してから書き戻す（アプリより新しいスキーマは拒否）。
+     - レシピの変更番号は復元前より大きい値に付け直すため、一覧のETagが過去の値と重ならず、同期クライアントは全件を取り直す。
+       復元前にだけあったレシピは削除記録として配信する。
+     - 全ユーザの `auth_epoch` を進め（再ログインが必要）、レシピキャッシュの世代ファイルを差し替える。
+     - 書き戻しは1回でコピーし、その間アプリの書き込みは待たされる。復元と同時に行われた書き込みは失われるため、
+       可能ならアプリを止めるか書き込みの少ない時間帯に実行する。
+
+10. 後片付け
    - 開発用DBを初期化したい場合は `rm flask_memo.db` などで削除（招待やユーザ登録がリセットされる）。
    - Render等にデプロイする際はサーバ上で同じスクリプトを実行して招待を投入。
+   - リバースプロキシの後ろで動かす場合（PythonAnywhere・Render等）は環境変数 `TRUSTED_PROXY_HOPS=1`（プロキシの段数）を設定し、
+     ログイン制限が全員共通のIPで掛からないようにする。
 
 備考
 - React Router v7 のFuture Warningは現時点では無視可能だが、将来のバージョンアップで`RouterProvider`の`future`設定を調整する。
@@ -57,11 +79,19 @@
 """
 
 import argparse
+import csv
+import gzip
+import itertools
+import json
 import os
+import shutil
 import sqlite3
+import tempfile
+import time
 from contextlib import closing
+from pathlib import Path
 from datetime import datetime, timezone, timedelta
-from typing import Any, Iterable
+from typing import IO, Any, Iterable, Iterator
 
 DATABASE_PATH = os.environ.get("DATABASE", "recipe_memo.db")
 JST = timezone(timedelta(hours=9))
@@ -72,44 +102,17 @@ def now_jst() -> str:
 
 
 def connect() -> sqlite3.Connection:
+    from app import ensure_schema
+
     conn = sqlite3.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
-    try:
-        from app import ensure_schema  # type: ignore
-    except ImportError:
-        ensure_schema = _ensure_schema_fallback  # type: ignore
     ensure_schema(conn)
     return conn
 
 
-def _ensure_schema_fallback(conn: sqlite3.Connection) -> None:
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS user (
-            unum integer primary key autoincrement,
-            userid text not null unique,
-            password text not null,
-            role text not null default 'member'
-        )
-        """
-    )
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS allowed_users (
-            id integer primary key autoincrement,
-            userid text not null unique,
-            email text,
-            role text not null default 'member',
-            invited_at text not null default (datetime('now','+9 hours')),
-            used_at text,
-            is_active integer not null default 1
-        )
-        """
-    )
-    conn.commit()
-
-
 def add_invite(args: argparse.Namespace) -> None:
+    # 世帯を指定しない招待は、登録時に userid と同名の世帯になる
+    household = getattr(args, "household", None)
     with closing(connect()) as conn:
         cursor = conn.execute(
             "SELECT id, is_active, used_at FROM allowed_users WHERE userid = ?",
@@ -125,19 +128,19 @@ def add_invite(args: argparse.Namespace) -> None:
             conn.execute(
                 """
                 UPDATE allowed_users
-                SET email = ?, role = ?, is_active = 1, used_at = NULL, invited_at = ?
+                SET email = ?, role = ?, household = ?, is_active = 1, used_at = NULL, invited_at = ?
                 WHERE userid = ?
                 """,
-                (args.email, args.role, now_jst(), args.userid),
+                (args.email, args.role, household, now_jst(), args.userid),
             )
             action = "再招待"
         else:
             conn.execute(
                 """
-                INSERT INTO allowed_users (userid, email, role, is_active, invited_at)
-                VALUES (?, ?, ?, 1, ?)
+                INSERT INTO allowed_users (userid, email, role, household, is_active, invited_at)
+                VALUES (?, ?, ?, ?, 1, ?)
                 """,
-                (args.userid, args.email, args.role, now_jst()),
+                (args.userid, args.email, args.role, household, now_jst()),
             )
             action = "招待登録"
         conn.commit()
@@ -193,14 +196,14 @@ def list_invites(_: argparse.Namespace) -> None:
     with closing(connect()) as conn:
         rows = conn.execute(
             """
-            SELECT userid, email, role, is_active, used_at, invited_at
+            SELECT userid, email, role, household, is_active, used_at, invited_at
             FROM allowed_users
             ORDER BY invited_at DESC
             """
         ).fetchall()
     _print_table(
         rows,
-        headers=["userid", "email", "role", "is_active", "used_at", "invited_at"],
+        headers=["userid", "email", "role", "household", "is_active", "used_at", "invited_at"],
         empty_message="[INFO] 招待が登録されていません。",
     )
 
@@ -209,14 +212,14 @@ def list_users(_: argparse.Namespace) -> None:
     with closing(connect()) as conn:
         rows = conn.execute(
             """
-            SELECT userid, role
+            SELECT userid, role, household
             FROM user
-            ORDER BY userid
+            ORDER BY household, userid
             """
         ).fetchall()
     _print_table(
         rows,
-        headers=["userid", "role"],
+        headers=["userid", "role", "household"],
         empty_message="[INFO] 登録済みユーザが存在しません。",
     )
 
@@ -224,7 +227,8 @@ def list_users(_: argparse.Namespace) -> None:
 def set_user_role(args: argparse.Namespace) -> None:
     with closing(connect()) as conn:
         updated = conn.execute(
-            "UPDATE user SET role = ? WHERE userid = ?",
+            # 認証エポックを進め、旧ロールを載せたままのセッションを無効にする
+            "UPDATE user SET role = ?, auth_epoch = auth_epoch + 1 WHERE userid = ?",
             (args.role, args.userid),
         ).rowcount
         conn.commit()
@@ -234,6 +238,375 @@ def set_user_role(args: argparse.Namespace) -> None:
             print(f"[WARN] {args.userid} は未登録です。")
 
 
+def set_user_household(args: argparse.Namespace) -> None:
+    # 登録済みのレシピは元の世帯に残る（世帯の共有データとして扱う）
+    with closing(connect()) as conn:
+        updated = conn.execute(
+            "UPDATE user SET household = ?, auth_epoch = auth_epoch + 1 WHERE userid = ?",
+            (args.household, args.userid),
+        ).rowcount
+        conn.commit()
+        if updated:
+            print(f"[OK] {args.userid} の世帯を {args.household} に変更しました。")
+        else:
+            print(f"[WARN] {args.userid} は未登録です。")
+
+
+BULK_INVITE_CHUNK_SIZE = 500
+BULK_REPORT_LIMIT = 50
+# --reactivate 時は既存の招待を add --reactivate と同じ内容で上書きする
+REACTIVATE_CONFLICT = """
+DO UPDATE SET
+    email = excluded.email, role = excluded.role, household = excluded.household,
+    is_active = 1, used_at = NULL, invited_at = excluded.invited_at
+"""
+
+
+def _iter_invite_records(fp: IO[str]) -> Iterator[tuple[int, Any]]:
+    # 先頭が `{` ならNDJSON、それ以外はヘッダ行付きのCSVとして1行ずつ読む
+    head = fp.read(1)
+    while head and head.isspace():
+        head = fp.read(1)
+    if not head:
+        return
+    first = head + fp.readline()
+    if head == "{":
+        yield 1, first
+        yield from enumerate(fp, start=2)
+        return
+    reader = csv.DictReader(itertools.chain([first], fp))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _clean_invite(record: Any, defaults: argparse.Namespace) -> tuple[str, str | None, str, str | None] | None:
+    # 空行は None。不正な行は ValueError
+    if isinstance(record, str):
+        if not record.strip():
+            return None
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError:
+            raise ValueError("JSONとして読めません") from None
+    if not isinstance(record, dict):
+        raise ValueError("オブジェクトではありません")
+
+    def _get(field: str) -> str | None:
+        value = record.get(field)
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            raise ValueError(f"{field} は文字列で指定してください")
+        return value.strip() or None
+
+    userid = _get("userid")
+    if userid is None:
+        raise ValueError("userid がありません")
+    return userid, _get("email"), _get("role") or defaults.role, _get("household") or defaults.household
+
+
+def _describe_invite_change(row: sqlite3.Row) -> str:
+    if row["current_id"] is None:
+        return f"+ {row['userid']} (role={row['role']}, household={row['household'] or '-'})"
+    changes = [
+        f"{field}: {row['current_' + field]} -> {row[field]}"
+        for field in ("email", "role", "household")
+        if row["current_" + field] != row[field]
+    ]
+    if row["current_is_active"] != 1:
+        changes.append("is_active: 0 -> 1")
+    if row["current_used_at"] is not None:
+        changes.append("used_at: リセット")
+    return f"~ {row['userid']} ({', '.join(changes) or '招待日時のみ更新'})"
+
+
+def bulk_add_invites(args: argparse.Namespace) -> None:
+    errors: list[str] = []
+    failed = 0
+    seen: set[str] = set()
+    with open(args.file, encoding="utf-8-sig", newline="") as fp, closing(connect()) as conn:
+        if not args.dry_run:
+            # 既存招待との突き合わせから反映までの間に他の書き込みを挟ませない
+            conn.execute("BEGIN IMMEDIATE")
+        # 取り込み対象は一時テーブルに流し込み、既存の招待との突き合わせと反映をSQL側でまとめて行う
+        conn.execute(
+            """
+            CREATE TEMP TABLE bulk_invite (
+                userid text primary key,
+                email text,
+                role text not null,
+                household text
+            )
+            """
+        )
+        batch = []
+        for line_no, record in _iter_invite_records(fp):
+            try:
+                invite = _clean_invite(record, args)
+                if invite is None:
+                    continue
+                if invite[0] in seen:
+                    raise ValueError(f"userid '{invite[0]}' が重複しています")
+            except ValueError as exc:
+                failed += 1
+                if len(errors) < BULK_REPORT_LIMIT:
+                    errors.append(f"[WARN] {line_no}行目: {exc}")
+                continue
+            seen.add(invite[0])
+            batch.append(invite)
+            if len(batch) >= BULK_INVITE_CHUNK_SIZE:
+                conn.executemany("INSERT INTO temp.bulk_invite VALUES (?, ?, ?, ?)", batch)
+                batch.clear()
+        conn.executemany("INSERT INTO temp.bulk_invite VALUES (?, ?, ?, ?)", batch)
+
+        added = reinvited = skipped = 0
+        diff: list[str] = []
+        for row in conn.execute(
+            """
+            SELECT b.userid, b.email, b.role, b.household,
+                   a.id AS current_id, a.email AS current_email, a.role AS current_role,
+                   a.household AS current_household, a.is_active AS current_is_active,
+                   a.used_at AS current_used_at
+            FROM temp.bulk_invite b
+            LEFT JOIN allowed_users a ON a.userid = b.userid
+            ORDER BY b.userid
+            """
+        ):
+            if row["current_id"] is None:
+                added += 1
+            elif args.reactivate:
+                reinvited += 1
+            else:
+                skipped += 1
+                continue
+            if args.dry_run and len(diff) < BULK_REPORT_LIMIT:
+                diff.append(_describe_invite_change(row))
+
+        if not args.dry_run:
+            conn.execute(
+                f"""
+                INSERT INTO allowed_users (userid, email, role, household, is_active, invited_at)
+                SELECT userid, email, role, household, 1, ? FROM temp.bulk_invite WHERE true
+                ON CONFLICT (userid) {REACTIVATE_CONFLICT if args.reactivate else "DO NOTHING"}
+                """,
+                (now_jst(), ),
+            )
+            conn.commit()
+
+    for line in errors:
+        print(line)
+    if failed > len(errors):
+        print(f"[WARN] ... 他 {failed - len(errors)}件のエラー")
+    for line in diff:
+        print(line)
+    if added + reinvited > len(diff) and args.dry_run:
+        print(f"[INFO] ... 他 {added + reinvited - len(diff)}件の変更")
+    summary = f"新規 {added}件 / 再招待 {reinvited}件 / 既存のためスキップ {skipped}件 / エラー {failed}件"
+    if args.dry_run:
+        print(f"[INFO] ドライラン: {summary}（変更は保存していません）")
+    else:
+        print(f"[OK] {summary}")
+
+
+BACKUP_SUFFIXES = (".db", ".db.gz")
+# 書き込みが続いてコピーがこの回数やり直しになったら、残りを1ステップでコピーする
+BACKUP_MAX_RESTARTS = 3
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _open_readonly(path: str) -> sqlite3.Connection:
+    if not os.path.exists(path):
+        raise SystemExit(f"[ERROR] {path} が見つかりません。")
+    return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def _copy_online(
+    src: sqlite3.Connection,
+    dst: sqlite3.Connection,
+    pages: int,
+    sleep: float,
+    max_restarts: int = BACKUP_MAX_RESTARTS,
+) -> int:
+    """1ステップごとにロックを手放してコピーする。戻り値は書き込みによるやり直しの回数。"""
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # 他の接続が書き込むとバックアップは先頭ページからやり直しになり、残りページ数が減らなくなる
+        if last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _BackupRestarted
+        last_remaining = remaining
+
+    try:
+        src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+    except _BackupRestarted:
+        # 書き込みが途切れず終わらないため、残りは読み取りトランザクション1回でまとめてコピーする
+        # （WALではその間もアプリの書き込みは止まらない。チェックポイントだけが待たされる）
+        src.backup(dst, pages=-1)
+    return restarts
+
+
+def _list_snapshots(directory: str, stem: str) -> list[str]:
+    names = [
+        name for name in os.listdir(directory)
+        if name.startswith(f"{stem}-") and name.endswith(BACKUP_SUFFIXES)
+    ]
+    # ファイル名の日時部分で古い順に並ぶ
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def backup_database(args: argparse.Namespace) -> None:
+    os.makedirs(args.dir, exist_ok=True)
+    stem = Path(DATABASE_PATH).stem
+    timestamp = datetime.now(JST).strftime("%Y%m%d-%H%M%S-%f")
+    target = os.path.join(args.dir, f"{stem}-{timestamp}.db")
+    partial = target + ".partial"
+    started = time.monotonic()
+    try:
+        with closing(_open_readonly(DATABASE_PATH)) as src, closing(sqlite3.connect(partial)) as dst:
+            restarts = _copy_online(src, dst, args.pages, args.sleep)
+        if restarts:
+            print(f"[INFO] コピー中の書き込みで {restarts}回やり直しました。")
+        if args.compress:
+            with open(partial, "rb") as raw, gzip.open(partial + ".gz", "wb") as packed:
+                shutil.copyfileobj(raw, packed)
+            os.remove(partial)
+            partial += ".gz"
+            target += ".gz"
+        # 書き終えたファイルだけを正式な名前にする（途中で止まっても壊れたスナップショットを残さない）
+        os.replace(partial, target)
+    finally:
+        for leftover in (partial, partial + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    size_kib = os.path.getsize(target) // 1024
+    print(f"[OK] バックアップを作成しました: {target}（{size_kib} KiB, {time.monotonic() - started:.1f}秒）")
+    if args.keep:
+        for old in _list_snapshots(args.dir, stem)[:-args.keep]:
+            os.remove(old)
+            print(f"[INFO] 古いバックアップを削除しました: {old}")
+
+
+def _verify_snapshot(path: str) -> dict:
+    with closing(sqlite3.connect(path)) as conn:
+        try:
+            problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        except sqlite3.DatabaseError as exc:
+            raise SystemExit(f"[ERROR] {path} はSQLiteデータベースとして読めません: {exc}") from None
+        if problems != ["ok"]:
+            for problem in problems[:20]:
+                print(f"[ERROR] {problem}")
+            raise SystemExit(f"[ERROR] {path} の整合性チェックに失敗しました。")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {
+            "schema_version": conn.execute("PRAGMA user_version").fetchone()[0],
+            "recipes": conn.execute("SELECT count(*) FROM recipe").fetchone()[0] if "recipe" in tables else 0,
+            "users": conn.execute("SELECT count(*) FROM user").fetchone()[0] if "user" in tables else 0,
+        }
+
+
+def _live_state(path: str) -> dict | None:
+    from app import DEFAULT_HOUSEHOLD
+
+    # 復元で巻き戻してはいけない値（変更番号・認証エポック）と、復元後に消えるレシピの判定に使うID
+    if not os.path.exists(path):
+        return None
+    with closing(sqlite3.connect(path)) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "table_change" not in tables:
+            return None
+        seq = conn.execute("SELECT seq FROM table_change WHERE name = 'recipe'").fetchone()
+        # 稼働中のDBが古いスキーマのまま（アプリ未起動）の場合は既定値で扱う
+        user_columns = {row[1] for row in conn.execute("PRAGMA table_info('user')")}
+        recipe_columns = {row[1] for row in conn.execute("PRAGMA table_info('recipe')")}
+        epoch = conn.execute("SELECT max(auth_epoch) FROM user").fetchone()[0] if "auth_epoch" in user_columns else 0
+        household = "household" if "household" in recipe_columns else f"'{DEFAULT_HOUSEHOLD}'"
+        return {
+            "seq": seq[0] if seq else 0,
+            "auth_epoch": epoch or 0,
+            "recipes": conn.execute(f"SELECT id, {household} FROM recipe").fetchall(),
+        }
+
+
+def _prepare_restore(snapshot: str, live: dict | None) -> int:
+    """復元前のスナップショット（一時ファイル）を現行スキーマに上げ、変更番号を稼働中のDBより先へ進める。"""
+    from app import SCHEMA_VERSION, ensure_schema
+
+    with closing(sqlite3.connect(snapshot)) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise SystemExit(
+                f"[ERROR] スナップショットのスキーマ {version} はこのアプリ（{SCHEMA_VERSION}）より新しいため復元できません。"
+            )
+        if version < SCHEMA_VERSION:
+            # 稼働中のワーカーはスキーマ確認を済ませているため、古いスキーマのまま書き戻すと列の不足で失敗する
+            ensure_schema(conn)
+            print(f"[INFO] スナップショットのスキーマを {version} から {SCHEMA_VERSION} に更新しました。")
+        live_seq = live["seq"] if live else 0
+        restored_seq = conn.execute("SELECT seq FROM table_change WHERE name = 'recipe'").fetchone()[0]
+        # 発行済みの一覧ETag・同期位置と重ならないよう、どちらよりも大きい番号を全レシピ・削除記録に付け直す。
+        # 同期クライアントは since によらず復元後の全件を受け取り直す
+        seq = max(live_seq, restored_seq) + 1
+        now = now_jst()
+        conn.execute("UPDATE table_change SET seq = ?, changed_at = ? WHERE name = 'recipe'", (seq, now))
+        conn.execute("UPDATE recipe SET change_seq = ?", (seq, ))
+        conn.execute("UPDATE recipe_tombstone SET change_seq = ?", (seq, ))
+        if live:
+            # 稼働中のDBにだけあるレシピは、削除されたものとしてクライアントに伝える
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO recipe_tombstone (recipe_id, change_seq, deleted_at, household)
+                SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM recipe WHERE id = ?)
+                """,
+                [(recipe_id, seq, now, household, recipe_id) for recipe_id, household in live["recipes"]],
+            )
+            # 復元前に発行したセッションはロール・世帯が食い違いうるため、全員を再ログインさせる
+            conn.execute("UPDATE user SET auth_epoch = ?", (live["auth_epoch"] + 1, ))
+        conn.commit()
+    return seq
+
+
+def restore_database(args: argparse.Namespace) -> None:
+    if not os.path.exists(args.file):
+        raise SystemExit(f"[ERROR] {args.file} が見つかりません。")
+    target = args.target or DATABASE_PATH
+    if not args.verify_only and os.path.exists(target) and not args.force:
+        raise SystemExit(
+            f"[ERROR] {target} は既に存在します。上書きする場合は --force を指定してください。"
+        )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 元のバックアップファイルは書き換えない
+        snapshot = os.path.join(tmp_dir, "snapshot.db")
+        opener = gzip.open if args.file.endswith(".gz") else open
+        with opener(args.file, "rb") as packed, open(snapshot, "wb") as raw:
+            shutil.copyfileobj(packed, raw)
+        summary = _verify_snapshot(snapshot)
+        print(
+            f"[OK] 整合性チェック: ok（スキーマ {summary['schema_version']}, "
+            f"レシピ {summary['recipes']}件, ユーザ {summary['users']}件）"
+        )
+        if args.verify_only:
+            return
+        seq = _prepare_restore(snapshot, _live_state(target))
+        # ファイルを差し替えるのではなくバックアップAPIで書き戻し、稼働中の接続やWALと整合させる。
+        # 1ステップでコピーし、書き戻しの途中にアプリの書き込みが混ざらないようにする
+        with closing(sqlite3.connect(snapshot)) as src, closing(sqlite3.connect(target)) as dst:
+            src.backup(dst, pages=-1)
+    from app import bump_recipe_cache_generation
+
+    # 稼働中のワーカーのレシピキャッシュを捨てさせる
+    bump_recipe_cache_generation(target)
+    _verify_snapshot(target)
+    print(f"[OK] {args.file} から {target} へ復元しました（変更番号 {seq}）。")
+
+
 def _print_table(rows: Iterable[sqlite3.Row], headers: list[str], empty_message: str) -> None:
     rows = list(rows)
     if not rows:
@@ -264,6 +637,7 @@ def build_parser() -> argparse.ArgumentParser:
     add_parser.add_argument("--userid", required=True)
     add_parser.add_argument("--email", default=None)
     add_parser.add_argument("--role", default="member")
+    add_parser.add_argument("--household", default=None, help="参加させる世帯（省略時は userid と同名の世帯）")
     add_parser.add_argument(
         "--reactivate",
         action="store_true",
@@ -271,6 +645,18 @@ def build_parser() -> argparse.ArgumentParser:
     )
     add_parser.set_defaults(func=add_invite)
 
+    bulk_parser = subparsers.add_parser("bulk-add", help="CSV/NDJSONファイルから招待をまとめて登録する")
+    bulk_parser.add_argument("--file", required=True, help="userid,email,role,household 列のCSV、またはNDJSON")
+    bulk_parser.add_argument("--role", default="member", help="role 列が空の行に使うロール")
+    bulk_parser.add_argument("--household", default=None, help="household 列が空の行に使う世帯")
+    bulk_parser.add_argument(
+        "--reactivate",
+        action="store_true",
+        help="既存招待を再有効化して上書きする（省略時は既存の userid をスキップ）",
+    )
+    bulk_parser.add_argument("--dry-run", action="store_true", help="反映せずに差分と件数だけを表示する")
+    bulk_parser.set_defaults(func=bulk_add_invites)
+
     deactivate_parser = subparsers.add_parser("deactivate", help="招待を無効化する")
     deactivate_parser.add_argument("--userid", required=True)
     deactivate_parser.set_defaults(func=deactivate_invite)
@@ -294,6 +680,26 @@ def build_parser() -> argparse.ArgumentParser:
     promote_parser.add_argument("--role", required=True)
     promote_parser.set_defaults(func=set_user_role)
 
+    household_parser = subparsers.add_parser("set-user-household", help="登録済みユーザの世帯を変更する")
+    household_parser.add_argument("--userid", required=True)
+    household_parser.add_argument("--household", required=True)
+    household_parser.set_defaults(func=set_user_household)
+
+    backup_parser = subparsers.add_parser("backup", help="稼働中のDBのスナップショットを作成する")
+    backup_parser.add_argument("--dir", default="backups", help="保存先ディレクトリ")
+    backup_parser.add_argument("--compress", action="store_true", help="gzipで圧縮して保存する")
+    backup_parser.add_argument("--keep", type=int, default=0, help="新しい順に残す件数（0で削除しない）")
+    backup_parser.add_argument("--pages", type=int, default=256, help="1ステップでコピーするページ数")
+    backup_parser.add_argument("--sleep", type=float, default=0.05, help="ステップ間の待ち秒数")
+    backup_parser.set_defaults(func=backup_database)
+
+    restore_parser = subparsers.add_parser("restore", help="スナップショットを検証して復元する")
+    restore_parser.add_argument("--file", required=True, help="バックアップファイル(.db / .db.gz)")
+    restore_parser.add_argument("--target", default=None, help="復元先（既定は DATABASE）")
+    restore_parser.add_argument("--verify-only", action="store_true", help="整合性チェックのみ行う")
+    restore_parser.add_argument("--force", action="store_true", help="既存の復元先を上書きする")
+    restore_parser.set_defaults(func=restore_database)
+
     return parser
 
 
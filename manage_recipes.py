@@ -0,0 +1,145 @@
+"""
+実行例: python manage_recipes.py import --file recipes.ndjson
+概要: レシピをNDJSON/JSON配列ファイルから一括登録し、NDJSONで書き出すコマンドラインツール。参照されなくなった写真の掃除も行う。
+
+- 取り込み: `python manage_recipes.py import --file archive.ndjson --chunk-size 1000`
+  - 先頭が `[` のファイルはJSON配列、それ以外は1行1レシピのNDJSONとして読む。
+  - 不正な行はスキップし、最後に行番号とエラー内容をまとめて表示する。
+- 書き出し: `python manage_recipes.py export --file backup.ndjson`（`--file -` で標準出力）
+- 世帯: 取り込みは `--household tanaka --owner alice` で登録先を指定（省略時は `default` 世帯）。
+  書き出しは `--household` 指定時のみその世帯に絞る。
+- 取り込み後はDBの隣の世代ファイル（`<DB>-cache-generation`）を差し替え、稼働中のアプリのキャッシュを捨てさせる。
+- 写真の掃除: `python manage_recipes.py sweep-photos --grace 86400`
+  - どのレシピからも参照されず、`--grace` 秒以上アップロードされていない写真・サムネイルを消す（cron での定期実行を想定）。
+- `DATABASE` 環境変数で対象のSQLiteファイルを切り替えられる。
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from typing import IO, Iterator
+
+DATABASE_PATH = os.environ.get("DATABASE", "recipe_memo.db")
+PHOTO_SWEEP_GRACE = 24 * 60 * 60
+
+
+def connect() -> sqlite3.Connection:
+    from app import ensure_schema
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    ensure_schema(conn)
+    return conn
+
+
+def _iter_records(fp: IO[str]) -> Iterator[tuple[int, object]]:
+    head = fp.read(1)
+    while head and head.isspace():
+        head = fp.read(1)
+    if head == "[":
+        yield from enumerate(json.loads(head + fp.read()), start=1)
+        return
+    yield 1, head + fp.readline()
+    yield from enumerate(fp, start=2)
+
+
+def import_command(args: argparse.Namespace) -> None:
+    from app import BULK_CHUNK_SIZE, DEFAULT_HOUSEHOLD, bump_recipe_cache_generation, import_recipes
+
+    chunk_size = args.chunk_size or BULK_CHUNK_SIZE
+    household = getattr(args, "household", None) or DEFAULT_HOUSEHOLD
+    with open(args.file, encoding="utf-8-sig") as fp, closing(connect()) as conn:
+        summary = import_recipes(
+            conn,
+            _iter_records(fp),
+            chunk_size=chunk_size,
+            owner=getattr(args, "owner", None),
+            household=household,
+        )
+    if summary["imported"]:
+        # 稼働中のアプリが古い一覧・詳細をキャッシュから返し続けないようにする
+        bump_recipe_cache_generation(DATABASE_PATH)
+    for error in summary["errors"]:
+        print(f"[WARN] {error['line']}行目: {error['error']}")
+    print(f"[OK] {summary['imported']}件を登録しました（失敗 {summary['failed']}件）。")
+
+
+def export_command(args: argparse.Namespace) -> None:
+    from app import export_recipes
+
+    count = 0
+    with closing(connect()) as conn:
+        if args.file == "-":
+            out = sys.stdout
+        else:
+            out = open(args.file, "w", encoding="utf-8")
+        try:
+            for line in export_recipes(conn, getattr(args, "household", None)):
+                out.write(line)
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    if args.file != "-":
+        print(f"[OK] {count}件を {args.file} に書き出しました。")
+
+
+def sweep_photos_command(args: argparse.Namespace) -> None:
+    from app import PHOTO_DIR
+    from photo_store import PhotoStore
+
+    # 参照中の名前を先に集める。集めた後に付けられた写真はアップロード時に mtime が進むため消えない
+    with closing(connect()) as conn:
+        referenced = {row[0] for row in conn.execute("select distinct photo from recipe where photo is not null")}
+    store = PhotoStore(args.photo_dir or PHOTO_DIR, workers=0)
+    removed = store.sweep(referenced, args.grace)
+    print(f"[OK] 参照されていない写真を{removed}件削除しました（参照中 {len(referenced)}件）。")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="recipe テーブルを一括で取り込み・書き出しし、写真を掃除するためのCLIツール。",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="NDJSON/JSON配列からレシピを一括登録する")
+    import_parser.add_argument("--file", required=True)
+    import_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="1トランザクションで登録する件数",
+    )
+    import_parser.add_argument("--household", default=None, help="登録先の世帯（省略時は default）")
+    import_parser.add_argument("--owner", default=None, help="登録者として記録する userid")
+    import_parser.set_defaults(func=import_command)
+
+    export_parser = subparsers.add_parser("export", help="レシピをNDJSONで書き出す")
+    export_parser.add_argument("--file", default="-")
+    export_parser.add_argument("--household", default=None, help="指定した世帯のレシピだけを書き出す")
+    export_parser.set_defaults(func=export_command)
+
+    sweep_parser = subparsers.add_parser("sweep-photos", help="どのレシピからも参照されていない写真を削除する")
+    sweep_parser.add_argument("--photo-dir", default=None, help="写真の保存先（省略時はアプリの PHOTO_DIR）")
+    sweep_parser.add_argument(
+        "--grace",
+        type=float,
+        default=PHOTO_SWEEP_GRACE,
+        help="この秒数以内にアップロードされた写真は残す（登録処理中のものを消さないため）",
+    )
+    sweep_parser.set_defaults(func=sweep_photos_command)
+
+    return parser
+
+
+def main() -> None:
+    parser = build_parser()
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+実行例: from password_hasher import PasswordHasher; hasher = PasswordHasher("pbkdf2:sha256:600000", workers=2)
+概要: パスワードのハッシュ化/照合を上限付きのプロセスプールで実行し、リクエストスレッドとGILを長時間占有しないようにする。
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _process_context():
+    # 書き込み・サムネイル・ASGIのスレッドが動いているプロセスを fork すると、子にロックが掛かったまま引き継がれうる。
+    # スレッドを持たない forkserver（使えない環境では spawn）から子プロセスを作る
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def normalize_method(method: str) -> str:
+    # werkzeug が省略時に補う既定値を明示し、保存済みハッシュの接頭辞と比較できる形にする
+    name, *args = method.split(":")
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if name == "scrypt":
+        n, r, p = args if args else (2**15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    return method
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        method: str = "pbkdf2:sha256",
+        workers: int = 2,
+        max_pending: int = 16,
+        timeout: float = 10.0,
+    ) -> None:
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        # 実行中+待機中の件数の上限(0以下で無制限)。超えた分は待たせずに HasherBusy で即座に断る
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending > 0 else None
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # gunicorn のfork後に最初に使われたワーカーで生成する
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+            return self._executor
+
+    def _release(self, *_) -> None:
+        if self._slots is not None:
+            self._slots.release()
+
+    def _run(self, fn, *args):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise HasherBusy("password hashing queue is full")
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+
+        try:
+            future: Future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._release()
+            self._reset_executor()
+            raise HasherBusy("password hashing pool is unavailable") from None
+        # タイムアウトで呼び出し元が先に戻っても、実際に計算が終わるまで枠は解放しない
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusy("password hashing timed out") from None
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise HasherBusy("password hashing pool is unavailable") from None
+
+    def _reset_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        return normalize_method(pwhash.split("$", 1)[0]) != self.method
+
+    def shutdown(self) -> None:
+        self._reset_executor()
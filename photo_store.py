@@ -0,0 +1,272 @@
+"""
+実行例: from photo_store import PhotoStore; store = PhotoStore("media"); name = store.save(request.stream)
+概要: レシピ写真を内容のSHA-256をファイル名にして保存し（同じ画像は1ファイルに集約）、固定サイズのサムネイルを上限付きのスレッドプールで生成する。
+      どのレシピからも参照されなくなったファイルは sweep でまとめて消す。
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow は任意依存。未インストール時はサムネイルを作らず原寸画像を使う
+    Image = ImageOps = None
+
+COPY_CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (320, 240)
+THUMBNAIL_QUALITY = 80
+# 先頭のバイト列で形式を判定する（Content-Type や拡張子は信用しない）
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+SNIFF_LENGTH = 12
+NAME_PATTERN = re.compile(r"^([0-9a-f]{64})\.(jpg|png|gif|webp)$")
+
+
+class SavedPhoto(NamedTuple):
+    name: str
+    # この呼び出しで新たに置いたファイルの mtime（ナノ秒）。同じ内容が既にあった場合は None
+    created_ns: int | None
+
+
+class PhotoTooLarge(Exception):
+    pass
+
+
+class UnsupportedPhoto(Exception):
+    pass
+
+
+def sniff_extension(head: bytes) -> str | None:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def make_thumbnail(source: str, target: str, size: tuple[int, int], quality: int) -> None:
+    partial = f"{target}.{threading.get_ident()}.partial"
+    try:
+        with Image.open(source) as image:
+            # 撮影時の向きを反映し、カードの比率に合わせて中央を切り出す
+            thumbnail = ImageOps.fit(ImageOps.exif_transpose(image), size, Image.LANCZOS)
+            thumbnail.convert("RGB").save(partial, "JPEG", quality=quality, optimize=True)
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class PhotoStore:
+    """originals/<先頭2桁>/<sha256>.<拡張子> と thumbs/<先頭2桁>/<sha256>.jpg に保存する。"""
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        workers: int = 2,
+        thumbnail_size: tuple[int, int] = THUMBNAIL_SIZE,
+    ) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.thumbnail_size = tuple(thumbnail_size)
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        for directory in ("originals", "thumbs", "tmp"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    @property
+    def thumbnails_enabled(self) -> bool:
+        return Image is not None and self.workers > 0
+
+    def _path(self, kind: str, digest: str, extension: str) -> str:
+        return os.path.join(self.root, kind, digest[:2], f"{digest}.{extension}")
+
+    def save(self, stream) -> str:
+        """本文を一時ファイルへ書きながらハッシュを計算し、保存名（<sha256>.<拡張子>）を返す。"""
+        return self.put(stream).name
+
+    def put(self, stream) -> SavedPhoto:
+        """save と同じ。DBへの登録に失敗したとき discard で片付けられるよう、新規に置いたかも返す。"""
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        created_ns = None
+        fd, partial = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                while True:
+                    chunk = stream.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise PhotoTooLarge(f"photo must be at most {self.max_bytes} bytes")
+                    if len(head) < SNIFF_LENGTH:
+                        head += chunk[:SNIFF_LENGTH - len(head)]
+                    digest.update(chunk)
+                    fp.write(chunk)
+            extension = sniff_extension(head)
+            if extension is None:
+                raise UnsupportedPhoto("photo must be a JPEG, PNG, GIF or WebP image")
+            name = f"{digest.hexdigest()}.{extension}"
+            target = self._path("originals", digest.hexdigest(), extension)
+            try:
+                # 同じ内容の画像は既存のファイルを共有する。mtime を進めて sweep・discard の対象から外す
+                os.utime(target)
+                os.remove(partial)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(partial, target)
+                created_ns = os.stat(target).st_mtime_ns
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        self.schedule_thumbnail(name)
+        return SavedPhoto(name, created_ns)
+
+    def discard(self, photo: SavedPhoto) -> bool:
+        """put で新たに置いたファイルを、DBに登録できなかったときに消す。
+
+        その後に同じ内容が put されていれば（mtime が変わっていれば）残す。
+        """
+        match = NAME_PATTERN.match(photo.name)
+        if photo.created_ns is None or match is None:
+            return False
+        return self._remove_unless_touched(
+            match.group(1), self._path("originals", *match.groups()),
+            lambda st: st.st_mtime_ns != photo.created_ns,
+        )
+
+    def sweep(self, referenced: set[str], grace: float) -> int:
+        """どのレシピからも参照されず、grace 秒以上 put されていない原寸・サムネイルを消し、消した原寸の数を返す。
+
+        referenced は呼び出し前にDBから集めた保存名。集めた後に参照されたものは put で mtime が進んでいるため残る。
+        """
+        cutoff = time.time() - grace
+
+        def touched(st) -> bool:
+            return st.st_mtime >= cutoff
+
+        removed = 0
+        kept = set()
+        for path in glob.glob(os.path.join(self.root, "originals", "*", "*")):
+            name = os.path.basename(path)
+            match = NAME_PATTERN.match(name)
+            if match is None:
+                continue
+            try:
+                if name in referenced or touched(os.stat(path)):
+                    kept.add(match.group(1))
+                    continue
+            except FileNotFoundError:
+                continue
+            if self._remove_unless_touched(match.group(1), path, touched):
+                removed += 1
+            else:
+                kept.add(match.group(1))
+        for kind in ("thumbs", "tmp"):
+            for path in glob.glob(os.path.join(self.root, kind, "**", "*"), recursive=True):
+                # 原寸の無いサムネイルと、異常終了で残った書きかけのファイル
+                digest = os.path.basename(path).split(".", 1)[0]
+                if kind == "thumbs" and digest in kept:
+                    continue
+                try:
+                    if os.path.isfile(path) and not touched(os.stat(path)):
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def _remove_unless_touched(self, digest: str, path: str, touched) -> bool:
+        # 先に退避名へ移してから mtime を確かめる。移した後に put されても新しいファイルとして置き直されるだけで、
+        # 確かめる前に put されていれば（内容は同じなので）元に戻す
+        trash = os.path.join(self.root, "tmp", f"{os.path.basename(path)}.{threading.get_ident()}.discard")
+        try:
+            os.replace(path, trash)
+        except FileNotFoundError:
+            return False
+        try:
+            if touched(os.stat(trash)):
+                os.replace(trash, path)
+                return False
+            os.remove(trash)
+        except FileNotFoundError:
+            # 並行した sweep が先に片付けた
+            return False
+        thumbnail = self._path("thumbs", digest, "jpg")
+        if os.path.exists(thumbnail):
+            os.remove(thumbnail)
+        return True
+
+    def original_path(self, name: str) -> str | None:
+        match = NAME_PATTERN.match(name)
+        if match is None:
+            return None
+        path = self._path("originals", *match.groups())
+        return path if os.path.exists(path) else None
+
+    def thumbnail_path(self, name: str) -> str | None:
+        # name は原寸の保存名。サムネイルは形式によらず JPEG
+        match = NAME_PATTERN.match(name)
+        if match is None:
+            return None
+        path = self._path("thumbs", match.group(1), "jpg")
+        return path if os.path.exists(path) else None
+
+    def schedule_thumbnail(self, name: str) -> None:
+        """サムネイルが無ければバックグラウンドで生成する。生成中・生成済みなら何もしない。"""
+        if not self.thumbnails_enabled or self.thumbnail_path(name) is not None:
+            return
+        source = self.original_path(name)
+        if source is None:
+            return
+        target = self._path("thumbs", name.split(".", 1)[0], "jpg")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+            if self._executor is None:
+                # gunicorn のfork後に最初に使われたワーカーで生成する
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="thumbnail")
+            future = self._executor.submit(
+                make_thumbnail, source, target, self.thumbnail_size, THUMBNAIL_QUALITY
+            )
+        future.add_done_callback(lambda done: self._done(name, done))
+
+    def _done(self, name: str, future) -> None:
+        with self._lock:
+            self._pending.discard(name)
+        if not future.cancelled() and future.exception() is not None:
+            # 壊れた画像など。サムネイルが無いままなので、次に要求されたときに再試行される
+            logging.getLogger(__name__).warning("thumbnail for %s failed: %s", name, future.exception())
+
+    def wait(self) -> None:
+        """生成待ちのサムネイルをすべて作り終えるまで待つ（テスト・CLI用）。"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,188 @@
+"""
+実行例: from rate_limit import RateLimiter; limiter = RateLimiter(capacity=5, refill_per_second=5 / 60)
+概要: ログイン試行を制限するトークンバケットと段階的ロックアウト。状態はプロセス内LRU、または複数ワーカーで共有するSQLiteファイルに保持する。
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+# (トークン残量, 最終更新時刻, 連続失敗回数, ロック解除時刻)。時刻はワーカー間で比較できるよう time.time() 基準
+State = tuple[float, float, int, float]
+Updater = Callable[[State | None], tuple[State | None, float]]
+
+
+class MemoryStore:
+    """プロセス内の状態。上限を超えたら最も長く使われていないキーから捨てる。"""
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, State] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, key: str, fn: Updater) -> float:
+        with self._lock:
+            state, result = fn(self._data.get(key))
+            if state is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = state
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            return result
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """複数のgunicornワーカーで共有する状態。本体DBへの書き込みと競合しないよう別ファイルに置く。"""
+
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, path: str, timeout: float = 5.0, max_age: float = 86400.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.max_age = max_age
+        self._local = threading.local()
+        self._updates = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(
+                """
+                create table if not exists rate_limit (
+                    key text primary key,
+                    tokens real not null,
+                    updated_at real not null,
+                    failures integer not null,
+                    locked_until real not null
+                ) without rowid
+                """
+            )
+            self._local.conn = conn
+        return conn
+
+    def update(self, key: str, fn: Updater) -> float:
+        conn = self._connect()
+        # 読み取りから書き戻しまでを書き込みロック下で行い、ワーカー間でトークンを二重に消費しない
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "select tokens, updated_at, failures, locked_until from rate_limit where key = ?",
+                [key],
+            ).fetchone()
+            state, result = fn(tuple(row) if row else None)
+            if state is None:
+                conn.execute("delete from rate_limit where key = ?", [key])
+            else:
+                conn.execute(
+                    """
+                    insert into rate_limit (key, tokens, updated_at, failures, locked_until)
+                    values (?, ?, ?, ?, ?)
+                    on conflict (key) do update set
+                        tokens = excluded.tokens, updated_at = excluded.updated_at,
+                        failures = excluded.failures, locked_until = excluded.locked_until
+                    """,
+                    [key, *state],
+                )
+            self._updates += 1
+            if self._updates % self.PRUNE_INTERVAL == 0:
+                now = time.time()
+                conn.execute(
+                    "delete from rate_limit where updated_at < ? and locked_until < ?",
+                    [now - self.max_age, now],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+
+class RateLimiter:
+    """トークンバケット。連続失敗が `lockout_after` 回に達すると、以降は失敗のたびにロック時間を倍にする。
+
+    `failure_ttl` 秒（既定は `lockout_max`）試行がなければ失敗回数を0に戻す。
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        lockout_after: int = 5,
+        lockout_base: float = 1.0,
+        lockout_max: float = 900.0,
+        failure_ttl: float | None = None,
+        store: MemoryStore | SQLiteStore | None = None,
+        prefix: str = "",
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.capacity = float(capacity)
+        self.refill_per_second = refill_per_second
+        self.lockout_after = lockout_after
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.failure_ttl = lockout_max if failure_ttl is None else failure_ttl
+        self.store = store if store is not None else MemoryStore()
+        self.prefix = prefix
+        self.clock = clock
+
+    def _refill(self, state: State | None, now: float) -> State:
+        if state is None:
+            return self.capacity, now, 0, 0.0
+        tokens, updated_at, failures, locked_until = state
+        tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.refill_per_second)
+        if failures and locked_until <= now and now - updated_at >= self.failure_ttl:
+            # 間隔を空けた打ち間違いが積み重なって、いつまでもロックされ続けないようにする
+            failures = 0
+        return tokens, now, failures, locked_until
+
+    def acquire(self, key: str) -> float:
+        """1回分を消費する。許可なら 0、拒否なら再試行までの秒数を返す。"""
+        now = self.clock()
+
+        def fn(state):
+            tokens, updated_at, failures, locked_until = self._refill(state, now)
+            if locked_until > now:
+                return (tokens, updated_at, failures, locked_until), locked_until - now
+            if tokens < 1.0:
+                return (tokens, updated_at, failures, locked_until), (1.0 - tokens) / self.refill_per_second
+            return (tokens - 1.0, updated_at, failures, locked_until), 0.0
+
+        return self.store.update(f"{self.prefix}{key}", fn)
+
+    def failure(self, key: str) -> float:
+        """失敗を記録する。ロックアウトした場合はその秒数を返す。"""
+        now = self.clock()
+
+        def fn(state):
+            tokens, updated_at, failures, locked_until = self._refill(state, now)
+            failures += 1
+            lockout = 0.0
+            if failures >= self.lockout_after:
+                exponent = min(failures - self.lockout_after, 32)
+                lockout = min(self.lockout_base * 2 ** exponent, self.lockout_max)
+                locked_until = max(locked_until, now + lockout)
+            return (tokens, updated_at, failures, locked_until), lockout
+
+        return self.store.update(f"{self.prefix}{key}", fn)
+
+    def success(self, key: str) -> None:
+        now = self.clock()
+
+        def fn(state):
+            tokens, updated_at, _, _ = self._refill(state, now)
+            if tokens >= self.capacity:
+                # 満タンで失敗履歴もなければ保持する必要はない
+                return None, 0.0
+            return (tokens, updated_at, 0, 0.0), 0.0
+
+        self.store.update(f"{self.prefix}{key}", fn)
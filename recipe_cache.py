@@ -0,0 +1,168 @@
+"""
+実行例: from recipe_cache import RecipeCache; cache = RecipeCache(maxsize=1024)
+概要: レシピ詳細と一覧レスポンスを保持するプロセス内LRUキャッシュ。書き込み時に無効化し、世代ファイルで複数ワーカー間の無効化を共有できる。
+"""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class LocalGeneration:
+    """単一プロセス用の世代カウンタ。"""
+
+    def __init__(self) -> None:
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def current(self) -> Hashable:
+        return self._value
+
+    def bump(self) -> Hashable:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+class FileGeneration:
+    """世代をファイルで共有する。書き込みのたびに一意な値を書いたファイルへ os.replace で差し替え、読み手は中身を比べる。
+
+    inode は差し替えのたびに2つの値を行き来し、mtime は粗い分解能のファイルシステムで同じ値になりうるため、
+    stat の値では一度見た世代に戻ったように見えることがある。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            self.bump()
+
+    def current(self) -> Hashable:
+        try:
+            with open(self.path, encoding="utf-8") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return None
+
+    def bump(self) -> Hashable:
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        token = uuid.uuid4().hex
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                fp.write(token)
+            os.replace(tmp_path, self.path)
+        return token
+
+
+class RecipeCache:
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        list_maxsize: int = 32,
+        generation: LocalGeneration | FileGeneration | None = None,
+    ) -> None:
+        self.recipes = LRUCache(maxsize)
+        self.lists = LRUCache(list_maxsize)
+        self.generation = generation or LocalGeneration()
+        self._seen = self.generation.current()
+        # 読み出し中に無効化が挟まった場合に古い値を書き戻さないための局所世代
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def _sync(self) -> None:
+        token = self.generation.current()
+        if token == self._seen:
+            return
+        with self._lock:
+            if token != self._seen:
+                # 他ワーカーで書き込みがあったので手元の内容は全て破棄する
+                self.recipes.clear()
+                self.lists.clear()
+                self._seen = token
+                self._epoch += 1
+
+    def epoch(self) -> int:
+        self._sync()
+        return self._epoch
+
+    def get_recipe(self, recipe_id: int) -> Any:
+        self._sync()
+        return self.recipes.get(recipe_id)
+
+    def put_recipe(self, recipe_id: int, value: Any, epoch: int | None = None) -> None:
+        if epoch is not None and epoch != self.epoch():
+            return
+        self.recipes.set(recipe_id, value)
+
+    def get_list(self, key: Hashable) -> Any:
+        self._sync()
+        return self.lists.get(key)
+
+    def put_list(self, key: Hashable, value: Any, epoch: int | None = None) -> None:
+        if epoch is not None and epoch != self.epoch():
+            return
+        self.lists.set(key, value)
+
+    def invalidate(self, recipe_id: int | None = None) -> None:
+        with self._lock:
+            if recipe_id is None:
+                self.recipes.clear()
+            else:
+                self.recipes.delete(recipe_id)
+            self.lists.clear()
+            self._epoch += 1
+            self._seen = self.generation.bump()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {"recipes": self.recipes.stats(), "lists": self.lists.stats()}
@@ -0,0 +1,64 @@
+"""
+実行例: from recipe_revisions import make_delta, apply_delta; apply_delta(old, make_delta(old, new)) == new
+概要: レシピの版ごとの差分（行単位）を作成・適用し、zlib圧縮したJSONとして保存できる形に変換する。
+"""
+
+import difflib
+import json
+import zlib
+
+TEXT_FIELDS = ("title", "ingredients", "steps", "notes")
+COMPRESS_LEVEL = 6
+
+
+def _diff_lines(old: str, new: str) -> list:
+    # 置き換えが必要な区間だけを [開始行, 終了行, 置き換え後の文字列] で持つ
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        [i1, i2, "".join(new_lines[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def _patch_lines(old: str, ops: list) -> str:
+    lines = old.splitlines(keepends=True)
+    pieces = []
+    pos = 0
+    for start, end, text in ops:
+        pieces.extend(lines[pos:start])
+        pieces.append(text)
+        pos = end
+    pieces.extend(lines[pos:])
+    return "".join(pieces)
+
+
+def make_delta(old: dict, new: dict) -> dict:
+    """変更のあった項目だけを含む差分。タグは配列ごと置き換える。"""
+    delta = {}
+    for field in TEXT_FIELDS:
+        if (old.get(field) or "") != (new.get(field) or ""):
+            delta[field] = _diff_lines(old.get(field) or "", new.get(field) or "")
+    if list(old.get("tags") or []) != list(new.get("tags") or []):
+        delta["tags"] = list(new.get("tags") or [])
+    return delta
+
+
+def apply_delta(content: dict, delta: dict) -> dict:
+    result = dict(content)
+    for field in TEXT_FIELDS:
+        if field in delta:
+            result[field] = _patch_lines(content.get(field) or "", delta[field])
+    if "tags" in delta:
+        result["tags"] = list(delta["tags"])
+    return result
+
+
+def encode_revision(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), COMPRESS_LEVEL)
+
+
+def decode_revision(data: bytes):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
@@ -0,0 +1,102 @@
+"""
+実行例: from static_assets import StaticAssets; assets = StaticAssets("client/dist"); assets.get("assets/index-1a2b3c.js")
+概要: Reactのビルド成果物を一度だけ走査して索引化し、index.html をメモリに保持する。.br/.gz の事前圧縮ファイルも対応付ける。
+"""
+
+import mimetypes
+import os
+import threading
+import time
+from typing import NamedTuple
+
+# 事前圧縮ファイルの拡張子と Content-Encoding の対応（優先順）
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+class Asset(NamedTuple):
+    path: str
+    mimetype: str
+    etag: str
+    # Content-Encoding -> (ファイルパス, ETag)
+    variants: dict[str, tuple[str, str]]
+
+
+def _file_etag(st: os.stat_result) -> str:
+    # 内容のハッシュは取らず、サイズと更新時刻から作る（走査を安くするため）
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+class StaticAssets:
+    def __init__(self, root: str, rescan_interval: float = 2.0) -> None:
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self._assets: dict[str, Asset] = {}
+        self._index: tuple[bytes, str] | None = None
+        self._signature: tuple | None = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _current_signature(self) -> tuple:
+        # Viteは再ビルドのたびに index.html と assets/ を書き換えるため、この2つの stat で変化を検知する
+        signature = []
+        for path in (os.path.join(self.root, "index.html"), os.path.join(self.root, "assets")):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.rescan_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.rescan_interval:
+                return
+            signature = self._current_signature()
+            if signature != self._signature:
+                self._scan()
+                self._signature = signature
+            self._checked_at = now
+
+    def _scan(self) -> None:
+        files: dict[str, os.stat_result] = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                files[rel_path] = os.stat(path)
+
+        assets = {}
+        for rel_path, st in files.items():
+            if rel_path.endswith(tuple(suffix for _, suffix in PRECOMPRESSED)):
+                base = rel_path.rsplit(".", 1)[0]
+                if base in files:
+                    continue
+            variants = {}
+            for encoding, suffix in PRECOMPRESSED:
+                variant_st = files.get(rel_path + suffix)
+                if variant_st is not None:
+                    variants[encoding] = (
+                        os.path.join(self.root, rel_path + suffix),
+                        f"{_file_etag(variant_st)}-{suffix[1:]}",
+                    )
+            mimetype = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+            assets[rel_path] = Asset(os.path.join(self.root, rel_path), mimetype, _file_etag(st), variants)
+
+        index = None
+        if "index.html" in files:
+            with open(os.path.join(self.root, "index.html"), "rb") as fp:
+                index = (fp.read(), _file_etag(files["index.html"]))
+        self._assets = assets
+        self._index = index
+
+    def get(self, rel_path: str) -> Asset | None:
+        self.refresh()
+        return self._assets.get(rel_path)
+
+    def index(self) -> tuple[bytes, str] | None:
+        self.refresh()
+        return self._index
@@ -3,8 +3,12 @@
 概要: FlaskアプリのAPIエンドポイントが認証付きでCRUD動作することを検証する。
 """
 
+import gzip
+import io
+import json
 import sqlite3
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
@@ -12,6 +16,7 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 import pytest
+from werkzeug.security import generate_password_hash
 
 import app as flask_app
 
@@ -58,13 +63,21 @@ def client(tmp_path):
         yield test_client
 
 
-def _allow_user(userid: str, role: str = "member") -> None:
+def _allow_user(userid: str, role: str = "member", household: str | None = None) -> None:
     db_path = flask_app.app.config["DATABASE"]
     conn = sqlite3.connect(db_path)
-    conn.execute(
-        "insert into allowed_users (userid, role) values (?, ?)",
-        (userid, role),
-    )
+    if household is None:
+        conn.execute(
+            "insert into allowed_users (userid, role) values (?, ?)",
+            (userid, role),
+        )
+    else:
+        # household 列はマイグレーションで追加されるため、先にスキーマを最新にしておく
+        flask_app.ensure_schema(conn)
+        conn.execute(
+            "insert into allowed_users (userid, role, household) values (?, ?, ?)",
+            (userid, role, household),
+        )
     conn.commit()
     conn.close()
 
@@ -145,3 +158,855 @@ def test_recipes_crud_flow(client):
     list_after_delete = client.get("/api/recipes")
     assert list_after_delete.status_code == 200
     assert list_after_delete.get_json() == []
+
+
+def _create_recipes(client, count):
+    ids = []
+    for idx in range(count):
+        resp = client.post("/api/recipes", json={"title": f"レシピ{idx}"})
+        assert resp.status_code == 201
+        ids.append(resp.get_json()["id"])
+    return ids
+
+
+def test_recipes_keyset_pagination(client):
+    _signup_and_login(client)
+    ids = _create_recipes(client, 5)
+
+    first = client.get("/api/recipes?limit=2").get_json()
+    assert [r["id"] for r in first["recipes"]] == ids[:2]
+    assert first["next_cursor"] == ids[1]
+
+    second = client.get(f"/api/recipes?limit=2&after={first['next_cursor']}").get_json()
+    assert [r["id"] for r in second["recipes"]] == ids[2:4]
+
+    last = client.get(f"/api/recipes?limit=2&after={second['next_cursor']}").get_json()
+    assert [r["id"] for r in last["recipes"]] == ids[4:]
+    assert last["next_cursor"] is None
+
+    assert client.get("/api/recipes?limit=abc").status_code == 400
+    assert client.get("/api/recipes?limit=0").status_code == 400
+
+
+def test_recipes_stream_mode(client):
+    _signup_and_login(client)
+    ids = _create_recipes(client, 3)
+
+    resp = client.get("/api/recipes?stream=1")
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/json"
+    assert [r["id"] for r in resp.get_json()] == ids
+
+    resp = client.get(f"/api/recipes?stream=1&after={ids[0]}")
+    assert [r["id"] for r in resp.get_json()] == ids[1:]
+
+
+def test_streaming_reuses_the_request_connection(client, monkeypatch):
+    # 接続が1本でも、ビューで借りた接続をストリーミングに引き継ぐため詰まらない
+    monkeypatch.setitem(flask_app.app.config, "SQLITE_POOL_SIZE", 1)
+    monkeypatch.setitem(flask_app.app.config, "SQLITE_POOL_TIMEOUT", 0.2)
+    _signup_and_login(client)
+    ids = _create_recipes(client, 2)
+    for _ in range(3):
+        assert [r["id"] for r in client.get("/api/recipes?stream=1").get_json()] == ids
+        assert client.get("/api/recipes/export").status_code == 200
+
+
+def test_recipe_search_uses_fts_index(client):
+    _signup_and_login(client)
+    pork = client.post(
+        "/api/recipes",
+        json={"title": "豚肉とキャベツの味噌炒め", "ingredients": "豚肉 / キャベツ / 味噌", "steps": "強火で炒める"},
+    ).get_json()
+    salad = client.post(
+        "/api/recipes",
+        json={"title": "キャベツのコールスロー", "ingredients": "キャベツ / マヨネーズ"},
+    ).get_json()
+
+    resp = client.get("/api/recipes/search?q=キャベツ")
+    assert resp.status_code == 200
+    found = {r["id"] for r in resp.get_json()["results"]}
+    assert found == {pork["id"], salad["id"]}
+    assert all("【" in r["snippet"] for r in resp.get_json()["results"])
+
+    # trigram未満の短い語は1・2文字の索引（recipe_gram）で引く。英字は大文字・小文字を区別しない
+    short = client.get("/api/recipes/search?q=豚肉").get_json()["results"]
+    assert [r["id"] for r in short] == [pork["id"]]
+    assert "【豚肉】" in short[0]["snippet"]
+    assert [r["id"] for r in client.get("/api/recipes/search?q=噌").get_json()["results"]] == [pork["id"]]
+    # 短い語の索引はタイトル・材料だけ（作り方・メモは3文字以上の語で引く）
+    assert client.get("/api/recipes/search?q=強火").get_json()["results"] == []
+    assert [r["id"] for r in client.get("/api/recipes/search?q=強火で").get_json()["results"]] == [pork["id"]]
+    assert [r["id"] for r in client.get("/api/recipes/search?q=キャベツ 味噌").get_json()["results"]] == [pork["id"]]
+    mayo = client.post("/api/recipes", json={"title": "BLTサンド", "ingredients": "ベーコン"}).get_json()
+    found = client.get("/api/recipes/search?q=bl").get_json()["results"]
+    assert [r["id"] for r in found] == [mayo["id"]] and "【BL】" in found[0]["snippet"]
+    client.delete(f"/api/recipes/{mayo['id']}")
+    conn = sqlite3.connect(flask_app.app.config["DATABASE"])
+    plan = " ".join(
+        row[3] for row in conn.execute(
+            "explain query plan select id from recipe where recipe.id in"
+            " (select recipe_id from recipe_gram where household = ? and gram = ?) and household = ?",
+            ["tester", "豚肉", "tester"],
+        )
+    )
+    assert "recipe_gram" in plan and "SCAN recipe_gram" not in plan
+    conn.close()
+
+    # 更新・削除がインデックスへ反映される（FTSはトリガ、recipe_gram は更新・削除の処理で差分だけ書き換える）
+    client.put(f"/api/recipes/{salad['id']}", json={"title": "人参のラペ", "ingredients": "人参"})
+    client.delete(f"/api/recipes/{pork['id']}")
+    assert client.get("/api/recipes/search?q=キャベツ").get_json()["results"] == []
+    assert [r["id"] for r in client.get("/api/recipes/search?q=人参のラペ").get_json()["results"]] == [salad["id"]]
+    assert [r["id"] for r in client.get("/api/recipes/search?q=ラペ").get_json()["results"]] == [salad["id"]]
+    assert client.get("/api/recipes/search?q=豚肉").get_json()["results"] == []
+    conn = sqlite3.connect(flask_app.app.config["DATABASE"])
+    assert conn.execute("select count(*) from recipe_gram where recipe_id = ?", [pork["id"]]).fetchone()[0] == 0
+    assert conn.execute("select count(*) from recipe_gram where gram = 'キャ'").fetchone()[0] == 0
+    conn.close()
+
+    assert client.get("/api/recipes/search").status_code == 400
+
+
+def test_schema_migrations_upgrade_legacy_db(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE user (unum integer primary key autoincrement, userid text not null unique, password text not null);
+        CREATE TABLE recipe (id integer primary key autoincrement, title text not null, body text);
+        INSERT INTO recipe (title, body) VALUES ('肉じゃが', 'じゃがいも / 牛肉');
+        """
+    )
+    conn.close()
+
+    flask_app.app.config.update(DATABASE=str(db_path))
+    result = flask_app.app.test_cli_runner().invoke(args=["db", "upgrade"])
+    assert result.exit_code == 0
+    assert f"-> {flask_app.SCHEMA_VERSION}" in result.output
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == flask_app.SCHEMA_VERSION
+    columns = {row[1] for row in conn.execute("PRAGMA table_info('recipe')")}
+    assert "body" not in columns
+    assert conn.execute("select ingredients from recipe").fetchone()[0] == "じゃがいも / 牛肉"
+    assert "role" in {row[1] for row in conn.execute("PRAGMA table_info('user')")}
+    assert conn.execute("select household from recipe").fetchone()[0] == flask_app.DEFAULT_HOUSEHOLD
+    assert conn.execute("select household, name from recipe_ingredient order by position").fetchall() == [
+        (flask_app.DEFAULT_HOUSEHOLD, "じゃがいも"),
+        (flask_app.DEFAULT_HOUSEHOLD, "牛肉"),
+    ]
+
+    # 適用済みのDBに対しては何もしない
+    assert flask_app.ensure_schema(conn) == flask_app.SCHEMA_VERSION
+    conn.close()
+
+
+def test_recipe_gram_migration_drops_legacy_index(tmp_path):
+    conn = sqlite3.connect(tmp_path / "grams.db")
+    flask_app.ensure_schema(conn)
+    conn.execute("insert into recipe (title, ingredients, steps, updated_at) values ('卵焼き', '卵', '弱火', '')")
+    # 初期のマイグレーション13の形（作り方も含む・recipe_id の索引あり）を再現する
+    conn.execute("insert into recipe_gram (household, gram, recipe_id) values ('default', '弱火', 1)")
+    conn.execute("create index recipe_gram_recipe on recipe_gram (recipe_id)")
+    conn.execute("PRAGMA user_version = 13")
+    assert flask_app.ensure_schema(conn) == flask_app.SCHEMA_VERSION
+    assert conn.execute("select 1 from sqlite_master where name = 'recipe_gram_recipe'").fetchone() is None
+    grams = {row[0] for row in conn.execute("select gram from recipe_gram where recipe_id = 1")}
+    assert grams == {"卵", "焼", "き", "卵焼", "焼き"}
+    conn.close()
+
+
+def test_recipes_conditional_get(client):
+    _signup_and_login(client)
+    recipe_id = _create_recipes(client, 1)[0]
+
+    list_resp = client.get("/api/recipes")
+    etag = list_resp.headers["ETag"]
+    assert list_resp.headers["Last-Modified"]
+    not_modified = client.get("/api/recipes", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    # クエリが異なれば別のETag
+    paged = client.get("/api/recipes?limit=1")
+    assert paged.headers["ETag"] != etag
+
+    detail = client.get(f"/api/recipes/{recipe_id}")
+    detail_etag = detail.headers["ETag"]
+    assert client.get(
+        f"/api/recipes/{recipe_id}", headers={"If-None-Match": detail_etag}
+    ).status_code == 304
+
+    client.put(f"/api/recipes/{recipe_id}", json={"title": "更新後"})
+    assert client.get("/api/recipes", headers={"If-None-Match": etag}).status_code == 200
+    refreshed = client.get(f"/api/recipes/{recipe_id}", headers={"If-None-Match": detail_etag})
+    assert refreshed.status_code == 200
+    assert refreshed.get_json()["title"] == "更新後"
+    assert refreshed.headers["ETag"] != detail_etag
+
+
+def test_bulk_import_and_export(client, monkeypatch):
+    _signup_and_login(client)
+    monkeypatch.setitem(flask_app.app.config, "BULK_CHUNK_SIZE", 2)
+    # 一括取り込みは写真向けの本文の上限を受けない
+    monkeypatch.setitem(flask_app.app.config, "MAX_CONTENT_LENGTH", 16)
+    body = "\n".join([
+        '{"title": "カレー", "ingredients": "玉ねぎ / 人参"}',
+        '{"title": "  シチュー  "}',
+        '{"ingredients": "タイトル無し"}',
+        "not json",
+        "",
+        '{"title": "ポトフ", "notes": 1}',
+        '{"title": "豚汁", "steps": "煮る"}',
+    ])
+    resp = client.post("/api/recipes/bulk", data=body, content_type="application/x-ndjson")
+    assert resp.status_code == 200
+    summary = resp.get_json()
+    assert summary["imported"] == 3
+    assert summary["failed"] == 3
+    assert [e["line"] for e in summary["errors"]] == [3, 4, 6]
+    assert summary["errors"][0]["error"] == "title is required"
+
+    resp = client.post("/api/recipes/bulk", json=[{"title": "肉じゃが"}])
+    assert resp.get_json()["imported"] == 1
+    assert client.post("/api/recipes/bulk", json={"title": "x"}).status_code == 400
+    # 不正な行が多くても、応答に載せる内容は先頭の BULK_ERROR_REPORT_LIMIT 件だけ（件数は全件）
+    noisy = client.post(
+        "/api/recipes/bulk",
+        data="not json\n" * (flask_app.BULK_ERROR_REPORT_LIMIT + 50),
+        content_type="application/x-ndjson",
+    ).get_json()
+    assert noisy["failed"] == flask_app.BULK_ERROR_REPORT_LIMIT + 50
+    assert len(noisy["errors"]) == flask_app.BULK_ERROR_REPORT_LIMIT
+
+    # 一括取り込みでも短い語の索引が作られる
+    assert [r["title"] for r in client.get("/api/recipes/search?q=豚汁").get_json()["results"]] == ["豚汁"]
+
+    export = client.get("/api/recipes/export")
+    assert export.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in export.get_data(as_text=True).splitlines()]
+    assert [r["title"] for r in lines] == ["カレー", "シチュー", "豚汁", "肉じゃが"]
+
+
+def test_recipe_cache_stats_and_invalidation(client):
+    _allow_user("chef", role="admin")
+    client.post("/api/signup", json={"userid": "chef", "password": "secret"})
+    client.post("/api/login", json={"userid": "chef", "password": "secret"})
+    recipe_id = _create_recipes(client, 1)[0]
+
+    client.get(f"/api/recipes/{recipe_id}")
+    client.get(f"/api/recipes/{recipe_id}")
+    client.get("/api/recipes")
+    client.get("/api/recipes")
+    stats = client.get("/api/cache/stats").get_json()
+    assert stats["recipes"]["hits"] >= 1
+    assert stats["lists"]["hits"] == 1
+
+    client.put(f"/api/recipes/{recipe_id}", json={"title": "書き換え"})
+    # 書き込んだ値は入れず、次の参照でDBから読み直す（並行した更新で古い版を書き戻さないため）
+    with flask_app.app.app_context():
+        assert flask_app._get_recipe_cache().get_recipe(recipe_id) is None
+    assert client.get(f"/api/recipes/{recipe_id}").get_json()["title"] == "書き換え"
+    assert client.get("/api/recipes").get_json()[0]["title"] == "書き換え"
+
+    client.delete(f"/api/recipes/{recipe_id}")
+    assert client.get(f"/api/recipes/{recipe_id}").status_code == 404
+    assert client.get("/api/recipes").get_json() == []
+
+
+def test_recipe_cache_is_invalidated_by_external_writes(client):
+    _signup_and_login(client)
+    recipe_id = _create_recipes(client, 1)[0]
+    client.get(f"/api/recipes/{recipe_id}")
+    assert client.get(f"/api/recipes/{recipe_id}").get_json()["title"] != "CLIで変更"
+
+    # 別のワーカー・CLIからの書き込みは、DBの隣の世代ファイルを介して無効化される
+    db_path = flask_app.app.config["DATABASE"]
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("update recipe set title = 'CLIで変更' where id = ?", [recipe_id])
+    flask_app.bump_recipe_cache_generation(db_path)
+    assert client.get(f"/api/recipes/{recipe_id}").get_json()["title"] == "CLIで変更"
+
+
+def test_cache_stats_requires_admin(client):
+    _signup_and_login(client)
+    assert client.get("/api/cache/stats").status_code == 403
+
+
+def test_recipe_list_projection_and_compression(client):
+    _signup_and_login(client)
+    client.post(
+        "/api/recipes",
+        json={"title": "ぶり大根", "ingredients": "ぶり / 大根", "steps": "煮込む" * 500, "notes": "圧力鍋でも可"},
+    )
+
+    summary = client.get("/api/recipes?fields=title,ingredients").get_json()
+    assert summary == [{"id": 1, "title": "ぶり大根", "ingredients": "ぶり / 大根"}]
+    paged = client.get("/api/recipes?fields=title&limit=5").get_json()
+    assert paged["recipes"] == [{"id": 1, "title": "ぶり大根"}]
+    assert client.get("/api/recipes?fields=secret").status_code == 400
+
+    plain = client.get("/api/recipes")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    compressed = client.get("/api/recipes", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert len(compressed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+
+    again = client.get(
+        "/api/recipes",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]},
+    )
+    assert again.status_code == 304
+
+
+def test_login_upgrades_password_hash(client, monkeypatch):
+    monkeypatch.setitem(flask_app.app.config, "PASSWORD_HASH_METHOD", "pbkdf2:sha256:2000")
+    db_path = flask_app.app.config["DATABASE"]
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "insert into user (userid, password) values (?, ?)",
+        ("legacy", generate_password_hash("secret", "pbkdf2:sha256:1000")),
+    )
+    conn.commit()
+    conn.close()
+
+    assert client.post("/api/login", json={"userid": "legacy", "password": "wrong"}).status_code == 401
+    assert client.post("/api/login", json={"userid": "legacy", "password": "secret"}).status_code == 200
+
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute("select password from user where userid = 'legacy'").fetchone()[0]
+    conn.close()
+    assert stored.startswith("pbkdf2:sha256:2000$")
+    assert client.post("/api/login", json={"userid": "legacy", "password": "secret"}).status_code == 200
+
+
+def test_password_hasher_is_created_once_under_concurrency(client, monkeypatch):
+    monkeypatch.setitem(flask_app.app.config, "PASSWORD_HASH_WORKERS", 0)
+    flask_app.app.extensions.pop("password_hasher", None)
+
+    def get_hasher(_):
+        with flask_app.app.app_context():
+            return flask_app._get_password_hasher()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        hashers = list(executor.map(get_hasher, range(32)))
+    assert len({id(hasher) for hasher in hashers}) == 1
+
+
+def test_login_returns_503_when_hasher_is_saturated(client, monkeypatch):
+    _signup_and_login(client)
+    monkeypatch.setitem(flask_app.app.config, "PASSWORD_HASH_WORKERS", 0)
+    monkeypatch.setitem(flask_app.app.config, "PASSWORD_HASH_MAX_PENDING", 1)
+    with flask_app.app.app_context():
+        hasher = flask_app._get_password_hasher()
+    hasher._slots.acquire()
+    try:
+        resp = client.post("/api/login", json={"userid": "tester", "password": "secret"})
+    finally:
+        hasher._slots.release()
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_metrics_endpoint_and_profiling(client, monkeypatch, tmp_path):
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setitem(flask_app.app.config, "PROFILE_DIR", str(profile_dir))
+    _signup_and_login(client)
+    resp = client.get("/api/recipes", headers={"X-Profile": "1"})
+    assert "db;dur=" in resp.headers["Server-Timing"]
+    # 既定では無効
+    assert not profile_dir.exists()
+
+    # 有効にしても一般ユーザのリクエストは計測しない
+    monkeypatch.setitem(flask_app.app.config, "PROFILE_REQUESTS", True)
+    monkeypatch.setitem(flask_app.app.config, "PROFILE_MAX_FILES", 2)
+    client.get("/api/recipes", headers={"X-Profile": "1"})
+    assert not profile_dir.exists()
+
+    # 一般ユーザは参照できない
+    assert client.get("/metrics").status_code == 403
+
+    monkeypatch.setitem(flask_app.app.config, "METRICS_TOKEN", "scrape-token")
+    metrics = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert metrics.status_code == 200
+    text = metrics.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/recipes",status="200"}' in text
+    assert "sqlite_queries_total" in text
+    assert "password_hash_duration_seconds_count" in text
+
+
+def test_profiling_is_admin_only_and_rotated(client, monkeypatch, tmp_path):
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setitem(flask_app.app.config, "PROFILE_DIR", str(profile_dir))
+    monkeypatch.setitem(flask_app.app.config, "PROFILE_REQUESTS", True)
+    monkeypatch.setitem(flask_app.app.config, "PROFILE_MAX_FILES", 2)
+    _allow_user("chef", role="admin")
+    client.post("/api/signup", json={"userid": "chef", "password": "secret"})
+    client.post("/api/login", json={"userid": "chef", "password": "secret"})
+
+    for _ in range(3):
+        resp = client.get("/api/recipes", headers={"X-Profile": "1"})
+        # サーバ上のパスは返さない
+        assert "X-Profile-File" not in resp.headers
+    assert len(list(profile_dir.glob("*.prof"))) == 2
+
+
+def test_recipes_by_ingredients(client):
+    _signup_and_login(client)
+    stir_fry = client.post(
+        "/api/recipes", json={"title": "回鍋肉", "ingredients": "豚肉 200g / キャベツ 1/4玉 / 味噌 大さじ1"}
+    ).get_json()["id"]
+    soup = client.post(
+        "/api/recipes", json={"title": "豚汁", "ingredients": "豚肉、大根、人参、味噌"}
+    ).get_json()["id"]
+    salad = client.post(
+        "/api/recipes", json={"title": "コールスロー", "ingredients": "キャベツ\nマヨネーズ"}
+    ).get_json()["id"]
+
+    both = client.get("/api/recipes/by-ingredients?have=豚肉&have=キャベツ").get_json()
+    assert [r["id"] for r in both["results"]] == [stir_fry]
+
+    any_match = client.get("/api/recipes/by-ingredients?have=豚肉,キャベツ&match=any").get_json()
+    assert {r["id"] for r in any_match["results"]} == {stir_fry, soup, salad}
+
+    ranked = client.get(
+        "/api/recipes/by-ingredients?have=キャベツ&have=マヨネーズ&have=豚肉&match=ranked"
+    ).get_json()["results"]
+    assert ranked[0]["id"] == salad
+    assert ranked[0]["coverage"] == 1.0
+    stir_fry_result = next(r for r in ranked if r["id"] == stir_fry)
+    assert stir_fry_result["missing"] == ["味噌"]
+
+    # 更新・削除で材料インデックスも追従する
+    client.put(f"/api/recipes/{soup}", json={"title": "けんちん汁", "ingredients": "大根 / 人参 / 豆腐"})
+    client.delete(f"/api/recipes/{stir_fry}")
+    assert client.get("/api/recipes/by-ingredients?have=豚肉").get_json()["results"] == []
+
+    assert client.get("/api/recipes/by-ingredients").status_code == 400
+    assert client.get("/api/recipes/by-ingredients?have=卵&match=some").status_code == 400
+
+
+def test_recipe_tags_filter_and_counts(client):
+    _signup_and_login(client)
+    curry = client.post(
+        "/api/recipes", json={"title": "カレー", "tags": ["#和食", "作り置き", "作り置き"]}
+    ).get_json()
+    assert curry["tags"] == ["作り置き", "和食"]
+    nimono = client.post("/api/recipes", json={"title": "肉じゃが", "tags": ["和食"]}).get_json()["id"]
+    client.post("/api/recipes", json={"title": "サラダ", "tags": ["ＳＡＬＡＤ"]})
+    client.post("/api/recipes", json={"title": "タグなし"})
+
+    assert [r["title"] for r in client.get("/api/recipes?tag=和食").get_json()] == ["カレー", "肉じゃが"]
+    both = client.get("/api/recipes?tag=和食&tag=作り置き&limit=10").get_json()
+    assert [r["id"] for r in both["recipes"]] == [curry["id"]]
+    assert client.get("/api/recipes?tag=存在しない").get_json() == []
+    assert client.get("/api/recipes?tag=salad&fields=title").get_json()[0] == {"id": 3, "title": "サラダ"}
+
+    tags = client.get("/api/tags")
+    assert tags.get_json()["tags"] == [
+        {"name": "和食", "count": 2},
+        {"name": "salad", "count": 1},
+        {"name": "作り置き", "count": 1},
+    ]
+    assert client.get("/api/tags", headers={"If-None-Match": tags.headers["ETag"]}).status_code == 304
+
+    # tags を省略した更新は既存のタグを維持し、指定した場合は置き換える
+    kept = client.put(f"/api/recipes/{curry['id']}", json={"title": "ポークカレー"}).get_json()
+    assert kept["tags"] == ["作り置き", "和食"]
+    replaced = client.put(f"/api/recipes/{curry['id']}", json={"title": "ポークカレー", "tags": ["洋食"]})
+    assert replaced.get_json()["tags"] == ["洋食"]
+    assert client.get(f"/api/recipes/{curry['id']}").get_json()["tags"] == ["洋食"]
+    client.delete(f"/api/recipes/{nimono}")
+    counts = {tag["name"]: tag["count"] for tag in client.get("/api/tags").get_json()["tags"]}
+    assert counts == {"salad": 1, "洋食": 1}
+
+    assert client.post("/api/recipes", json={"title": "x", "tags": "和食"}).status_code == 400
+
+
+def test_batch_operations(client):
+    _signup_and_login(client)
+    existing = client.post("/api/recipes", json={"title": "親子丼"}).get_json()["id"]
+    doomed = client.post("/api/recipes", json={"title": "消すレシピ"}).get_json()["id"]
+    client.get(f"/api/recipes/{existing}")  # キャッシュに載せておく
+
+    response = client.post("/api/batch", json={"operations": [
+        {"op": "create", "recipe": {"title": "麻婆豆腐", "tags": ["中華"]}},
+        {"op": "update", "id": existing, "recipe": {"title": "他人丼"}},
+        {"op": "get", "id": existing},
+        {"op": "delete", "id": doomed},
+        {"op": "get", "id": doomed},
+        {"op": "update", "id": 999, "recipe": {"title": "x"}},
+        {"op": "create", "recipe": {"ingredients": "卵"}},
+        {"op": "rename"},
+    ]})
+    assert response.status_code == 200
+    # 既定は部分コミット。失敗した操作だけが飛ばされる
+    assert response.get_json()["committed"] is True
+    results = response.get_json()["results"]
+    assert [r["status"] for r in results] == [201, 200, 200, 200, 404, 404, 400, 400]
+    assert results[0]["recipe"]["tags"] == ["中華"]
+    assert results[2]["recipe"]["title"] == "他人丼"
+    assert results[6]["error"] == "title is required"
+
+    # コミット後はキャッシュ経由の単体APIにも反映されている
+    assert client.get(f"/api/recipes/{existing}").get_json()["title"] == "他人丼"
+    assert client.get(f"/api/recipes/{doomed}").status_code == 404
+    assert [r["title"] for r in client.get("/api/recipes").get_json()] == ["他人丼", "麻婆豆腐"]
+
+    assert client.post("/api/batch", json={"op": "get"}).status_code == 400
+
+    # atomic なら1つでも失敗すると全操作を取り消す
+    rolled_back = client.post("/api/batch", json={"atomic": True, "operations": [
+        {"op": "create", "recipe": {"title": "回鍋肉"}},
+        {"op": "delete", "id": existing},
+        {"op": "update", "id": 999, "recipe": {"title": "x"}},
+    ]})
+    assert rolled_back.status_code == 409 and rolled_back.get_json()["committed"] is False
+    assert [r["status"] for r in rolled_back.get_json()["results"]] == [424, 424, 404]
+    assert [r["title"] for r in client.get("/api/recipes").get_json()] == ["他人丼", "麻婆豆腐"]
+    committed = client.post("/api/batch", json={"atomic": True, "operations": [
+        {"op": "create", "recipe": {"title": "回鍋肉"}},
+    ]})
+    assert committed.status_code == 200 and committed.get_json()["results"][0]["status"] == 201
+
+
+def test_login_rate_limit_rejects_before_lookup(client, monkeypatch):
+    _allow_user("tester")
+    client.post("/api/signup", json={"userid": "tester", "password": "secret"})
+    monkeypatch.setitem(flask_app.app.config, "LOGIN_USER_BURST", 3)
+    monkeypatch.setitem(flask_app.app.config, "LOGIN_LOCKOUT_AFTER", 100)
+
+    for _ in range(3):
+        resp = client.post("/api/login", json={"userid": "tester", "password": "wrong"})
+        assert resp.status_code == 401
+
+    def fail_lookup():
+        raise AssertionError("user table must not be queried")
+
+    monkeypatch.setattr(flask_app, "get_db", fail_lookup)
+    blocked = client.post("/api/login", json={"userid": "tester", "password": "secret"})
+    assert blocked.status_code == 429
+    assert int(blocked.headers["Retry-After"]) >= 1
+
+
+def test_login_rate_limit_keys_on_forwarded_client_ip(client, monkeypatch):
+    # TRUSTED_PROXY_HOPS=1 で起動した場合と同じ構成。プロキシ経由でもクライアントごとに別のバケットになる
+    monkeypatch.setattr(flask_app.app, "wsgi_app", flask_app.ProxyFix(flask_app.app.wsgi_app, x_for=1))
+    monkeypatch.setitem(flask_app.app.config, "LOGIN_IP_BURST", 2)
+
+    def attempt(ip):
+        return client.post(
+            "/api/login",
+            json={"userid": f"user-{ip}", "password": "wrong"},
+            headers={"X-Forwarded-For": f"198.51.100.7, {ip}"},
+        ).status_code
+
+    assert [attempt("203.0.113.1") for _ in range(3)] == [401, 401, 429]
+    assert attempt("203.0.113.2") == 401
+
+
+def test_login_success_resets_ip_failures(client, monkeypatch):
+    _allow_user("tester")
+    client.post("/api/signup", json={"userid": "tester", "password": "secret"})
+    monkeypatch.setitem(flask_app.app.config, "LOGIN_LOCKOUT_AFTER", 3)
+
+    # 同じIPの家族の打ち間違いは、ログインに成功すれば積み重ならない
+    for _ in range(2):
+        for userid in ("tester", "mother"):
+            resp = client.post("/api/login", json={"userid": userid, "password": "wrong"})
+            assert resp.status_code == 401
+        assert client.post("/api/login", json={"userid": "tester", "password": "secret"}).status_code == 200
+
+
+def test_static_assets_are_indexed_and_precompressed(client, tmp_path, monkeypatch):
+    build_dir = tmp_path / "dist"
+    (build_dir / "assets").mkdir(parents=True)
+    (build_dir / "index.html").write_text("<html>v1</html>", encoding="utf-8")
+    (build_dir / "assets" / "index-1a2b3c.js").write_text("console.log(1)", encoding="utf-8")
+    (build_dir / "assets" / "index-1a2b3c.js.gz").write_bytes(gzip.compress(b"console.log(1)"))
+    (build_dir / "favicon.ico").write_bytes(b"\x00\x00\x01\x00")
+    monkeypatch.setitem(flask_app.app.config, "CLIENT_BUILD_DIR", str(build_dir))
+    monkeypatch.setitem(flask_app.app.config, "STATIC_RESCAN_INTERVAL", 0)
+
+    page = client.get("/login")
+    assert page.get_data(as_text=True) == "<html>v1</html>"
+    assert page.headers["Cache-Control"] == "no-cache"
+    assert client.get("/login", headers={"If-None-Match": page.headers["ETag"]}).status_code == 304
+    assert client.get("/recipes/1/edit").get_data(as_text=True) == "<html>v1</html>"
+
+    plain = client.get("/assets/index-1a2b3c.js")
+    assert plain.get_data() == b"console.log(1)"
+    assert "immutable" in plain.headers["Cache-Control"]
+    assert "max-age=31536000" in plain.headers["Cache-Control"]
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    compressed = client.get("/assets/index-1a2b3c.js", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.mimetype == "text/javascript"
+    assert gzip.decompress(compressed.get_data()) == b"console.log(1)"
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+
+    assert client.get("/assets/index-1a2b3c.js.gz").status_code == 404
+    assert client.get("/assets/../index.html").status_code == 404
+    assert "immutable" not in client.get("/favicon.ico").headers["Cache-Control"]
+
+    # 再ビルドで index.html が差し替わると再走査される
+    (build_dir / "index.html").write_text("<html>v2</html>", encoding="utf-8")
+    assert client.get("/").get_data(as_text=True) == "<html>v2</html>"
+
+
+def test_recipe_revisions_and_restore(client):
+    _signup_and_login(client)
+    steps = "\n".join(f"{n}. 手順{n}" for n in range(1, 30))
+    recipe_id = client.post(
+        "/api/recipes", json={"title": "カレー", "steps": steps, "tags": ["定番"]}
+    ).get_json()["id"]
+    for n in range(2, 14):
+        client.put(
+            f"/api/recipes/{recipe_id}",
+            json={"title": "カレー", "steps": steps.replace("手順5\n", f"手順5（{n}回目）\n")},
+        )
+
+    listing = client.get(f"/api/recipes/{recipe_id}/revisions").get_json()["revisions"]
+    assert [r["version"] for r in listing] == list(range(13, 0, -1))
+    kinds = {r["version"]: r["kind"] for r in listing}
+    # 10版ごとに全文スナップショットを挟み、間は差分で持つ
+    assert kinds[1] == kinds[11] == "snapshot"
+    assert {kinds[v] for v in (2, 10, 12, 13)} == {"delta"}
+    page = client.get(f"/api/recipes/{recipe_id}/revisions?limit=2&before=5").get_json()["revisions"]
+    assert [r["version"] for r in page] == [4, 3]
+
+    v1 = client.get(f"/api/recipes/{recipe_id}/revisions/1").get_json()
+    assert v1["steps"] == steps and v1["tags"] == ["定番"]
+    v12 = client.get(f"/api/recipes/{recipe_id}/revisions/12").get_json()
+    assert "手順5（12回目）" in v12["steps"]
+
+    restored = client.post(f"/api/recipes/{recipe_id}/revisions/1/restore")
+    assert restored.status_code == 200
+    assert restored.get_json()["steps"] == steps
+    current = client.get(f"/api/recipes/{recipe_id}").get_json()
+    assert current["steps"] == steps and current["tags"] == ["定番"]
+    assert client.get(f"/api/recipes/{recipe_id}/revisions/14").get_json()["steps"] == steps
+
+    assert client.get(f"/api/recipes/{recipe_id}/revisions/99").status_code == 404
+    client.delete(f"/api/recipes/{recipe_id}")
+    assert client.get(f"/api/recipes/{recipe_id}/revisions").status_code == 404
+
+
+def test_recipe_changes_feed(client):
+    _signup_and_login(client)
+    _create_recipes(client, 3)
+    full = client.get("/api/recipes/changes").get_json()
+    assert [r["id"] for r in full["recipes"]] == [1, 2, 3]
+    assert full["deleted"] == [] and full["has_more"] is False
+    since = full["next_since"]
+
+    unchanged = client.get(f"/api/recipes/changes?since={since}")
+    assert unchanged.get_json()["recipes"] == []
+    assert client.get(
+        f"/api/recipes/changes?since={since}", headers={"If-None-Match": unchanged.headers["ETag"]}
+    ).status_code == 304
+
+    client.put("/api/recipes/2", json={"title": "更新済み"})
+    client.delete("/api/recipes/3")
+    client.post("/api/recipes/bulk", json=[{"title": "取り込みA"}, {"title": "取り込みB"}])
+    delta = client.get(f"/api/recipes/changes?since={since}&fields=title").get_json()
+    assert [(r["id"], r["title"]) for r in delta["recipes"]] == [(2, "更新済み"), (4, "取り込みA"), (5, "取り込みB")]
+    assert delta["deleted"] == [3]
+
+    # limit で区切っても、同じ採番値の行（一括取り込み分）はページをまたがない
+    first = client.get(f"/api/recipes/changes?since={since}&limit=1").get_json()
+    assert [r["id"] for r in first["recipes"]] == [2] and first["has_more"] is True
+    second = client.get(f"/api/recipes/changes?since={first['next_since']}&limit=1").get_json()
+    assert second["deleted"] == [3] and second["recipes"] == []
+    third = client.get(f"/api/recipes/changes?since={second['next_since']}&limit=1").get_json()
+    assert [r["id"] for r in third["recipes"]] == [4, 5] and third["has_more"] is False
+    assert third["next_since"] == delta["next_since"]
+
+    assert client.get("/api/recipes/changes?since=9999").status_code == 400
+
+
+def test_recipes_are_scoped_to_household(client):
+    for userid in ("alice", "bob"):
+        _allow_user(userid, household="tanaka")
+        client.post("/api/signup", json={"userid": userid, "password": "secret"})
+    _allow_user("carol")
+    signup = client.post("/api/signup", json={"userid": "carol", "password": "secret"})
+    assert signup.get_json()["household"] == "carol"
+
+    client.post("/api/login", json={"userid": "alice", "password": "secret"})
+    shared = client.post(
+        "/api/recipes", json={"title": "肉じゃが", "ingredients": "じゃがいも / 牛肉", "tags": ["和食"]}
+    ).get_json()["id"]
+
+    client.post("/api/login", json={"userid": "carol", "password": "secret"})
+    own = client.post("/api/recipes", json={"title": "カレー", "tags": ["和食"]}).get_json()["id"]
+    assert [r["id"] for r in client.get("/api/recipes").get_json()] == [own]
+    assert client.get(f"/api/recipes/{shared}").status_code == 404
+    assert client.put(f"/api/recipes/{shared}", json={"title": "乗っ取り"}).status_code == 404
+    assert client.delete(f"/api/recipes/{shared}").status_code == 404
+    assert client.get(f"/api/recipes/{shared}/revisions").status_code == 404
+    assert client.get("/api/recipes/search?q=肉じゃが").get_json()["results"] == []
+    assert client.get("/api/recipes/search?q=牛肉").get_json()["results"] == []
+    assert client.get("/api/recipes/by-ingredients?have=牛肉&match=any").get_json()["results"] == []
+    assert client.get("/api/tags").get_json()["tags"] == [{"name": "和食", "count": 1}]
+    assert [r["id"] for r in client.get("/api/recipes/changes").get_json()["recipes"]] == [own]
+    batch = client.post("/api/batch", json=[{"op": "get", "id": shared}]).get_json()
+    assert batch["results"][0]["status"] == 404
+
+    # 同じ世帯の別ユーザからは見え、更新・削除もできる
+    client.post("/api/login", json={"userid": "bob", "password": "secret"})
+    assert [r["title"] for r in client.get("/api/recipes?tag=和食").get_json()] == ["肉じゃが"]
+    assert client.put(f"/api/recipes/{shared}", json={"title": "肉じゃが改"}).status_code == 200
+    assert client.delete(f"/api/recipes/{shared}").status_code == 200
+    assert client.get("/api/recipes/changes").get_json()["deleted"] == [shared]
+
+    client.post("/api/login", json={"userid": "carol", "password": "secret"})
+    assert client.get("/api/recipes/changes").get_json()["deleted"] == []
+
+    conn = sqlite3.connect(flask_app.app.config["DATABASE"])
+    assert conn.execute("select owner, household from recipe where id = ?", [own]).fetchone() == ("carol", "carol")
+    plan = " ".join(
+        row[3] for row in conn.execute(
+            "explain query plan select id from recipe where household = ? and id > ? order by id",
+            ["carol", 0],
+        )
+    )
+    assert "recipe_household_id" in plan
+    # 材料の逆引きも自世帯の posting list だけを読む
+    plan = " ".join(
+        row[3] for row in conn.execute(
+            "explain query plan select recipe_id from recipe_ingredient where household = ? and name in (?, ?)",
+            ["carol", "牛肉", "卵"],
+        )
+    )
+    conn.close()
+    assert "recipe_ingredient_household_name" in plan
+
+
+def test_session_auth_is_checked_against_epoch(client, monkeypatch):
+    _signup_and_login(client)
+    conn = sqlite3.connect(flask_app.app.config["DATABASE"])
+    conn.execute("update user set role = 'admin', auth_epoch = auth_epoch + 1 where userid = 'tester'")
+    conn.commit()
+
+    # TTL内はセッションのロールとプロセス内のエポックで判定し、user テーブルを読まない
+    assert client.get("/api/cache/stats").status_code == 403
+    monkeypatch.setitem(flask_app.app.config, "AUTH_EPOCH_TTL", 0)
+    assert client.get("/api/recipes").status_code == 401
+    assert client.get("/api/recipes").status_code == 401
+
+    client.post("/api/login", json={"userid": "tester", "password": "secret"})
+    assert client.get("/api/cache/stats").status_code == 200
+
+    # 削除されたユーザのセッションも TTL 経過後に無効になる
+    conn.execute("delete from user where userid = 'tester'")
+    conn.commit()
+    conn.close()
+    assert client.get("/api/recipes").status_code == 401
+
+
+def test_recipe_photo_upload_and_serving(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.app.config, "PHOTO_DIR", str(tmp_path / "media"))
+    monkeypatch.setitem(flask_app.app.config, "PHOTO_MAX_BYTES", 4096)
+    _signup_and_login(client)
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+    resp = client.post(
+        "/api/recipes",
+        data={"recipe": json.dumps({"title": "オムライス", "tags": ["洋食"]}), "photo": (io.BytesIO(png), "a.png")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 201
+    recipe = resp.get_json()
+    assert recipe["tags"] == ["洋食"]
+    photo_url = recipe["photo"]["url"]
+    assert photo_url.startswith("/media/photos/") and photo_url.endswith(".png")
+    listed = client.get("/api/recipes?fields=title,photo").get_json()
+    assert listed[0]["photo"]["thumbnail_url"] == recipe["photo"]["thumbnail_url"]
+
+    original = client.get(photo_url)
+    assert original.data == png
+    assert original.mimetype == "image/png"
+    assert original.cache_control.private and original.cache_control.immutable
+    assert original.cache_control.max_age == flask_app.IMMUTABLE_MAX_AGE
+    ranged = client.get(photo_url, headers={"Range": "bytes=8-11"})
+    assert ranged.status_code == 206 and ranged.data == bytes(range(4))
+    assert client.get(photo_url, headers={"If-None-Match": original.headers["ETag"]}).status_code == 304
+
+    # サムネイルが未生成（Pillow 未導入を含む）の間は原寸へ回す
+    thumb = client.get(recipe["photo"]["thumbnail_url"])
+    assert thumb.status_code == 302 and thumb.headers["Location"].endswith(photo_url)
+    assert client.get("/media/photos/" + "0" * 64 + ".png").status_code == 404
+
+    # 同じ画像は同じファイル。写真だけの差し替えでも版が進む
+    other = client.post("/api/recipes", json={"title": "カレー"}).get_json()
+    put = client.put(f"/api/recipes/{other['id']}/photo", data=png, content_type="image/png")
+    assert put.status_code == 200 and put.get_json()["photo"]["url"] == photo_url
+    assert client.get(f"/api/recipes/{other['id']}").get_json()["photo"]["url"] == photo_url
+    assert client.put(f"/api/recipes/{other['id']}/photo", data=b"GIF").status_code == 415
+    assert client.put(f"/api/recipes/{other['id']}/photo", data=png * 20).status_code == 413
+    deleted = client.delete(f"/api/recipes/{other['id']}/photo")
+    assert deleted.get_json()["photo"] is None
+    revisions = client.get(f"/api/recipes/{other['id']}/revisions").get_json()["revisions"]
+    # 写真だけの変更は履歴に残さない（空の差分を積まない）
+    assert [r["version"] for r in revisions] == [1]
+
+    # 更新で写真を省略すると現在の写真を維持する
+    updated = client.put(f"/api/recipes/{recipe['id']}", json={"title": "オムライス改"}).get_json()
+    assert updated["photo"]["url"] == photo_url
+
+    # 写真の上限を大きく超える本文は、multipart を読み込む前に断る
+    too_large = client.post(
+        "/api/recipes",
+        data={"recipe": json.dumps({"title": "巨大"}), "photo": (io.BytesIO(png * 5000), "big.png")},
+        content_type="multipart/form-data",
+    )
+    assert too_large.status_code == 413 and b"photo must be" not in too_large.data
+
+    # 対象のレシピが無ければ、この要求で置いた写真は残さない
+    missing = client.put(
+        "/api/recipes/9999",
+        data={"recipe": json.dumps({"title": "幽霊"}), "photo": (io.BytesIO(png + b"\x01"), "b.png")},
+        content_type="multipart/form-data",
+    )
+    assert missing.status_code == 404
+    originals = tmp_path / "media" / "originals"
+    assert sorted(p.name for p in originals.rglob("*.*")) == [photo_url.rsplit("/", 1)[1]]
+
+    # 別の世帯からは、名前が分かっていても取得できない
+    _allow_user("mallory")
+    client.post("/api/signup", json={"userid": "mallory", "password": "secret"})
+    client.post("/api/login", json={"userid": "mallory", "password": "secret"})
+    assert client.get(photo_url).status_code == 404
+    assert client.get(recipe["photo"]["thumbnail_url"]).status_code == 404
+
+
+def test_concurrent_writes_share_the_writer_and_reads_are_read_only(client, monkeypatch):
+    _signup_and_login(client)
+    session_cookie = client.get_cookie("session").value
+    batches = []
+    with flask_app.app.app_context():
+        monkeypatch.setattr(flask_app._get_writer(), "on_commit", lambda size, seconds: batches.append(size))
+
+    def create(index):
+        with flask_app.app.test_client() as other:
+            other.set_cookie("session", session_cookie)
+            return other.post("/api/recipes", json={"title": f"並行{index}"}).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(create, range(16)))
+    assert statuses == [201] * 16
+    assert sum(batches) == 16
+    listed = client.get("/api/recipes", query_string={"limit": 50}).get_json()
+    assert len(listed["recipes"]) == 16
+
+    # 読み取り側の接続では書き込めない
+    with flask_app.app.test_request_context():
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            flask_app.get_db().execute("delete from recipe")
@@ -0,0 +1,173 @@
+"""
+実行例: pytest -q
+概要: ASGIエントリポイント経由でも /api/* の挙動が同期版と同じであることを、test_api のシナリオを流用して検証する。
+"""
+
+import asyncio
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+for path in (ROOT_DIR, ROOT_DIR / "tests"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import pytest
+from werkzeug.test import Client
+
+import asgi
+from test_api import (  # noqa: F401  同じテストをASGI経由のクライアントで再実行する
+    SCHEMA_SQL,
+    flask_app,
+    test_batch_operations,
+    test_bulk_import_and_export,
+    test_login_rate_limit_rejects_before_lookup,
+    test_recipe_list_projection_and_compression,
+    test_recipes_conditional_get,
+    test_recipes_crud_flow,
+    test_recipes_flow_requires_auth,
+    test_recipes_keyset_pagination,
+    test_recipes_stream_mode,
+    test_signup_requires_invite,
+)
+
+
+class AsgiAsWsgi:
+    """werkzeug のテストクライアントから ASGI アプリを1リクエストずつ呼び出す。"""
+
+    def __init__(self, asgi_app) -> None:
+        self.asgi_app = asgi_app
+
+    def __call__(self, environ, start_response):
+        headers = [
+            (key[5:].replace("_", "-").lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in environ.items()
+            if key.startswith("HTTP_")
+        ]
+        if environ.get("CONTENT_TYPE"):
+            headers.append((b"content-type", environ["CONTENT_TYPE"].encode("latin-1")))
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": environ["REQUEST_METHOD"],
+            "scheme": environ["wsgi.url_scheme"],
+            "path": environ["PATH_INFO"].encode("latin-1").decode("utf-8"),
+            "root_path": "",
+            "query_string": environ["QUERY_STRING"].encode("latin-1"),
+            "headers": headers,
+            "client": (environ.get("REMOTE_ADDR", "127.0.0.1"), 50000),
+            "server": (environ["SERVER_NAME"], int(environ["SERVER_PORT"])),
+        }
+        body = environ["wsgi.input"].read()
+        messages = asyncio.run(_call(self.asgi_app, scope, [body]))
+        start = messages[0]
+        start_response(
+            str(start["status"]),
+            [(name.decode("latin-1"), value.decode("latin-1")) for name, value in start["headers"]],
+        )
+        return [message["body"] for message in messages[1:]]
+
+
+async def _call(asgi_app, scope, chunks, disconnect_after: int | None = None):
+    incoming = [
+        {"type": "http.request", "body": chunk, "more_body": idx < len(chunks) - 1}
+        for idx, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0) if incoming else {"type": "http.disconnect"}
+
+    async def send(message):
+        if disconnect_after is not None and len(sent) >= disconnect_after:
+            raise OSError("client disconnected")
+        sent.append(message)
+
+    try:
+        await asgi_app(scope, receive, send)
+    except OSError:
+        if disconnect_after is None:
+            raise
+    return sent
+
+
+@pytest.fixture
+def client(tmp_path):
+    db_path = tmp_path / "test.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA_SQL)
+    conn.close()
+    flask_app.app.config.update(TESTING=True, DATABASE=str(db_path))
+    yield Client(AsgiAsWsgi(asgi.app))
+
+
+def test_streaming_disconnect_releases_connection(client):
+    from test_api import _create_recipes, _signup_and_login
+
+    _signup_and_login(client)
+    _create_recipes(client, 5)
+    bridge = asgi.AsgiBridge(flask_app.app, threads=2, chunk_size=1)
+    cookie = client.get_cookie("session").value
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/recipes",
+        "query_string": b"stream=1",
+        "headers": [(b"cookie", f"session={cookie}".encode())],
+    }
+    sent = asyncio.run(_call(bridge, scope, [b""], disconnect_after=2))
+    assert sent[0]["status"] == 200
+    assert sent[1]["more_body"] is True
+
+    # 切断後にジェネレータが閉じられ、専用に借りた接続がプールへ戻っている
+    with flask_app.app.app_context():
+        pool = flask_app._get_pool()
+    assert pool._slots._value == pool.size
+
+
+def test_lifespan_shutdown():
+    events = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return events.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app({"type": "lifespan"}, receive, send))
+    assert [message["type"] for message in sent] == [
+        "lifespan.startup.complete",
+        "lifespan.shutdown.complete",
+    ]
+
+
+def test_oversized_body_is_rejected_while_receiving(client):
+    received = []
+    bridge = asgi.AsgiBridge(flask_app.app, threads=1, body_limit=lambda path: 10 if path == "/api/login" else None)
+
+    async def call(headers, chunks):
+        incoming = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+        sent = []
+
+        async def receive():
+            message = incoming.pop(0) if incoming else {"type": "http.disconnect"}
+            received.append(message)
+            return message
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/api/login", "query_string": b"", "headers": headers}
+        await bridge(scope, receive, send)
+        return sent
+
+    # Content-Length が上限を超えていれば本文を1バイトも受け取らない
+    sent = asyncio.run(call([(b"content-length", b"11")], [b"x" * 11]))
+    assert sent[0]["status"] == 413 and received == []
+    # 長さが無い（chunked）要求は受け取った量が上限を超えた時点で打ち切る
+    sent = asyncio.run(call([], [b"x" * 6, b"x" * 6, b"x" * 6]))
+    assert sent[0]["status"] == 413 and len(received) == 2
+    assert asgi.app.body_limit is flask_app.request_body_limit
+    assert flask_app.request_body_limit("/api/recipes/bulk") == flask_app.BULK_MAX_BYTES
@@ -0,0 +1,55 @@
+"""
+実行例: pytest -q
+概要: ベンチマークスクリプトが小さな件数で最後まで動き、比較用のJSONを出力できることを確認する。
+"""
+
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+for path in (ROOT_DIR, ROOT_DIR / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from flask import Config
+
+import bench_api
+
+
+def test_bench_flask_client_smoke(tmp_path, monkeypatch):
+    # ベンチはアプリ設定(DATABASE等)を書き換えるため、他のテストへ持ち越さない
+    app = bench_api.flask_app.app
+    monkeypatch.setattr(app, "config", Config(app.root_path, app.config))
+    output = tmp_path / "bench.json"
+    bench_api.main([
+        "--mode", "flask_client",
+        "--users", "2",
+        "--recipes", "30",
+        "--requests", "6",
+        "--concurrency", "2",
+        "--password-hash-method", "pbkdf2:sha256:1000",
+        "--db", str(tmp_path / "seed.db"),
+        "--output", str(output),
+    ])
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    results = report["results"]["flask_client"]
+    assert set(results) == set(bench_api.PHASES)
+    for phase, stats in results.items():
+        assert stats["errors"] == 0, phase
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+        assert stats["peak_rss_kib"] > 0
+    assert report["meta"]["params"]["recipes"] == 30
+
+
+def test_compare_modes_reports_ratios():
+    phase = {"p95_ms": 10.0, "throughput_rps": 100.0}
+    results = {
+        "gunicorn": {"list": phase},
+        "asgi": {"list": {"p95_ms": 5.0, "throughput_rps": 150.0}},
+    }
+    assert bench_api.compare_modes(results) == {
+        "asgi_vs_gunicorn": {"list": {"p95_ratio": 0.5, "throughput_ratio": 1.5}}
+    }
+    assert bench_api.compare_modes({"gunicorn": {"list": phase}, "asgi": {"skipped": "x"}}) is None
@@ -0,0 +1,84 @@
+"""
+実行例: pytest -q
+概要: SQLite接続プールが接続を再利用し、上限と接続ごとのPRAGMA設定を守ること、書き込み役がまとめてコミットすることを検証する。
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool, GroupCommitWriter, PoolTimeout
+
+
+def test_pool_reuses_connections_with_pragmas(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    pool.close()
+
+
+def test_pool_is_bounded_and_rolls_back_on_release(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+    conn = pool.acquire()
+    conn.execute("create table t (v integer)")
+    conn.execute("insert into t values (1)")
+    assert conn.in_transaction
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    pool.release(conn)
+    again = pool.acquire()
+    assert again.execute("select count(*) from t").fetchone()[0] == 0
+    pool.release(again)
+    pool.close()
+
+
+def test_writer_groups_queued_writes_into_one_commit(tmp_path):
+    path = str(tmp_path / "writer.db")
+    batches = []
+    writer = GroupCommitWriter(path, on_commit=lambda size, seconds: batches.append(size))
+    writer.run(lambda conn: conn.execute("create table t (v integer unique)"))
+
+    # 先頭の書き込みを止めている間に届いた分は、次のまとまりとして1回でコミットされる
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(conn):
+        started.set()
+        release.wait(5)
+
+    first = writer.submit(blocker)
+    assert started.wait(5)
+    futures = [writer.submit(lambda conn, v=v: conn.execute("insert into t values (?)", [v]).lastrowid)
+               for v in (1, 2, 1, 3)]
+    release.set()
+    first.result(5)
+
+    assert [future.result(5) for future in (futures[0], futures[1], futures[3])] == [1, 2, 3]
+    # 失敗した書き込みだけが取り消され、同じまとまりの他の書き込みは残る
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result(5)
+    assert batches == [1, 1, 4]
+
+    reader = ConnectionPool(path, size=1, pragmas={}, read_only=True)
+    conn = reader.acquire()
+    assert [row[0] for row in conn.execute("select v from t order by v")] == [1, 2, 3]
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        conn.execute("insert into t values (4)")
+    reader.release(conn)
+    reader.close()
+    writer.close()
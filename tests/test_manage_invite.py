@@ -8,6 +8,8 @@ import sqlite3
 from types import SimpleNamespace
 from contextlib import closing
 
+import pytest
+
 
 def _reload_manage_invite(monkeypatch, db_path):
     monkeypatch.setenv("DATABASE", str(db_path))
@@ -62,5 +64,178 @@ def test_set_user_role(tmp_path, monkeypatch):
     mod.set_user_role(SimpleNamespace(userid="bob", role="admin"))
 
     with sqlite3.connect(db_path) as conn:
-        role = conn.execute("SELECT role FROM user WHERE userid = 'bob'").fetchone()[0]
+        role, epoch = conn.execute("SELECT role, auth_epoch FROM user WHERE userid = 'bob'").fetchone()
         assert role == "admin"
+        # 旧ロールを載せたセッションを無効にするため認証エポックが進む
+        assert epoch == 1
+
+
+def test_backup_rotation_and_restore(tmp_path, monkeypatch):
+    db_path = tmp_path / "recipe_memo.db"
+    mod = _reload_manage_invite(monkeypatch, db_path)
+    mod.add_invite(SimpleNamespace(userid="alice", email=None, role="member", reactivate=False))
+    backup_dir = tmp_path / "backups"
+
+    for _ in range(3):
+        mod.backup_database(
+            SimpleNamespace(dir=str(backup_dir), compress=True, keep=2, pages=1, sleep=0.0)
+        )
+    snapshots = sorted(backup_dir.iterdir())
+    assert len(snapshots) == 2
+    assert all(path.name.startswith("recipe_memo-") and path.name.endswith(".db.gz") for path in snapshots)
+
+    restored = tmp_path / "restored.db"
+    restore_args = dict(file=str(snapshots[-1]), target=str(restored), pages=1, sleep=0.0)
+    mod.restore_database(SimpleNamespace(verify_only=True, force=False, **restore_args))
+    assert not restored.exists()
+    mod.restore_database(SimpleNamespace(verify_only=False, force=False, **restore_args))
+    with closing(sqlite3.connect(restored)) as conn:
+        assert conn.execute("SELECT userid FROM allowed_users").fetchall() == [("alice",)]
+
+    # 既存の復元先は --force なしでは上書きしない
+    with pytest.raises(SystemExit, match="--force"):
+        mod.restore_database(SimpleNamespace(verify_only=False, force=False, **restore_args))
+
+
+def test_restore_moves_change_sequence_forward(tmp_path, monkeypatch):
+    import app as flask_app
+
+    db_path = tmp_path / "recipe_memo.db"
+    mod = _reload_manage_invite(monkeypatch, db_path)
+    with closing(mod.connect()) as conn:
+        flask_app.import_recipes(conn, enumerate([{"title": "親子丼"}], start=1))
+        conn.execute("INSERT INTO user (userid, password) VALUES ('alice', 'x')")
+        conn.commit()
+    mod.backup_database(SimpleNamespace(dir=str(tmp_path / "backups"), compress=False, keep=0, pages=1, sleep=0.0))
+    snapshot = next((tmp_path / "backups").iterdir())
+
+    # バックアップ後の書き込みで、稼働中のDBの変更番号は先へ進んでいる
+    with closing(mod.connect()) as conn:
+        flask_app.import_recipes(conn, enumerate([{"title": "牛丼"}, {"title": "カレー"}], start=1))
+        conn.execute("UPDATE user SET auth_epoch = 4")
+        conn.commit()
+        live_seq = conn.execute("SELECT seq FROM table_change WHERE name = 'recipe'").fetchone()[0]
+
+    mod.restore_database(SimpleNamespace(file=str(snapshot), target=None, verify_only=False, force=True))
+    with closing(sqlite3.connect(db_path)) as conn:
+        seq = conn.execute("SELECT seq FROM table_change WHERE name = 'recipe'").fetchone()[0]
+        assert seq == live_seq + 1
+        assert conn.execute("SELECT title, change_seq FROM recipe").fetchall() == [("親子丼", seq)]
+        # 復元前にだけあったレシピは削除記録として配信される
+        assert conn.execute("SELECT recipe_id, change_seq FROM recipe_tombstone ORDER BY recipe_id").fetchall() == [
+            (2, seq), (3, seq),
+        ]
+        assert conn.execute("SELECT auth_epoch FROM user").fetchone()[0] == 5
+    assert (tmp_path / "recipe_memo.db-cache-generation").exists()
+
+
+def test_restore_migrates_old_schema_and_rejects_newer(tmp_path, monkeypatch):
+    import app as flask_app
+
+    mod = _reload_manage_invite(monkeypatch, tmp_path / "recipe_memo.db")
+    legacy = tmp_path / "legacy.db"
+    with closing(sqlite3.connect(legacy)) as conn:
+        conn.execute("CREATE TABLE recipe (id integer primary key autoincrement, title text not null)")
+        conn.execute("INSERT INTO recipe (title) VALUES ('親子丼')")
+        conn.commit()
+    mod.restore_database(SimpleNamespace(file=str(legacy), target=None, verify_only=False, force=True))
+    with closing(sqlite3.connect(tmp_path / "recipe_memo.db")) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == flask_app.SCHEMA_VERSION
+        assert conn.execute("SELECT title, household FROM recipe").fetchall() == [("親子丼", "default")]
+    # 元のバックアップファイルは書き換えない
+    with closing(sqlite3.connect(legacy)) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+    newer = tmp_path / "newer.db"
+    with closing(sqlite3.connect(newer)) as conn:
+        conn.execute(f"PRAGMA user_version = {flask_app.SCHEMA_VERSION + 1}")
+    with pytest.raises(SystemExit, match="新しい"):
+        mod.restore_database(SimpleNamespace(file=str(newer), target=None, verify_only=False, force=True))
+
+
+def test_online_copy_gives_up_incremental_steps_under_writes(tmp_path):
+    import manage_invite
+
+    source = tmp_path / "busy.db"
+    writer = sqlite3.connect(source)
+    writer.execute("PRAGMA journal_mode = WAL")
+    writer.execute("CREATE TABLE t (v text)")
+    writer.executemany("INSERT INTO t VALUES (?)", [("x" * 500, )] * 2000)
+    writer.commit()
+
+    class BusySource:
+        # 1ステップごとに別の接続が書き込み、バックアップが先頭からやり直しになる状況を作る
+        def __init__(self, conn):
+            self.conn = conn
+
+        def backup(self, target, pages, progress=None, sleep=0.0):
+            def busy_progress(status, remaining, total):
+                writer.execute("INSERT INTO t VALUES ('y')")
+                writer.commit()
+                if progress is not None:
+                    progress(status, remaining, total)
+            self.conn.backup(target, pages=pages, progress=busy_progress, sleep=sleep)
+
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(tmp_path / "copy.db")) as dst:
+        restarts = manage_invite._copy_online(BusySource(src), dst, pages=64, sleep=0.0, max_restarts=2)
+        assert restarts == 3
+        assert dst.execute("SELECT count(*) FROM t").fetchone()[0] >= 2000
+    writer.close()
+
+
+def test_restore_rejects_corrupt_snapshot(tmp_path, monkeypatch):
+    mod = _reload_manage_invite(monkeypatch, tmp_path / "recipe_memo.db")
+    broken = tmp_path / "broken.db"
+    broken.write_bytes(b"not a database" * 100)
+    with pytest.raises(SystemExit, match=r"^\[ERROR\]"):
+        mod.restore_database(
+            SimpleNamespace(file=str(broken), target=None, verify_only=True, force=False, pages=1, sleep=0.0)
+        )
+
+
+def test_bulk_add_invites_from_csv_and_ndjson(tmp_path, monkeypatch, capsys):
+    db_path = tmp_path / "manage.db"
+    mod = _reload_manage_invite(monkeypatch, db_path)
+    mod.add_invite(SimpleNamespace(userid="alice", email=None, role="member", reactivate=False))
+    mod.deactivate_invite(SimpleNamespace(userid="alice"))
+    capsys.readouterr()
+
+    source = tmp_path / "invites.csv"
+    source.write_text(
+        "userid,email,role,household\n"
+        "alice,alice@example.com,admin,tanaka\n"
+        "bob,,,\n"
+        ",nobody@example.com,,\n"
+        "bob,dup@example.com,,\n",
+        encoding="utf-8",
+    )
+    options = {"file": str(source), "role": "member", "household": "tanaka"}
+
+    mod.bulk_add_invites(SimpleNamespace(**options, reactivate=True, dry_run=True))
+    out = capsys.readouterr().out
+    assert "[WARN] 4行目: userid がありません" in out
+    assert "[WARN] 5行目: userid 'bob' が重複しています" in out
+    assert "+ bob (role=member, household=tanaka)" in out
+    assert "~ alice (email: None -> alice@example.com, role: member -> admin, household: None -> tanaka, is_active: 0 -> 1)" in out
+    assert "新規 1件 / 再招待 1件 / 既存のためスキップ 0件 / エラー 2件" in out
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM allowed_users").fetchone()[0] == 1
+
+    mod.bulk_add_invites(SimpleNamespace(**options, reactivate=False, dry_run=False))
+    assert "[OK] 新規 1件 / 再招待 0件 / 既存のためスキップ 1件" in capsys.readouterr().out
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT userid, role, household, is_active FROM allowed_users ORDER BY userid").fetchall()
+    assert rows == [("alice", "member", None, 0), ("bob", "member", "tanaka", 1)]
+
+    ndjson = tmp_path / "invites.ndjson"
+    ndjson.write_text(
+        '{"userid": "alice", "role": "admin"}\n\n{"userid": "carol", "email": "carol@example.com"}\nnot json\n',
+        encoding="utf-8",
+    )
+    mod.bulk_add_invites(SimpleNamespace(file=str(ndjson), role="member", household=None, reactivate=True, dry_run=False))
+    out = capsys.readouterr().out
+    assert "[WARN] 4行目: JSONとして読めません" in out
+    assert "[OK] 新規 1件 / 再招待 1件 / 既存のためスキップ 0件 / エラー 1件" in out
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT userid, role, is_active FROM allowed_users ORDER BY userid").fetchall()
+    assert rows == [("alice", "admin", 1), ("bob", "member", 1), ("carol", "member", 1)]
@@ -0,0 +1,70 @@
+"""
+実行例: pytest -q
+概要: manage_recipes CLIのレシピ一括取り込み・書き出しがSQLiteデータベースに反映されることを検証する。
+"""
+
+import importlib
+import json
+import sqlite3
+from types import SimpleNamespace
+
+
+def _reload_manage_recipes(monkeypatch, db_path):
+    monkeypatch.setenv("DATABASE", str(db_path))
+    if "manage_recipes" in list(importlib.sys.modules):
+        del importlib.sys.modules["manage_recipes"]
+    return importlib.import_module("manage_recipes")
+
+
+def test_import_and_export_round_trip(tmp_path, monkeypatch, capsys):
+    db_path = tmp_path / "recipes.db"
+    mod = _reload_manage_recipes(monkeypatch, db_path)
+
+    source = tmp_path / "archive.json"
+    source.write_text(
+        json.dumps([{"title": "親子丼", "ingredients": "鶏肉 / 卵"}, {"notes": "タイトル無し"}, {"title": "牛丼"}], ensure_ascii=False),
+        encoding="utf-8",
+    )
+    mod.import_command(SimpleNamespace(file=str(source), chunk_size=1))
+    out = capsys.readouterr().out
+    assert "[WARN] 2行目: title is required" in out
+    assert "[OK] 2件を登録しました" in out
+
+    with sqlite3.connect(db_path) as conn:
+        titles = [row[0] for row in conn.execute("SELECT title FROM recipe ORDER BY id")]
+    assert titles == ["親子丼", "牛丼"]
+    # 稼働中のアプリのキャッシュを捨てさせるため、DBの隣の世代ファイルを差し替える
+    assert (tmp_path / "recipes.db-cache-generation").exists()
+
+    exported = tmp_path / "export.ndjson"
+    mod.export_command(SimpleNamespace(file=str(exported)))
+    records = [json.loads(line) for line in exported.read_text(encoding="utf-8").splitlines()]
+    assert [r["title"] for r in records] == ["親子丼", "牛丼"]
+
+    # 書き出したNDJSONをそのまま別DBへ取り込める
+    other = _reload_manage_recipes(monkeypatch, tmp_path / "other.db")
+    other.import_command(SimpleNamespace(file=str(exported), chunk_size=None))
+    with sqlite3.connect(tmp_path / "other.db") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM recipe").fetchone()[0] == 2
+
+
+def test_sweep_photos_keeps_referenced_files(tmp_path, monkeypatch, capsys):
+    import io
+    import os
+
+    from photo_store import PhotoStore
+
+    db_path = tmp_path / "recipes.db"
+    mod = _reload_manage_recipes(monkeypatch, db_path)
+    store = PhotoStore(str(tmp_path / "media"), workers=0)
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(64))
+    used, unused = store.save(io.BytesIO(png)), store.save(io.BytesIO(png + b"\x00"))
+    for name in (used, unused):
+        os.utime(store.original_path(name), (0, 0))
+    with mod.connect() as conn:
+        conn.execute("insert into recipe (title, updated_at, photo) values ('親子丼', '2026-01-01', ?)", [used])
+
+    mod.sweep_photos_command(SimpleNamespace(photo_dir=str(tmp_path / "media"), grace=3600))
+    assert "[OK] 参照されていない写真を1件削除しました" in capsys.readouterr().out
+    assert store.original_path(used) is not None
+    assert store.original_path(unused) is None
@@ -0,0 +1,46 @@
+"""
+実行例: pytest -q
+概要: メトリクスのテキスト形式出力とSQL計測付き接続の動作を検証する。
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from metrics import InstrumentedConnection, QueryObserver, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.histogram("demo_seconds", "Demo latency.", buckets=(0.1, 1.0))
+    hist.observe(0.05, route="/a")
+    hist.observe(0.5, route="/a")
+    hist.observe(5, route="/a")
+    registry.counter("demo_total", "Demo counter.").inc(route='/"b"')
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{route="/a"} 3' in text
+    assert 'demo_total{route="/\\"b\\""} 1' in text
+
+
+def test_instrumented_connection_records_queries(caplog):
+    registry = Registry()
+    observer = QueryObserver(registry, slow_threshold=0.0)
+    conn = sqlite3.connect(":memory:", factory=InstrumentedConnection)
+    conn.observer = observer
+    conn.execute("create table t (v integer)")
+    conn.executemany("insert into t values (?)", [(1,), (2,)])
+    assert conn.execute("select count(*) from t").fetchone()[0] == 2
+
+    assert observer.queries.value(statement="select") == 1
+    assert observer.queries.value(statement="insert") == 1
+    assert observer.duration.count(statement="create") == 1
+    assert "slow query" in caplog.text
@@ -0,0 +1,46 @@
+"""
+実行例: pytest -q
+概要: パスワードハッシュサービスのプロセスプール実行・混雑時の拒否・再ハッシュ判定を検証する。
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import pytest
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash
+
+from password_hasher import HasherBusy, PasswordHasher, normalize_method
+
+
+def test_hash_and_verify_in_process_pool():
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1)
+    try:
+        pwhash = hasher.hash("secret")
+        assert pwhash.startswith("pbkdf2:sha256:1000$")
+        assert hasher.verify(pwhash, "secret")
+        assert not hasher.verify(pwhash, "wrong")
+        # スレッドを持つ親プロセスを fork しない
+        assert hasher._get_executor()._mp_context.get_start_method() != "fork"
+    finally:
+        hasher.shutdown()
+
+
+def test_rejects_when_queue_is_full():
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=0, max_pending=1)
+    hasher._slots.acquire()
+    with pytest.raises(HasherBusy):
+        hasher.hash("secret")
+    hasher._slots.release()
+    assert hasher.hash("secret")
+
+
+def test_needs_rehash_compares_normalized_method():
+    assert normalize_method("pbkdf2:sha256") == f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+    hasher = PasswordHasher("pbkdf2:sha256:2000", workers=0)
+    assert hasher.needs_rehash(generate_password_hash("x", "pbkdf2:sha256:1000"))
+    assert not hasher.needs_rehash(generate_password_hash("x", "pbkdf2:sha256:2000"))
+    assert hasher.needs_rehash(generate_password_hash("x", "scrypt"))
@@ -0,0 +1,107 @@
+"""
+実行例: pytest -q
+概要: 写真が内容のハッシュ名で重複なく保存され、サムネイルがワーカープールで生成されることを検証する。
+"""
+
+import io
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import pytest
+
+import photo_store
+from photo_store import PhotoStore, PhotoTooLarge, UnsupportedPhoto
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+
+
+def test_save_is_content_addressed_and_validated(tmp_path):
+    store = PhotoStore(str(tmp_path), max_bytes=1024, workers=0)
+    name = store.save(io.BytesIO(PNG))
+    assert name.endswith(".png") and len(name) == 64 + 4
+    assert store.save(io.BytesIO(PNG)) == name
+    assert os.listdir(tmp_path / "originals" / name[:2]) == [name]
+    assert os.listdir(tmp_path / "tmp") == []
+    assert store.original_path("../" + name) is None
+
+    with pytest.raises(UnsupportedPhoto):
+        store.save(io.BytesIO(b"<svg></svg>"))
+    with pytest.raises(PhotoTooLarge):
+        store.save(io.BytesIO(b"\xff\xd8\xff" + b"\x00" * 2048))
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_discard_removes_only_files_this_put_created(tmp_path):
+    store = PhotoStore(str(tmp_path), workers=0)
+    saved = store.put(io.BytesIO(PNG))
+    assert saved.created_ns is not None
+    # 同じ内容を put した側は既存のファイルを共有するだけなので消さない
+    shared = store.put(io.BytesIO(PNG))
+    assert shared.created_ns is None and not store.discard(shared)
+    # 後から put されて mtime が進んでいれば、最初に置いた側の discard でも残す
+    os.utime(store.original_path(saved.name), ns=(saved.created_ns + 10**9, saved.created_ns + 10**9))
+    assert not store.discard(saved)
+    assert store.original_path(saved.name) is not None
+
+    fresh = store.put(io.BytesIO(PNG + b"\x01"))
+    assert store.discard(fresh)
+    assert store.original_path(fresh.name) is None
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_sweep_removes_unreferenced_old_files(tmp_path):
+    store = PhotoStore(str(tmp_path), workers=0)
+    kept, orphan, recent = (store.save(io.BytesIO(PNG + bytes([i]))) for i in range(3))
+    old = time.time() - 7200
+    for name in (kept, orphan):
+        os.utime(store.original_path(name), (old, old))
+    thumbs = [tmp_path / "thumbs" / name[:2] / (name.split(".")[0] + ".jpg") for name in (kept, orphan)]
+    for thumb in thumbs:
+        thumb.parent.mkdir(parents=True, exist_ok=True)
+        thumb.write_bytes(b"jpg")
+        os.utime(thumb, (old, old))
+    stale = tmp_path / "tmp" / "crashed.partial"
+    stale.write_bytes(b"x")
+    os.utime(stale, (old, old))
+
+    assert store.sweep({kept}, grace=3600) == 1
+    assert store.original_path(orphan) is None and not thumbs[1].exists()
+    assert store.original_path(kept) is not None and thumbs[0].exists()
+    # 猶予内にアップロードされたものは、まだDBへの登録中かもしれないので残す
+    assert store.original_path(recent) is not None
+    assert not stale.exists()
+
+
+def test_thumbnails_are_generated_in_background(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_thumbnail(source, target, size, quality):
+        calls.append(size)
+        shutil.copyfile(source, target)
+
+    # Pillow の有無に関係なく、生成の受け付けと重複排除を確かめる
+    monkeypatch.setattr(photo_store, "Image", object())
+    monkeypatch.setattr(photo_store, "make_thumbnail", fake_thumbnail)
+    store = PhotoStore(str(tmp_path), workers=1, thumbnail_size=(64, 48))
+    name = store.save(io.BytesIO(PNG))
+    store.schedule_thumbnail(name)
+    store.wait()
+    assert store.thumbnail_path(name).endswith(".jpg")
+    assert calls == [(64, 48)]
+
+
+def test_make_thumbnail_with_pillow(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "photo.png"
+    Image.new("RGB", (800, 300), "orange").save(source)
+    target = tmp_path / "thumb.jpg"
+    photo_store.make_thumbnail(str(source), str(target), (320, 240), 80)
+    with Image.open(target) as thumbnail:
+        assert thumbnail.size == (320, 240) and thumbnail.format == "JPEG"
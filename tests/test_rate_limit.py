@@ -0,0 +1,90 @@
+"""
+実行例: pytest -q
+概要: ログイン制限のトークンバケット・段階的ロックアウト・SQLiteによるワーカー間共有を検証する。
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from rate_limit import MemoryStore, RateLimiter, SQLiteStore
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = RateLimiter(capacity=2, refill_per_second=0.5, clock=clock)
+
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 2.0
+    assert limiter.acquire("b") == 0
+
+    clock.now += 2
+    assert limiter.acquire("a") == 0
+
+
+def test_progressive_lockout_and_reset():
+    clock = FakeClock()
+    limiter = RateLimiter(capacity=100, refill_per_second=1, lockout_after=2, lockout_base=1, clock=clock)
+
+    assert limiter.failure("u") == 0
+    assert limiter.failure("u") == 1
+    assert limiter.acquire("u") == 1
+    clock.now += 1
+    assert limiter.failure("u") == 2
+    assert limiter.failure("u") == 4
+
+    limiter.success("u")
+    assert limiter.acquire("u") == 0
+
+
+def test_failures_are_forgotten_after_idle_period():
+    clock = FakeClock()
+    limiter = RateLimiter(capacity=100, refill_per_second=1, lockout_after=5, lockout_max=900, clock=clock)
+
+    # 1週間おきの打ち間違いは積み重ならない
+    for _ in range(10):
+        assert limiter.failure("ip") == 0
+        clock.now += 7 * 86400
+
+    for _ in range(4):
+        limiter.failure("ip")
+    assert limiter.failure("ip") == 1
+    # ロック中・TTL内は回数を保持する
+    clock.now += 60
+    assert limiter.failure("ip") == 2
+    clock.now += 900
+    assert limiter.failure("ip") == 0
+
+
+def test_memory_store_evicts_least_recent_keys():
+    store = MemoryStore(maxsize=2)
+    limiter = RateLimiter(capacity=1, refill_per_second=0.001, store=store, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        limiter.acquire(key)
+
+    assert len(store) == 2
+    assert limiter.acquire("c") > 0
+    assert limiter.acquire("a") == 0
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "login-limit.db")
+    clock = FakeClock()
+    worker_a = RateLimiter(capacity=2, refill_per_second=0.01, store=SQLiteStore(path), prefix="ip:", clock=clock)
+    worker_b = RateLimiter(capacity=2, refill_per_second=0.01, store=SQLiteStore(path), prefix="ip:", clock=clock)
+
+    assert worker_a.acquire("10.0.0.1") == 0
+    assert worker_b.acquire("10.0.0.1") == 0
+    assert worker_a.acquire("10.0.0.1") > 0
@@ -0,0 +1,64 @@
+"""
+実行例: pytest -q
+概要: レシピキャッシュのLRU追い出し・ヒット率計測・世代ファイルによるワーカー間無効化を検証する。
+"""
+
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from recipe_cache import FileGeneration, LRUCache, RecipeCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_file_generation_shares_invalidation(tmp_path):
+    shared = str(tmp_path / "recipe-cache.gen")
+    worker_a = RecipeCache(generation=FileGeneration(shared))
+    worker_b = RecipeCache(generation=FileGeneration(shared))
+
+    worker_b.put_recipe(1, {"id": 1, "title": "旧"})
+    worker_b.put_list("all", b"[]")
+    assert worker_b.get_recipe(1) == {"id": 1, "title": "旧"}
+
+    worker_a.invalidate(1)
+
+    assert worker_b.get_recipe(1) is None
+    assert worker_b.get_list("all") is None
+
+
+def test_file_generation_does_not_repeat_with_coarse_timestamps(tmp_path):
+    shared = tmp_path / "recipe-cache.gen"
+    generation = FileGeneration(str(shared))
+    worker = RecipeCache(generation=FileGeneration(str(shared)))
+    worker.put_recipe(1, {"id": 1})
+    seen = {generation.current()}
+    for _ in range(3):
+        generation.bump()
+        # 同じ時刻刻みの間に差し替えが続いた場合を再現する
+        os.utime(shared, ns=(0, 0))
+        assert generation.current() not in seen
+        seen.add(generation.current())
+    assert worker.get_recipe(1) is None
+
+
+def test_put_skipped_when_invalidated_during_read():
+    cache = RecipeCache()
+    epoch = cache.epoch()
+    cache.invalidate(1)
+    cache.put_recipe(1, {"id": 1}, epoch)
+    assert cache.get_recipe(1) is None
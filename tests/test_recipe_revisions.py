@@ -0,0 +1,35 @@
+"""
+実行例: pytest -q
+概要: レシピの版差分が行単位で作成・適用でき、圧縮して往復できることを検証する。
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from recipe_revisions import apply_delta, decode_revision, encode_revision, make_delta
+
+
+def test_delta_round_trip_keeps_only_changed_lines():
+    steps = "".join(f"{n}. 手順{n}の説明文。\n" for n in range(1, 40))
+    old = {"title": "肉じゃが", "ingredients": "じゃがいも", "steps": steps, "notes": "", "tags": ["和食"]}
+    new = dict(old, steps=steps.replace("手順20の", "手順20を直した"), notes="弱火で", tags=["和食", "煮物"])
+
+    delta = make_delta(old, new)
+    assert set(delta) == {"steps", "notes", "tags"}
+    assert delta["steps"] == [[19, 20, "20. 手順20を直した説明文。\n"]]
+    assert apply_delta(old, delta) == new
+    assert make_delta(old, old) == {}
+
+    encoded = encode_revision(delta)
+    assert decode_revision(encoded) == delta
+    assert len(encoded) < len(encode_revision(new))
+
+
+def test_delta_handles_missing_trailing_newline():
+    old = {"steps": "切る\n焼く"}
+    new = {"steps": "切る\n煮る\n焼く\n"}
+    assert apply_delta(old, make_delta(old, new))["steps"] == new["steps"]